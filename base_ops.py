@@ -1,28 +1,72 @@
+import atexit
+import collections
+import contextlib
 import json
-# import os
+import os
 import re
 # import string
 # import sys
 # import _thread
-import time
 # import unicodedata
 import urllib
-import urllib.request
 import urllib.parse
 import datetime
-import dateparser
+import functools
+import itertools
 
 import pywikibot
-from pywikibot import pagegenerators
 
 # file imports
+import cassette
+import date_normalizer
+import http_client
+import label_resolver
+import plan
 import search_patterns
-
-enwp = pywikibot.Site('en', 'wikipedia')
-enwd = pywikibot.Site('wikidata', 'wikidata')
-repo = enwd.data_repository()
-encommons = pywikibot.Site('commons', 'commons')
-globe_item = pywikibot.ItemPage(repo, 'Q2')
+import template_parser
+import tracing
+import wikidata_dump
+import wikipedia_dump
+import write_scheduler
+
+# record/replay of the run's traffic when $WMF_CASSETTE is set
+cassette.installFromEnvironment()
+
+# sites, repository and globe item are built on first use and then shared:
+# creating them makes pywikibot load the site info, so importing base_ops stays cheap
+@functools.lru_cache(maxsize=None)
+def getEnwp():
+	return pywikibot.Site('en', 'wikipedia')
+
+@functools.lru_cache(maxsize=None)
+def getEnwd():
+	return pywikibot.Site('wikidata', 'wikidata')
+
+@functools.lru_cache(maxsize=None)
+def getRepo():
+	return getEnwd().data_repository()
+
+@functools.lru_cache(maxsize=None)
+def getCommons():
+	return pywikibot.Site('commons', 'commons')
+
+@functools.lru_cache(maxsize=None)
+def getGlobeItem():
+	return pywikibot.ItemPage(getRepo(), 'Q2')
+
+lazy_globals = {
+	'enwp': getEnwp,
+	'enwd': getEnwd,
+	'repo': getRepo,
+	'encommons': getCommons,
+	'globe_item': getGlobeItem,
+}
+
+def __getattr__(name):
+	""" base.enwp, base.repo, ... for the scripts, created on first access """
+	if name in lazy_globals:
+		return lazy_globals[name]()
+	raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 langs = { 
 	'en': 'Q328', 
@@ -31,25 +75,152 @@ langs = {
 	}
 
 # helper functions
-# from https://bitbucket.org/mikepeel/wikicode/src/master/wir_newpages.py
-def getURL(url='', retry=True, timeout=30):
-	raw = ''
-	req = urllib.request.Request(url, headers={ 'User-Agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:55.0) Gecko/20100101 Firefox/55.0' })
-	try:
-		raw = urllib.request.urlopen(req, timeout=timeout).read().strip().decode('utf-8')
-	except:
-		sleep = 10 # seconds
-		maxsleep = 100
-		while retry and sleep <= maxsleep:
-			print('Error while retrieving: %s' % (url))
-			print('Retry in %s seconds...' % (sleep))
-			time.sleep(sleep)
-			try:
-				raw = urllib.request.urlopen(req, timeout=timeout).read().strip().decode('utf-8')
-			except:
-				pass
-			sleep = sleep * 2
-	return raw
+def getURL(url='', retry=True, timeout=None):
+	""" Returns the contents of a url, fetched through the shared pooled session """
+	with tracing.span('getURL', url=url):
+		return http_client.getURL(url=url, retry=retry, timeout=timeout)
+
+def invalidateURL(url=''):
+	""" Drops the cached response of a url, e.g. a search made before creating an item """
+	http_client.invalidate(url=url)
+
+@tracing.traced()
+def searchLabel(label='', lang='en'):
+	"""
+	Searches Wd for items whose label is exactly `label` (disambiguation pages excluded)
+
+	@return value: list of QIDs
+
+	"""
+	searchitemurl = 'https://www.wikidata.org/w/api.php?action=wbsearchentities&search=%s&language=%s&format=xml' % (urllib.parse.quote(label), lang)
+	raw = getURL(searchitemurl)
+	if not raw:
+		# not cached by the resolver
+		raise IOError('No response for %s' % searchitemurl)
+
+	ids = list()
+	# check for valid search result
+	if not '<search />' in raw:
+		for itemfoundq in re.findall(r'id="(Q\d+)"', raw):
+			itemfound = pywikibot.ItemPage(getRepo(), itemfoundq)
+			item_dict = itemfound.get()
+
+			flag = 0
+			if 'P31' in itemfound.claims:
+				for claim in item_dict['claims']['P31']:
+					if claim.getTarget().title() == 'Q4167410':
+						print('Disambiguous page. Skipping...')
+						flag = 1
+						break
+			if flag:
+				continue
+
+			if lang in item_dict['labels'] and label.lower() == item_dict['labels'][lang].lower():
+				ids.append(itemfoundq)
+
+	return ids
+
+# labels of Wd items, shared by every WdPage - {(qid, lang): label}
+label_cache = label_resolver.LRUCache(maxsize=100000)
+
+def getLabels(qids='', lang='en'):
+	"""
+	Returns {qid: label} for the given items
+
+	Labels missing from label_cache are read from the local dump index
+	(wikidata_dump.py) if there is one, else fetched with wbgetentities, 50
+	items per request and labels only. Items without a label map to ''.
+
+	"""
+	missing = set(qid for qid in qids if (qid, lang) not in label_cache)
+
+	if missing:
+		# labels of the local dump index, if any (see wikidata_dump.py)
+		found = wikidata_dump.labels(missing, lang=lang)
+		for qid, label in found.items():
+			label_cache.put((qid, lang), label)
+		missing.difference_update(found)
+
+	missing = sorted(missing)
+	for i in range(0, len(missing), 50):
+		batch = missing[i:i + 50]
+		data = getRepo().simple_request(action='wbgetentities', ids='|'.join(batch), props='labels', languages=lang).submit()
+		entities = data.get('entities', dict())
+		for qid in batch:
+			labels = entities.get(qid, dict()).get('labels', dict())
+			label_cache.put((qid, lang), labels.get(lang, dict()).get('value', ''))
+
+	return dict((qid, label_cache.get((qid, lang), '')) for qid in qids)
+
+def getLabel(qid='', lang='en'):
+	""" Returns the label of a Wd item ('' if it has none) """
+	return getLabels([qid], lang=lang)[qid]
+
+# QIDs of enwiki articles, shared by every WdPage - {title: qid}, '' if there is no item
+sitelink_cache = label_resolver.LRUCache(maxsize=100000)
+
+def resolveTitles(titles='', batch=50):
+	"""
+	Returns {title: qid} for the given enwiki articles
+
+	Titles missing from sitelink_cache are looked up with the pages' wikibase_item
+	property, `batch` titles per request, following redirects. Articles
+	that do not exist or have no item map to ''. WdPage(page_name=...) of
+	a resolved title then needs no request of its own.
+
+	"""
+	missing = list()
+	for title in titles:
+		if title and title not in sitelink_cache and title not in missing:
+			missing.append(title)
+
+	# sitelinks of the local dump index, if any - redirects and titles it lacks go to the API
+	for title in list(missing):
+		qid = wikidata_dump.qidOf(title)
+		if qid:
+			sitelink_cache.put(title, qid)
+			missing.remove(title)
+
+	for i in range(0, len(missing), batch):
+		titles_batch = missing[i:i + batch]
+		with tracing.span('resolveTitles', titles=len(titles_batch)):
+			data = getEnwp().simple_request(action='query', prop='pageprops', ppprop='wikibase_item', redirects=True,
+											titles='|'.join(titles_batch)).submit()
+		query = data.get('query', dict())
+		normalized = dict((entry['from'], entry['to']) for entry in query.get('normalized', list()))
+		redirects = dict((entry['from'], entry['to']) for entry in query.get('redirects', list()))
+		pages = query.get('pages', dict())
+		if isinstance(pages, dict):
+			pages = pages.values()
+		items = dict((page.get('title'), page.get('pageprops', dict()).get('wikibase_item', '')) for page in pages)
+
+		for title in titles_batch:
+			target = normalized.get(title, title)
+			target = redirects.get(target, target)
+			qid = items.get(target, '')
+			sitelink_cache.put(title, qid)
+			if qid:
+				sitelink_cache.put(target, qid)
+
+	return dict((title, sitelink_cache.get(title, '')) for title in titles)
+
+label_resolver_instance = None
+
+def getLabelResolver():
+	"""
+	Returns the shared label -> QID resolver, persisted in the file named by
+	$WMF_LABEL_CACHE (default: label_resolver.DEFAULT_PATH; 'off' keeps it in memory only).
+	Its statistics are printed when the script exits
+
+	"""
+	global label_resolver_instance
+	if label_resolver_instance is None:
+		path = os.environ.get('WMF_LABEL_CACHE', label_resolver.DEFAULT_PATH)
+		if path.lower() == 'off':
+			path = ''
+		label_resolver_instance = label_resolver.LabelResolver(lookup=searchLabel, path=path)
+		atexit.register(label_resolver_instance.printStats)
+	return label_resolver_instance
 
 def get_precision(val):
 	# print(val)
@@ -116,11 +287,81 @@ def calc_coord(params):
 	# print(precision)
 	return lat, lon, precision
 
+def loadTextsFromDump(pages=''):
+	"""
+	Gives pywikibot pages the text of the local Wikipedia dump, if there is
+	one (see wikipedia_dump.py), reading the titles grouped by dump stream
+
+	@param pages: {title: pywikibot.Page}
+	@return value: the pages not in the dump, to be loaded from the API
+
+	"""
+	loaded = set()
+	for title, record in wikipedia_dump.records(pages.keys()):
+		# the layout of a query with prop=info|revisions, so pywikibot loads it as it does preloadpages
+		pagedict = {
+			'pageid': record.page_id,
+			'ns': record.ns,
+			'title': record.title,
+			'lastrevid': record.rev_id,
+			'contentmodel': 'wikitext',
+			'revisions': [{'revid': record.rev_id, 'parentid': record.parent_id, 'timestamp': record.timestamp,
+							'slots': {'main': {'contentmodel': 'wikitext', 'contentformat': 'text/x-wiki', '*': record.text}}}],
+		}
+		if record.redirect:
+			pagedict['redirect'] = ''
+		pywikibot.data.api.update_page(pages[title], pagedict, props=['info'])
+		if record.redirect:
+			# getRedirectTarget() then needs no request
+			pages[title]._redirtarget = pywikibot.Page(pages[title].site, record.redirect)
+		loaded.add(title)
+	return [page for title, page in pages.items() if title not in loaded]
+
+def preloadTexts(wp_pages='', batch=50):
+	"""
+	Loads the texts of WpPages in batched requests, following redirects (see
+	WpPage.preload); texts in the local Wikipedia dump are read from it
+
+	"""
+	site = getEnwp()
+	# one page per title: preloadpages loads only the first of duplicates
+	pages = collections.OrderedDict()
+	for wp_page in wp_pages:
+		if wp_page.page is not None:
+			pages.setdefault(wp_page.title, wp_page.page)
+	remaining = loadTextsFromDump(pages)
+	if remaining:
+		for page in site.preloadpages(remaining, groupsize=batch):
+			pass
+
+	targets = collections.OrderedDict()
+	for title, page in pages.items():
+		if page.exists() and page.isRedirectPage():
+			m = site.redirect_regex.match(page.text)
+			if m:
+				targets[title] = pywikibot.Page(site, m.group(1))
+			else:
+				targets[title] = page.getRedirectTarget()
+	if targets:
+		remaining = loadTextsFromDump(collections.OrderedDict((page.title(), page) for page in targets.values()))
+		if remaining:
+			for page in site.preloadpages(remaining, groupsize=batch):
+				pass
+
+	for wp_page in wp_pages:
+		if wp_page.page is None:
+			continue
+		page = targets.get(wp_page.title) or pages[wp_page.title]
+		wp_page.page = page
+		# a redirect may point to a section
+		wp_page.title = page.title(with_section=False)
+
 # deals with Wikipedia articles
 class WpPage:
 	"""
 	List of methods:
 
+	- preload (many pages at once)
 	- getWpContents
 	- printWpContents
 	- searchWpPage
@@ -129,12 +370,71 @@ class WpPage:
 
 	"""
 
-	def __init__(self, page_name=''):
+	def __init__(self, page_name='', from_dump=True):
+		"""
+		@param from_dump: read the text from the local Wikipedia dump if it
+					has the article (preload reads its batches itself)
+
+		"""
 		if page_name:
 			self.page_name = page_name
-			self.page = pywikibot.Page(enwp, page_name)
+			self.page = pywikibot.Page(getEnwp(), page_name)
 			self.title = self.page.title()
+			if from_dump:
+				loadTextsFromDump({self.title: self.page})
 
+	@classmethod
+	def preload(cls, titles='', batch=50, resolve_items=False):
+		"""
+		WpPages of many articles, their texts fetched `batch` titles per request
+		instead of one request per getWpContents
+
+		Texts in the local Wikipedia dump (wikipedia_dump.py) are read from
+		it, grouped by dump stream, and only the others are requested.
+		Redirects are followed: the WpPage keeps the requested title as
+		page_name and gets the target's page and title. Missing pages have
+		no text, as with WpPage(title). If a request fails, the WpPages of its
+		batch come back unloaded (getWpContents then fetches them one by one).
+
+		@param titles: titles of the articles (any iterable)
+		@param batch: titles per request (50 is the API limit for users)
+		@param resolve_items: also look up the QIDs of the articles' items
+					(resolveTitles), one more request per batch
+		@return value: generator of WpPages, one per title, in order
+
+		"""
+		titles = iter(titles)
+		while True:
+			chunk = list(itertools.islice(titles, batch))
+			if not chunk:
+				return
+			wp_pages = list()
+			for title in chunk:
+				try:
+					wp_pages.append(cls(title, from_dump=False))
+				except Exception as e:
+					# an invalid title is treated as a missing page
+					print('Invalid title %s: %s' % (title, e))
+					wp_page = cls()
+					wp_page.page_name = title
+					wp_page.page = None
+					wp_page.title = title
+					wp_pages.append(wp_page)
+			try:
+				with tracing.span('WpPage.preload', titles=len(chunk)):
+					preloadTexts(wp_pages=wp_pages, batch=batch)
+			except Exception as e:
+				print('Error preloading %d pages: %s' % (len(chunk), e))
+			if resolve_items:
+				try:
+					resolveTitles([wp_page.title for wp_page in wp_pages if wp_page.page is not None], batch=batch)
+				except Exception as e:
+					# WdPage falls back to one lookup per article
+					print('Error resolving the items of %d pages: %s' % (len(chunk), e))
+			for wp_page in wp_pages:
+				yield wp_page
+
+	@tracing.traced()
 	def getWpContents(self):
 		""" Returns contents of a Wikipedia page """
 		if self.page:
@@ -172,7 +472,7 @@ class WpPage:
 			q_values = re.findall(r'id="(Q\d+)"', raw)
 			for q_value in q_values:
 				# get page for each Qval in search result
-				itemfound = pywikibot.ItemPage(repo, q_value)
+				itemfound = pywikibot.ItemPage(getRepo(), q_value)
 				item_dict = itemfound.get()
 
 				flag = 0
@@ -197,11 +497,9 @@ class WpPage:
 
 					# property exists in the Wd page
 					if prop_id in itemfound.claims:
-						itemfound_values = []
-						for claim in item_dict['claims'][prop_id]:
-							prop_id_value = claim.getTarget()
-							prop_id_item_dict = prop_id_value.get()
-							itemfound_values.append(prop_id_item_dict['labels']['en'])
+						qids = [claim.getTarget().title() for claim in item_dict['claims'][prop_id]]
+						labels = getLabels(qids, lang='en')
+						itemfound_values = [labels[qid] for qid in qids]
 
 						itemfound_values = [itemfound_value.replace('\xa0',' ') for itemfound_value in itemfound_values]
 
@@ -227,13 +525,13 @@ class WpPage:
 
 		return None
 
+	@tracing.traced()
 	def findInfobox(self, check_all=''):
 		if self.page:
-			text_screened = re.findall(r'\{\{Infobox .*[\n]*', self.page.text, re.DOTALL)
-			if text_screened:
-				text = text_screened[0].split('==')
-				text = text[0].split('\n}}')
-				result = search_patterns.infobox(page_text=text[0], check_all=check_all)
+			# first infobox of the page, nested templates kept inside their parameters
+			infoboxes = template_parser.find_infoboxes(self.page.text)
+			if infoboxes:
+				result = search_patterns.infobox(page_text=infoboxes[0].text, check_all=check_all, template=infoboxes[0])
 				# search_patterns.infobox(self.page.text)
 				if result:
 					return result
@@ -252,38 +550,223 @@ class WpPage:
 			return False
 
 
+def hasSameClaim(item=None, claim=None):
+	""" True if the item has a statement with the property and value of a claim """
+	return any(existing is claim or existing.same_as(claim, ignore_rank=True, ignore_quals=True, ignore_refs=True)
+				for existing in item.claims.get(claim.getID(), []))
+
+def copyClaimIds(item=None, claims='', statements=None):
+	"""
+	Gives saved claims the statement IDs and the reference and qualifier
+	hashes of a wbeditentity response, and adds them to item.claims and to
+	the item's loaded data (so a later item.get() keeps them)
+
+	New statements are matched by property and value among those whose ID
+	is not on the item yet, in the order they were sent.
+
+	"""
+	known = set(existing.snak for existing in itertools.chain.from_iterable(item.claims.values()) if getattr(existing, 'snak', None))
+	for claim in claims:
+		candidates = [statement for statement in statements.get(claim.getID(), []) if statement.get('id') not in known]
+		if not candidates:
+			continue
+		statement = candidates[0]
+		for candidate in candidates:
+			if pywikibot.Claim.fromJSON(item.repo, candidate).same_as(claim, ignore_rank=True, ignore_quals=True, ignore_refs=True):
+				statement = candidate
+				break
+		known.add(statement['id'])
+
+		claim.snak = statement['id']
+		claim.on_item = item
+		for qualifier_id, qualifiers in statement.get('qualifiers', dict()).items():
+			for qualifier, saved in zip(claim.qualifiers.get(qualifier_id, []), qualifiers):
+				qualifier.hash = saved['hash']
+		for reference, saved in zip(claim.sources, statement.get('references', [])):
+			for sources in reference.values():
+				for source in sources:
+					source.hash = saved['hash']
+
+		if not any(claim is existing for existing in item.claims.get(claim.getID(), [])):
+			item.claims.setdefault(claim.getID(), []).append(claim)
+		if hasattr(item, '_content'):
+			item._content.setdefault('claims', dict()).setdefault(claim.getID(), []).append(statement)
+
+@tracing.traced()
+def editClaims(item=None, claims='', summary='', reload=None):
+	"""
+	Saves new claims (with their references and qualifiers) of a loaded item
+	in one wbeditentity call, and updates the item from the response (see
+	copyClaimIds) and its latest revision id
+
+	item.editEntity(data) does neither: pywikibot only copies IDs back when
+	it builds the data itself, and it drops the loaded data after every edit.
+	On an edit conflict the item is reloaded (`reload`, default
+	item.get(force=True)) and only the claims it does not have yet are sent
+	again.
+
+	@return value: the claims saved
+
+	"""
+	def send(claims):
+		updates = item.repo.editEntity(item, {'claims': [claim.toJSON() for claim in claims]},
+										baserevid=item.latest_revision_id, summary=summary)
+		entity = updates.get('entity', dict())
+		item.latest_revision_id = entity.get('lastrevid')
+		if hasattr(item, '_content'):
+			item._content['lastrevid'] = entity.get('lastrevid')
+		copyClaimIds(item=item, claims=claims, statements=entity.get('claims', dict()))
+		return claims
+
+	try:
+		return send(claims)
+	except (pywikibot.exceptions.EditConflictError, pywikibot.exceptions.APIError) as error:
+		if not isinstance(error, pywikibot.exceptions.EditConflictError) and getattr(error, 'code', '') != 'editconflict':
+			raise
+	print('Edit conflict. Reloading the item and retrying...')
+	if reload:
+		reload()
+	else:
+		item.get(force=True)
+	remaining = [claim for claim in claims if not hasSameClaim(item, claim)]
+	if not remaining:
+		print('The claims were saved already.')
+		return remaining
+	return send(remaining)
+
+
 # deals with Wikidata articles
 class WdPage:
 	"""
 	List of methods:
 
 	- printWdContents
+	- loadFromDump
+	- checkDumpRevision
+	- load
+	- reload
+	- preloadLabels
 	- addWdProp
 	- addFiles
 	- addNumeric
 	- addDate
 	- addIdentifiers
 	- checkClaimExistence
+	- batch
+	- saveClaim
+	- makeReference
+	- attachQualifier
+	- isPending
+	- planEdit
+	- removeClaims
+	- submitQualifier
+	- hasSaved
+	- commitClaims
 	- addImportedFrom
 	- addQualifiers
 
 	"""
 
+	@tracing.traced()
 	def __init__(self, wd_value='', page_name=''):
-		if wd_value:
-			self.page = pywikibot.ItemPage(enwd, wd_value)
+		# claims collected by batch(), None outside a batch
+		self.pending = None
+		self.loaded = False
+		# built from the dump index and not compared with Wikidata yet
+		self.from_dump = False
+
+		# resolved in bulk by resolveTitles, or by the local dump index
+		resolved_qid = ''
+		if page_name and not wd_value:
+			resolved_qid = sitelink_cache.get(page_name) or wikidata_dump.qidOf(page_name)
+
+		if plan.isNew(wd_value):
+			# planned by plan.createItem: empty until `plan.py apply` creates it
+			self.page = pywikibot.ItemPage(getEnwd())
+			self.page._content = dict()
+		elif wd_value:
+			self.page = pywikibot.ItemPage(getEnwd(), wd_value)
+		elif resolved_qid:
+			self.page = pywikibot.ItemPage(getEnwd(), resolved_qid)
 		elif page_name:
-			wp_page = pywikibot.Page(enwp, page_name)
+			wp_page = pywikibot.Page(getEnwp(), page_name)
 			if wp_page:
 				self.page = pywikibot.ItemPage.fromPage(wp_page)
 			else:
 				print('No wikipedia page exists')
 
-		self.wd_value = self.page.title()
+		self.wd_value = wd_value if plan.isNew(wd_value) else self.page.title()
+		self.loadFromDump()
+
+	def loadFromDump(self):
+		"""
+		Gives the item the data of the local dump index, if it has the item
+
+		page.get() then builds the item from it instead of downloading it.
+		The index only has the claims of the properties the scripts use
+		(with their qualifiers and references), so the existence checks
+		still see every claim they compare against. An edit would not
+		conflict with a statement added since the dump: wbeditentity only
+		conflicts on the statements it changes, so a claim added since would
+		be added again. checkDumpRevision() compares the revision with
+		Wikidata before the first edit of the item.
+
+		"""
+		data = wikidata_dump.entity(self.wd_value)
+		if data and not hasattr(self.page, '_content'):
+			self.page._content = data
+			self.from_dump = True
+		return bool(data)
+
+	def checkDumpRevision(self):
+		"""
+		Reloads an item built from the dump index if it was edited since the
+		dump; the revision is only asked for once, before the first edit (not
+		when planning: `plan.py apply` checks the live item)
+
+		@return value: True if the item was reloaded
+
+		"""
+		if not self.from_dump or plan.isPlanning():
+			return False
+		self.from_dump = False
+		if pywikibot.Page(getRepo(), self.wd_value).latest_revision_id == self.load().latest_revision_id:
+			return False
+		print('%s was edited since the dump. Reloading it...' % self.wd_value)
+		self.reload()
+		return True
 
 	def getWdContents(self):
 		return self.page.get()
 
+	@tracing.traced()
+	def load(self):
+		"""
+		Loads the item once
+
+		Calling page.get() again would rebuild page.claims from the downloaded
+		data and drop claims queued by batch().
+
+		"""
+		if not self.loaded:
+			self.page.get()
+			self.loaded = True
+		return self.page
+
+	def reload(self):
+		"""
+		Downloads the item again
+
+		Only needed after an edit conflict: editClaims updates page.claims and
+		the latest revision id from the response of every claims edit,
+		pywikibot does for addClaim, addSources and addQualifier, and
+		removeClaims drops the removed values.
+
+		"""
+		self.page.get(force=True)
+		self.loaded = True
+		return self.page
+
 	def printWdContents(self):
 		""" Prints contents of a Wikidata page """
 
@@ -305,7 +788,35 @@ class WdPage:
 
 		return 0
 
-	def addWdProp(self, prop_id='', prop_value='', lang='', qualifier_id='', qualval_id='', confirm='', overwrite='', append=''):
+	@tracing.traced()
+	def preloadLabels(self, lang='en'):
+		"""
+		Fetches the labels of every item used as a claim or qualifier value of
+		this item in a few batched requests (see getLabels), so existence
+		checks can use getLabel() instead of loading each item
+
+		An error only costs the batching: it is printed and the existence
+		checks fetch the labels they need themselves.
+
+		"""
+		try:
+			qids = list()
+			for claims in self.load().claims.values():
+				for claim in claims:
+					values = [claim]
+					for qualifiers in claim.qualifiers.values():
+						values.extend(qualifiers)
+					for value in values:
+						target = value.getTarget()
+						if isinstance(target, pywikibot.ItemPage):
+							qids.append(target.title())
+			return getLabels(qids, lang=lang)
+		except Exception as e:
+			print('Error preloading the labels of %s: %s' % (self.wd_value, e))
+			return dict()
+
+	@tracing.traced()
+	def addWdProp(self, prop_id='', prop_value='', lang='', qualifier_id='', qualval_id='', source_id='', sourceval='', confirm='', overwrite='', append=''):
 		"""
 		Adds a new property in Wikidata
 
@@ -314,6 +825,8 @@ class WdPage:
 		@param lang: language of Wikipedia artcile: for references
 		@param qualifier_id: ID of the qualifier
 		@param qualval_id: ID of the qualifier's value
+		@param source_id: ID of an extra reference property (e.g. P4656, Wikimedia import URL)
+		@param sourceval: value of the extra reference property
 		@param confirm: set to 'y' to avoid the confirmation message before adding a property
 
 		@type all: string
@@ -324,54 +837,22 @@ class WdPage:
 		if prop_value and not re.search(r'Unknown', prop_value, re.IGNORECASE):
 			try:
 				if re.search(r'Q\d+', prop_value):
-					new_prop_val = pywikibot.ItemPage(enwd, prop_value)
+					new_prop_val = pywikibot.ItemPage(getEnwd(), prop_value)
 				else:
-					searchitemurl = 'https://www.wikidata.org/w/api.php?action=wbsearchentities&search=%s&language=en&format=xml' % (urllib.parse.quote(prop_value))
-					raw = getURL(searchitemurl)
-					# print(raw)
-					
-					ids = list()
-					# check for valid search result
-					if not '<search />' in raw:
-						m = re.findall(r'id="(Q\d+)"', raw)
-						# print(m)
-
-						for itemfoundq in m:
-							itemfound = pywikibot.ItemPage(repo, itemfoundq)
-							item_dict = itemfound.get()
-							# print(prop_value)
-							# print(item_dict['labels']['en'])
-							# print('\n')
-							flag = 0
-							if 'P31' in itemfound.claims:
-								for claim in item_dict['claims']['P31']:
-									prop_id_value = claim.getTarget()
-									# print(prop_id_value.title())
-									if prop_id_value.title() == 'Q4167410':
-										print('Disambiguous page. Skipping...')
-										flag = 1
-										break
-							if flag:
-								continue
-
-							if prop_value.lower() == (item_dict['labels']['en']).lower():
-								# print('hello')
-								# new_prop_val = pywikibot.ItemPage(enwd, itemfoundq)
-								ids.append(itemfoundq)
-						if len(ids) > 1:
-							print('multiple pages found')
-							return
-						else:
-							new_prop_val = pywikibot.ItemPage(enwd, ids[0])
-
-					else:
+					status, qid = getLabelResolver().resolve(prop_value, lang='en')
+					if status == label_resolver.AMBIGUOUS:
+						print('multiple pages found')
+						return
+					elif status == label_resolver.NOT_FOUND:
 						print('No item page exists/Incorrect value provided.\n')
+						return 1
+					new_prop_val = pywikibot.ItemPage(getEnwd(), qid)
 
 			except:
 				print('Incorrect property value provided.\n')
 				return 1
 
-		self.page.get()
+		self.load()
 		if prop_id in self.page.claims:
 			choice = ''
 			if not append and not overwrite:
@@ -384,62 +865,38 @@ class WdPage:
 				return
 
 			elif choice == '2' or overwrite == 'y':
-				self.page.removeClaims(self.page.claims[prop_id])
+				self.removeClaims(prop_id=prop_id)
 		
 			elif choice > '3':
 				print("Invalid choice.\n")
 				return 1
 	
 		try:
-			new_prop = pywikibot.Claim(enwd, prop_id)	
+			new_prop = pywikibot.Claim(getEnwd(), prop_id)	
 			new_prop.setTarget(new_prop_val)
 
 			# confirmation
-			if confirm.lower() == 'y':
-				self.page.addClaim(new_prop, summary = u'Adding new property')
-				# retrieving the updated page
-				self.page = pywikibot.ItemPage(enwd, self.wd_value)
-		
-				if lang:
-					self.addImportedFrom(repo=repo, claim=new_prop, lang=lang, status=1)
-					# print("Reference added.")
-				if qualifier_id and qualval_id:
-					self.addQualifiers(repo=repo, claim=new_prop, qualifier_id=qualifier_id, qualval_id=qualval_id, status=1)
-					# print("Qualifier added.")
-
-			else:
-				print(new_prop)
-				text = input("Do you want to save this property? (y/n) ")
-				if text == 'y':
-					self.page.addClaim(new_prop, summary = u'Adding new property')
-					# retrieving the updated page
-					self.page = pywikibot.ItemPage(enwd, self.wd_value)
-			
-					if lang:
-						self.addImportedFrom(repo=repo, claim=new_prop, lang=lang, status=1)
-						# print("Reference added.")
-					if qualifier_id and qualval_id:
-						self.addQualifiers(repo=repo, claim=new_prop, qualifier_id=qualifier_id, qualval_id=qualval_id, status=1)
-						# print("Qualifier added.")
+			self.saveClaim(claim=new_prop, summary=u'Adding new property', lang=lang, source_id=source_id, sourceval=sourceval, qualifier_id=qualifier_id, qualval_id=qualval_id, confirm=confirm)
 
 		except:
 			print('Error in adding new property.')
 
 		return 0
 
-	def addFiles(self, prop_id='', prop_value='', lang='', qualifier_id='', qualval='', qualval_id='', confirm='', overwrite='', append=''):
+	@tracing.traced()
+	def addFiles(self, prop_id='', prop_value='', lang='', qualifier_id='', qualval='', qualval_id='', source_id='', sourceval='', confirm='', overwrite='', append=''):
 		""" Adds files from Commons to Wikidata """
 
 		print(self.page.title())
 
 		if prop_value:
 			try:
-				new_prop_val = pywikibot.FilePage(encommons, prop_value)
+				new_prop_val = pywikibot.FilePage(getCommons(), prop_value)
 			except:
 				print('Incorrect property value provided.\n')
 				return 1
 
-		self.page.get()
+		self.load()
 		if prop_id in self.page.claims:
 			choice = ''
 			if not append and not overwrite:
@@ -452,54 +909,25 @@ class WdPage:
 				return
 
 			elif choice == '2' or overwrite == 'y':
-				self.page.removeClaims(self.page.claims[prop_id])
+				self.removeClaims(prop_id=prop_id)
 		
 			elif choice > '3':
 				print("Invalid choice.\n")
 				return 1
 
 		try:
-			new_prop = pywikibot.Claim(repo, prop_id)	
+			new_prop = pywikibot.Claim(getRepo(), prop_id)	
 			new_prop.setTarget(new_prop_val)
 
-			if confirm.lower() == 'y':
-				self.page.addClaim(new_prop, summary = u'Adding new file')
-				self.page = pywikibot.ItemPage(enwd, self.wd_value)
-
-				if lang:
-					self.addImportedFrom(repo=repo, claim=new_prop, lang=lang, status=1)
-					# print("Reference added.")
-				if qualifier_id:
-					if qualval_id:
-						self.addQualifiers(repo=repo, claim=new_prop, qualifier_id=qualifier_id, qualval_id=qualval_id, status=1)
-					elif qualval:
-						self.addQualifiers(repo=repo, claim=new_prop, qualifier_id=qualifier_id, qualval=qualval, status=1)
-					# print("Qualifier added.")
-
-			else:
-				# confirmation
-				print(new_prop)
-				text = input("Do you want to save this property? (y/n) ")
-				if text == 'y':
-					self.page.addClaim(new_prop, summary = u'Adding new file')
-					self.page = pywikibot.ItemPage(enwd, self.wd_value)
-
-					if lang:
-						self.addImportedFrom(repo=repo, claim=new_prop, lang=lang, status=1)
-						# print("Reference added.")
-					if qualifier_id:
-						if qualval_id:
-							self.addQualifiers(repo=repo, claim=new_prop, qualifier_id=qualifier_id, qualval_id=qualval_id, status=1)
-						elif qualval:
-							self.addQualifiers(repo=repo, claim=new_prop, qualifier_id=qualifier_id, qualval=qualval, status=1)
-						# print("Qualifier added.")
+			self.saveClaim(claim=new_prop, summary=u'Adding new file', lang=lang, source_id=source_id, sourceval=sourceval, qualifier_id=qualifier_id, qualval=qualval, qualval_id=qualval_id, confirm=confirm)
 
 		except:
 			print('Error in adding new file.')
 
 		return 0
 
-	def addMonolingualText(self, prop_id='', prop_value='', text_language='', lang='', qualifier_id='', qualval_id='', confirm='', overwrite='', append=''):
+	@tracing.traced()
+	def addMonolingualText(self, prop_id='', prop_value='', text_language='', lang='', qualifier_id='', qualval_id='', source_id='', sourceval='', confirm='', overwrite='', append=''):
 		""" Adds numeric values to Wikidata """
 
 		print(self.page.title())
@@ -511,7 +939,7 @@ class WdPage:
 				print('Incorrect property value provided.\n')
 				return 1
 
-		self.page.get()
+		self.load()
 		if prop_id in self.page.claims:
 			choice = ''
 			if not append and not overwrite:
@@ -524,43 +952,19 @@ class WdPage:
 				return
 
 			elif choice == '2' or overwrite == 'y':
-				self.page.removeClaims(self.page.claims[prop_id])
+				self.removeClaims(prop_id=prop_id)
 		
 			elif choice > '3':
 				print("Invalid choice.\n")
 				return 1
 
 		try:
-			new_prop = pywikibot.Claim(repo, prop_id)
+			new_prop = pywikibot.Claim(getRepo(), prop_id)
 			# print('hello')
 			new_prop.setTarget(val)
 			# print(val)
 
-			if confirm.lower() == 'y':
-				self.page.addClaim(new_prop, summary = u'Adding new string/monolingual text')
-				self.page = pywikibot.ItemPage(enwd, self.wd_value)
-
-				if lang:
-					self.addImportedFrom(repo=repo, claim=new_prop, lang=lang, status=1)
-					# print("Reference added.")
-				if qualifier_id and qualval_id:
-					self.addQualifiers(repo=repo, claim=new_prop, qualifier_id=qualifier_id, qualval_id=qualval_id, status=1)
-					# print("Qualifier added.")
-
-			else:
-				# confirmation
-				print(new_prop)
-				text = input("Do you want to save this property? (y/n) ")
-				if text == 'y':
-					self.page.addClaim(new_prop, summary = u'Adding new string/monolingual text')
-					self.page = pywikibot.ItemPage(enwd, self.wd_value)
-
-					if lang:
-						self.addImportedFrom(repo=repo, claim=new_prop, lang=lang, status=1)
-						# print("Reference added.")
-					if qualifier_id and qualval_id:
-						self.addQualifiers(repo=repo, claim=new_prop, qualifier_id=qualifier_id, qualval_id=qualval_id, status=1)
-						# print("Qualifier added.")
+			self.saveClaim(claim=new_prop, summary=u'Adding new string/monolingual text', lang=lang, source_id=source_id, sourceval=sourceval, qualifier_id=qualifier_id, qualval_id=qualval_id, confirm=confirm)
 
 		except:
 			print('Error in adding monolingual text.')
@@ -568,19 +972,20 @@ class WdPage:
 		return 0
 
 
-	def addNumeric(self, prop_id='', prop_value='', lang='', qualifier_id='', qualval_id='', confirm='', overwrite='', append=''):
+	@tracing.traced()
+	def addNumeric(self, prop_id='', prop_value='', lang='', qualifier_id='', qualval_id='', source_id='', sourceval='', confirm='', overwrite='', append=''):
 		""" Adds numeric values to Wikidata """
 
 		print(self.page.title())
 
 		if prop_value:
 			try:
-				val = pywikibot.WbQuantity(amount=prop_value, site=enwp)
+				val = pywikibot.WbQuantity(amount=prop_value, site=getEnwp())
 			except:
 				print('Incorrect property value provided.\n')
 				return 1
 
-		self.page.get()
+		self.load()
 		if prop_id in self.page.claims:
 			choice = ''
 			if not append and not overwrite:
@@ -593,50 +998,27 @@ class WdPage:
 				return
 
 			elif choice == '2' or overwrite == 'y':
-				self.page.removeClaims(self.page.claims[prop_id])
+				self.removeClaims(prop_id=prop_id)
 		
 			elif choice > '3':
 				print("Invalid choice.\n")
 				return 1
 
 		try:
-			new_prop = pywikibot.Claim(repo, prop_id)
+			new_prop = pywikibot.Claim(getRepo(), prop_id)
 			# print('hello')
 			new_prop.setTarget(val)
 			# print(val)
 
-			if confirm.lower() == 'y':
-				self.page.addClaim(new_prop, summary = u'Adding new numeric value')
-				self.page = pywikibot.ItemPage(enwd, self.wd_value)
-
-				if lang:
-					self.addImportedFrom(repo=repo, claim=new_prop, lang=lang, status=1)
-					# print("Reference added.")
-				if qualifier_id and qualval_id:
-					self.addQualifiers(repo=repo, claim=new_prop, qualifier_id=qualifier_id, qualval_id=qualval_id, status=1)
-					# print("Qualifier added.")
-
-			else:
-				# confirmation
-				print(new_prop)
-				text = input("Do you want to save this property? (y/n) ")
-				if text == 'y':
-					self.page.addClaim(new_prop, summary = u'Adding new numeric value')
-					self.page = pywikibot.ItemPage(enwd, self.wd_value)
-
-					if lang:
-						self.addImportedFrom(repo=repo, claim=new_prop, lang=lang, status=1)
-						# print("Reference added.")
-					if qualifier_id and qualval_id:
-						self.addQualifiers(repo=repo, claim=new_prop, qualifier_id=qualifier_id, qualval_id=qualval_id, status=1)
-						# print("Qualifier added.")
+			self.saveClaim(claim=new_prop, summary=u'Adding new numeric value', lang=lang, source_id=source_id, sourceval=sourceval, qualifier_id=qualifier_id, qualval_id=qualval_id, confirm=confirm)
 
 		except:
 			print('Error in adding numeric value.')
 
 		return 0
 
-	def addCoordinates(self, prop_id='', prop_value='', lang='', qualifier_id='', qualval_id='', confirm='', overwrite='', append=''):
+	@tracing.traced()
+	def addCoordinates(self, prop_id='', prop_value='', lang='', qualifier_id='', qualval_id='', source_id='', sourceval='', confirm='', overwrite='', append=''):
 		""" Adds coordinates to Wikidata """
 
 		print(self.page.title())
@@ -653,7 +1035,7 @@ class WdPage:
 			print('Incorrect precision value obtained')
 			return
 
-		self.page.get()
+		self.load()
 		if prop_id in self.page.claims:
 			choice = ''
 			if not append and not overwrite:
@@ -666,69 +1048,37 @@ class WdPage:
 				return
 
 			elif choice == '2' or overwrite == 'y':
-				self.page.removeClaims(self.page.claims[prop_id])
+				self.removeClaims(prop_id=prop_id)
 		
 			elif choice > '3':
 				print("Invalid choice.\n")
 				return 1
 
 		try:
-			new_prop = pywikibot.Claim(repo, prop_id)
-			coordinate = pywikibot.Coordinate(lat=lat, lon=lon, precision=precision, site=enwp,globe_item=globe_item)
+			new_prop = pywikibot.Claim(getRepo(), prop_id)
+			coordinate = pywikibot.Coordinate(lat=lat, lon=lon, precision=precision, site=getEnwp(),globe_item=getGlobeItem())
 			new_prop.setTarget(coordinate)
 
-			if confirm.lower() == 'y':
-				self.page.addClaim(new_prop, summary=u'Importing new coordinate')
-				self.page = pywikibot.ItemPage(enwd, self.wd_value)
-
-				if lang:
-					self.addImportedFrom(repo=repo, claim=new_prop, lang=lang, status=1)
-					# print("Reference added.")
-				if qualifier_id and qualval_id:
-					self.addQualifiers(repo=repo, claim=new_prop, qualifier_id=qualifier_id, qualval_id=qualval_id, status=1)
-					# print("Qualifier added.")
-
-			else:
-				# confirmation
-				print(new_prop)
-				text = input("Do you want to save this property? (y/n) ")
-				if text == 'y':
-					self.page.addClaim(new_prop, summary = u'Importing new coordinate')
-					self.page = pywikibot.ItemPage(enwd, self.wd_value)
-
-					if lang:
-						self.addImportedFrom(repo=repo, claim=new_prop, lang=lang, status=1)
-						# print("Reference added.")
-					if qualifier_id and qualval_id:
-						self.addQualifiers(repo=repo, claim=new_prop, qualifier_id=qualifier_id, qualval_id=qualval_id, status=1)
-						# print("Qualifier added.")
+			self.saveClaim(claim=new_prop, summary=u'Importing new coordinate', lang=lang, source_id=source_id, sourceval=sourceval, qualifier_id=qualifier_id, qualval_id=qualval_id, confirm=confirm)
 
 		except:
 			print('Error in adding numeric value.')
 
-	def addDate(self, prop_id='', date='', lang='', qualifier_id='', qualval_id='', confirm='', overwrite='', append=''):
+	@tracing.traced()
+	def addDate(self, prop_id='', date='', lang='', qualifier_id='', qualval_id='', source_id='', sourceval='', confirm='', overwrite='', append=''):
 		""" Adds numeric values to Wikidata """
 
 		print(self.page.title())
 
 		if date and not re.search(r'\d-\d-\d', date, re.IGNORECASE):
-			date = date.split()
 			try:
-				if len(date) == 3:
-					value = dateparser.parse(str(date[0])+' '+str(date[1])+' '+str(date[2]))
-					date = str(value.year) + '-' + str(value.month) + '-' + str(value.day)
-				elif len(date) == 2:
-					value = dateparser.parse(str(date[0])+' '+str(date[1]))
-					date = str(value.year) + '-' + str(value.month)
-				elif len(date) == 1:
-					value = dateparser.parse(str(date[0]))
-					date = str(value.year)
+				date = date_normalizer.to_string(date_normalizer.parse_date(date))
 			except:
 				print('Error in extracting date.\n')
 				return
 
 		if date and date != '0-0-0':
-			self.page.get()
+			self.load()
 
 			if prop_id in self.page.claims:
 				choice = ''
@@ -742,7 +1092,7 @@ class WdPage:
 					return
 
 				elif choice == '2' or overwrite == 'y':
-					self.page.removeClaims(self.page.claims[prop_id])
+					self.removeClaims(prop_id=prop_id)
 			
 				elif choice > '3':
 					print("Invalid choice.\n")
@@ -762,7 +1112,7 @@ class WdPage:
 
 			if check_ok:
 				try:
-					new_prop = pywikibot.Claim(repo, prop_id)
+					new_prop = pywikibot.Claim(getRepo(), prop_id)
 
 					if len(date.split('-')) == 3:
 						new_prop.setTarget(pywikibot.WbTime(year=int(date.split('-')[0]), month=int(date.split('-')[1]), day=int(date.split('-')[2])))
@@ -771,38 +1121,15 @@ class WdPage:
 					elif len(date.split('-')) == 1:
 						new_prop.setTarget(pywikibot.WbTime(year=int(date.split('-')[0])))
 
-					if confirm.lower() == 'y':
-						self.page.addClaim(new_prop, summary = u'Adding new date')
-						self.page = pywikibot.ItemPage(enwd, self.wd_value)
-
-						if lang:
-							self.addImportedFrom(repo=repo, claim=new_prop, lang=lang, status=1)
-							# print("Reference added.")
-						if qualifier_id and qualval_id:
-							self.addQualifiers(repo=repo, claim=new_prop, qualifier_id=qualifier_id, qualval_id=qualval_id, status=1)
-							# print("Qualifier added.")
-
-					else:
-						# confirmation
-						print(new_prop)
-						text = input("Do you want to save this property? (y/n) ")
-						if text == 'y':
-							self.page.addClaim(new_prop, summary = u'Adding new date')
-							self.page = pywikibot.ItemPage(enwd, self.wd_value)
-
-							if lang:
-								self.addImportedFrom(repo=repo, claim=new_prop, lang=lang, status=1)
-								# print("Reference added.")
-							if qualifier_id and qualval_id:
-								self.addQualifiers(repo=repo, claim=new_prop, qualifier_id=qualifier_id, qualval_id=qualval_id, status=1)
-								# print("Qualifier added.")
+					self.saveClaim(claim=new_prop, summary=u'Adding new date', lang=lang, source_id=source_id, sourceval=sourceval, qualifier_id=qualifier_id, qualval_id=qualval_id, confirm=confirm)
 
 				except:
 					print('Error in adding numeric value.\n')
 		return 0
 
 
-	def addIdentifiers(self, prop_id='', prop_value='', lang='', qualifier_id='', qualval_id='', confirm='', overwrite='', append=''):
+	@tracing.traced()
+	def addIdentifiers(self, prop_id='', prop_value='', lang='', qualifier_id='', qualval_id='', source_id='', sourceval='', confirm='', overwrite='', append=''):
 		""" Adds numeric values to Wikidata """
 
 		print(self.page.title())
@@ -811,7 +1138,7 @@ class WdPage:
 			print('Incorrect property value provided.\n')
 			return 1
 
-		self.page.get()
+		self.load()
 		if prop_id in self.page.claims:
 			choice = ''
 			if not append and not overwrite:
@@ -824,49 +1151,26 @@ class WdPage:
 				return
 
 			elif choice == '2' or overwrite == 'y':
-				self.page.removeClaims(self.page.claims[prop_id])
+				self.removeClaims(prop_id=prop_id)
 		
 			elif choice > '3':
 				print("Invalid choice.\n")
 				return 1
 
 		try:
-			new_prop = pywikibot.Claim(repo, prop_id)
+			new_prop = pywikibot.Claim(getRepo(), prop_id)
 			# print('hello')
 			new_prop.setTarget(prop_value)
 			# print(val)
 
-			if confirm.lower() == 'y':
-				self.page.addClaim(new_prop, summary = u'Adding new identifier')
-				self.page = pywikibot.ItemPage(enwd, self.wd_value)
-
-				if lang:
-					self.addImportedFrom(repo=repo, claim=new_prop, lang=lang, status=1)
-					# print("Reference added.")
-				if qualifier_id and qualval_id:
-					self.addQualifiers(repo=repo, claim=new_prop, qualifier_id=qualifier_id, qualval_id=qualval_id, status=1)
-					# print("Qualifier added.")
-
-			else:
-				# confirmation
-				print(new_prop)
-				text = input("Do you want to save this property? (y/n) ")
-				if text == 'y':
-					self.page.addClaim(new_prop, summary = u'Adding new identifier')
-					self.page = pywikibot.ItemPage(enwd, self.wd_value)
-
-					if lang:
-						self.addImportedFrom(repo=repo, claim=new_prop, lang=lang, status=1)
-						# print("Reference added.")
-					if qualifier_id and qualval_id:
-						self.addQualifiers(repo=repo, claim=new_prop, qualifier_id=qualifier_id, qualval_id=qualval_id, status=1)
-						# print("Qualifier added.")
+			self.saveClaim(claim=new_prop, summary=u'Adding new identifier', lang=lang, source_id=source_id, sourceval=sourceval, qualifier_id=qualifier_id, qualval_id=qualval_id, confirm=confirm)
 
 		except:
 			print('Error in adding identifier.')
 
 		return 0
 
+	@tracing.traced()
 	def checkClaimExistence(self, claim=''):
 		"""
 		Checks if a claim exists in Wikidata already
@@ -877,12 +1181,14 @@ class WdPage:
 		claim_prop = claim.getID()
 		claim_target = claim.getTarget()
 
-		wd_items = self.page.get()
+		self.checkDumpRevision()
+		# page.get() would rebuild page.claims without the claims added since
+		wd_claims = self.load().claims
 
-		for props in wd_items['claims']:
+		for props in wd_claims:
 			if props == claim_prop:
 				try:
-					item = wd_items['claims'][props]
+					item = wd_claims[props]
 					for value in item:
 						try:
 							value_qid = value.getTarget()
@@ -898,8 +1204,11 @@ class WdPage:
 			2 to skip\n')
 
 		if choice == '1':
-			self.page.addClaim(claim, summary = u'Adding new property')
-			self.page = pywikibot.ItemPage(enwd, self.wd_value)
+			if plan.isPlanning():
+				self.commitClaims(claims=[claim], summary=u'Adding new property')
+			else:
+				write_scheduler.submit(edit=lambda: self.page.addClaim(claim, summary = u'Adding new property'), description='%s: Adding new property' % self.page.getID(),
+										verify=lambda: self.hasSaved([claim]))
 			return claim
 		elif choice == '2':
 			print('Skipping the addition of property and source.\n')
@@ -911,24 +1220,211 @@ class WdPage:
 		return 0
 
 
-	def addImportedFrom(self, repo=repo, prop_id='', prop_value='', claim='', lang='', status=0):
+	@contextlib.contextmanager
+	def batch(self, summary=''):
+		"""
+		Collects every claim (with its references and qualifiers) added by the
+		add* methods inside the block and saves them in one edit at the end
+
+		with wd_page.batch():
+			wd_page.addWdProp(...)
+			wd_page.addFiles(...)
+
+		Nothing is saved if the block raises an exception.
+
+		@param summary: edit summary (default: the summaries of the claims)
+
+		"""
+		if self.pending is not None:
+			# nested batches are part of the outer one
+			yield self
+			return
+
+		self.pending = list()
+		try:
+			yield self
+		except:
+			print('Error while collecting claims. Discarding %d claim(s).\n' % len(self.pending))
+			# drops the queued claims from page.claims
+			for claim, claim_summary in self.pending:
+				self.page.claims[claim.getID()].remove(claim)
+				if not self.page.claims[claim.getID()]:
+					del self.page.claims[claim.getID()]
+			raise
+		else:
+			if not summary:
+				summaries = list()
+				for claim, claim_summary in self.pending:
+					if claim_summary and claim_summary not in summaries:
+						summaries.append(claim_summary)
+				summary = '; '.join(summaries)
+			self.commitClaims(claims=[claim for claim, claim_summary in self.pending], summary=summary)
+		finally:
+			self.pending = None
+
+	def saveClaim(self, claim='', summary='', lang='', source_id='', sourceval='', qualifier_id='', qualval='', qualval_id='', confirm=''):
+		"""
+		Saves a new claim together with its reference and qualifier in a
+		single edit, or queues it when called inside batch()
+
+		@param claim: the new claim
+		@param summary: edit summary
+		@param lang: language of the wiki imported from (P143 reference)
+		@param source_id, sourceval: extra reference property and value
+		@param qualifier_id: ID of the qualifier
+		@param qualval: value of the qualifier
+		@param qualval_id: ID of the qualifier's value (Wd item)
+		@param confirm: set to 'y' to avoid the confirmation message
+
+		"""
+		if confirm.lower() != 'y':
+			print(claim)
+			text = input("Do you want to save this property? (y/n) ")
+			if text != 'y':
+				return 1
+
+		if self.checkDumpRevision() and hasSameClaim(self.page, claim):
+			print('The claim was added since the dump. Skipping.\n')
+			return 0
+
+		sources = self.makeReference(lang=lang, source_id=source_id, sourceval=sourceval)
+		if sources:
+			reference = collections.OrderedDict()
+			for source in sources:
+				reference.setdefault(source.getID(), []).append(source)
+			claim.sources.append(reference)
+		if qualifier_id and (qualval_id or qualval):
+			self.attachQualifier(claim=claim, qualifier_id=qualifier_id, qualval=qualval, qualval_id=qualval_id)
+
+		if self.pending is not None:
+			# visible to later existence checks of the same batch
+			self.load()
+			claim.on_item = self.page
+			self.page.claims.setdefault(claim.getID(), []).append(claim)
+			self.pending.append((claim, summary))
+			return 0
+
+		return self.commitClaims(claims=[claim], summary=summary)
+
+	def makeReference(self, lang='', source_id='', sourceval=''):
+		""" Returns the source claims of one reference: P143 (imported from) and an optional extra source """
+		sources = list()
+		if lang and lang in langs.keys():
+			importedfrom = pywikibot.Claim(getRepo(), 'P143', is_reference=True) #imported from
+			importedfrom.setTarget(pywikibot.ItemPage(getRepo(), langs[lang]))
+			sources.append(importedfrom)
+		if source_id and sourceval:
+			source = pywikibot.Claim(getRepo(), source_id, is_reference=True)
+			source.setTarget(sourceval)
+			sources.append(source)
+		return sources
+
+	def attachQualifier(self, claim='', qualifier_id='', qualval='', qualval_id=''):
+		""" Adds a qualifier to a claim that has not been saved yet """
+		qualifier = pywikibot.Claim(getRepo(), qualifier_id, is_qualifier=True)
+		if qualval_id:
+			qualifier.setTarget(pywikibot.ItemPage(getRepo(), qualval_id))
+		else:
+			qualifier.setTarget(qualval)
+		claim.qualifiers.setdefault(qualifier_id, []).append(qualifier)
+		return qualifier
+
+	def isPending(self, claim=''):
+		""" True if the claim is queued in the current batch """
+		return self.pending is not None and any(claim is pending for pending, pending_summary in self.pending)
+
+	def planEdit(self, action='', summary='', **fields):
+		""" Writes an edit of the item to the plan instead of making it (see plan.py) """
+		self.load()
+		qid = self.wd_value if plan.isNew(self.wd_value) else self.page.getID()
+		plan.record(action=action, qid=qid, base_revision=self.page.latest_revision_id, summary=summary, **fields)
+
+	def removeClaims(self, prop_id=''):
+		""" Removes every value of a property (planned in plan mode) """
+		self.checkDumpRevision()
+		claims = self.page.claims.get(prop_id, [])
+		if not claims:
+			return
+		if plan.isPlanning():
+			self.planEdit(action=plan.REMOVE, summary='Removing %d claim(s)' % len(claims), property=prop_id,
+							claim_ids=[claim.snak for claim in claims if getattr(claim, 'snak', None)])
+			del self.page.claims[prop_id]
+			return
+		self.page.removeClaims(claims)
+		# pywikibot leaves them in page.claims
+		del self.page.claims[prop_id]
+		if hasattr(self.page, '_content'):
+			self.page._content.get('claims', dict()).pop(prop_id, None)
+
+	def submitQualifier(self, claim='', qualifier=''):
+		""" Adds a qualifier to a saved claim through the write scheduler (planned in plan mode) """
+		if plan.isPlanning():
+			return self.planEdit(action=plan.QUALIFIER, summary='Adding 1 qualifier', qualifier=plan.snak(qualifier), **plan.claimFields(claim))
+		self.checkDumpRevision()
+		return write_scheduler.submit(edit=lambda: claim.addQualifier(qualifier, summary='Adding 1 qualifier'), description='%s: Adding 1 qualifier' % self.page.getID())
+
+	def hasSaved(self, claims=''):
+		""" Reloads the item; True if it has every claim (after an edit that timed out, see write_scheduler) """
+		self.reload()
+		return all(hasSameClaim(self.page, claim) for claim in claims)
+
+	@tracing.traced()
+	def commitClaims(self, claims='', summary=''):
+		""" Saves new claims (with their references and qualifiers) in one wbeditentity call """
+		if not claims:
+			return 0
+
+		data = {'claims': [claim.toJSON() for claim in claims]}
+		summary = summary or u'Adding %d claims' % len(claims)
+
+		if plan.isPlanning():
+			# values of the properties on Wikidata now, for the conflict check of `plan.py apply`
+			base_values = dict()
+			for claim in claims:
+				base_values[claim.getID()] = [plan.datavalue(existing) for existing in self.page.claims.get(claim.getID(), [])
+												if getattr(existing, 'snak', None)]
+			self.planEdit(action=plan.CLAIMS, summary=summary, claims=data['claims'], base_values=base_values)
+			# later checks of the run see the claims, as after a real edit
+			for claim in claims:
+				if not any(claim is existing for existing in self.page.claims.get(claim.getID(), [])):
+					claim.on_item = self.page
+					self.page.claims.setdefault(claim.getID(), []).append(claim)
+			print('%d claim(s) planned.\n' % len(claims))
+			return 0
+
+		def save():
+			self.load()
+			# the claims get their IDs and are added to page.claims
+			editClaims(item=self.page, claims=claims, summary=summary, reload=self.reload)
+
+		# paced by the shared scheduler; deferred if Wikidata keeps asking to slow down
+		if write_scheduler.submit(edit=save, description='%s: %s' % (self.page.getID(), summary), verify=lambda: self.hasSaved(claims)) == write_scheduler.DEFERRED:
+			return 1
+		print('%d claim(s) saved in 1 edit.\n' % len(claims))
+
+		return 0
+
+	@tracing.traced()
+	def addImportedFrom(self, repo=None, prop_id='', prop_value='', claim='', lang='', source_id='', sourceval='', status=0):
 		"""
 		Adds a reference/source
 
-		@param repo:
+		@param repo: data repository (default: Wikidata)
 		@param prop_id: ID of the property
 		@param prop_val: ID of value associated with property
 		@param claim: property and it's value to which this associates with
 		@param lang: language of the wiki - must be a value from 'langs' dict
+		@param source_id, sourceval: extra reference property and value, saved in the same reference
 		@param status: decide whether to test for claim's existence or not
 						(0 - method is called directly by user
 						 1 - method is called indirectly by other methods which add a property to Wd)
 
 		"""
+		repo = repo or getRepo()
 		if prop_id and prop_value:
 			try:
-				new_prop_val = pywikibot.ItemPage(enwd, prop_value)
-				claim = pywikibot.Claim(enwd, prop_id)	
+				new_prop_val = pywikibot.ItemPage(getEnwd(), prop_value)
+				claim = pywikibot.Claim(getEnwd(), prop_id)	
 				claim.setTarget(new_prop_val)
 			except:
 				print('Incorrect property id or value provided.\n')
@@ -937,17 +1433,19 @@ class WdPage:
 		if status == 0:
 			claim = self.checkClaimExistence(claim)
 
-		if repo and claim and lang and lang in langs.keys():
-			importedfrom = pywikibot.Claim(repo, 'P143') #imported from
-			importedwp = pywikibot.ItemPage(repo, langs[lang])
-			importedfrom.setTarget(importedwp)
-			claim.addSource(importedfrom, summary='Adding 1 reference: [[Property:P143]]')
-			self.page = pywikibot.ItemPage(enwd, self.wd_value)
+		sources = self.makeReference(lang=lang, source_id=source_id, sourceval=sourceval)
+		if repo and claim and sources:
+			if plan.isPlanning():
+				self.planEdit(action=plan.SOURCES, summary='Adding 1 reference', sources=[plan.snak(source) for source in sources], **plan.claimFields(claim))
+			else:
+				self.checkDumpRevision()
+				write_scheduler.submit(edit=lambda: claim.addSources(sources, summary='Adding 1 reference'), description='%s: Adding 1 reference' % self.page.getID())
 			print('Reference/Source added successfully.\n')
 
 		return 0
 
-	def addQualifiers(self, repo=repo, prop_id='', prop_value='', claim='', qualifier_id='', qualval='', qualval_id='', status=0):
+	@tracing.traced()
+	def addQualifiers(self, repo=None, prop_id='', prop_value='', claim='', qualifier_id='', qualval='', qualval_id='', status=0):
 		"""
 		Adds a qualifier
 
@@ -957,10 +1455,11 @@ class WdPage:
 		@type of all (except repo and claim): string
 
 		"""
+		repo = repo or getRepo()
 		if prop_id and prop_value:
 			try:
-				new_prop_val = pywikibot.ItemPage(enwd, prop_value)
-				claim = pywikibot.Claim(enwd, prop_id)	
+				new_prop_val = pywikibot.ItemPage(getEnwd(), prop_value)
+				claim = pywikibot.Claim(getEnwd(), prop_id)	
 				claim.setTarget(new_prop_val)
 			except:
 				print('Incorrect property id or value provided.\n')
@@ -977,8 +1476,7 @@ class WdPage:
 		if repo and claim and qualifier_id:
 			qualifier = pywikibot.Claim(repo, qualifier_id)
 			qualifier.setTarget(qualifier_val)
-			claim.addQualifier(qualifier, summary='Adding 1 qualifier')
-			self.page = pywikibot.ItemPage(enwd, self.wd_value)
+			self.submitQualifier(claim=claim, qualifier=qualifier)
 			print('Qualifier added successfully.\n')
 
 		return 0
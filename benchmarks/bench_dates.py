@@ -0,0 +1,83 @@
+# File name: benchmarks/bench_dates.py
+# Dates/sec of plain dateparser.parse (as the scripts used to call it) vs date_normalizer,
+# cold (first parse of each string) and warm (the same strings again, as in the per-claim loops)
+#
+# usage: python -m benchmarks.bench_dates [--dates N]
+
+import argparse
+import random
+import time
+
+import dateparser
+
+import date_normalizer
+
+FORMS = [
+	'{{birth date|%(y)d|%(m)d|%(d)d}}',
+	'{{Start date|%(y)d|%(m)d|%(d)d|df=y}}',
+	'%(d)d %(month)s %(y)d',
+	'%(month)s %(d)d, %(y)d',
+	'%(month)s %(y)d',
+	'%(y)d',
+	'%(y)d-%(m)02d-%(d)02d',
+]
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December']
+
+
+def makeDates(count=1000):
+	random.seed(0)
+	dates = list()
+	for i in range(count):
+		m = random.randint(1, 12)
+		values = {'y': random.randint(1700, 2020), 'm': m, 'd': random.randint(1, 28), 'month': MONTHS[m - 1]}
+		dates.append(random.choice(FORMS) % values)
+	return dates
+
+def oldParse(text=''):
+	""" What val_parser/addDate did: split into words, dateparser on the words """
+	date = text.split()
+	if len(date) == 3:
+		value = dateparser.parse(str(date[0])+' '+str(date[1])+' '+str(date[2]))
+		return str(value.year) + '-' + str(value.month) + '-' + str(value.day)
+	elif len(date) == 2:
+		value = dateparser.parse(str(date[0])+' '+str(date[1]))
+		return str(value.year) + '-' + str(value.month)
+	elif len(date) == 1:
+		value = dateparser.parse(str(date[0]))
+		return str(value.year)
+
+def newParse(text=''):
+	return date_normalizer.to_string(date_normalizer.parse_date(text))
+
+def run(parse, dates):
+	start = time.perf_counter()
+	for date in dates:
+		try:
+			parse(date)
+		except:
+			pass
+	return len(dates) / (time.perf_counter() - start)
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--dates', type=int, default=1000)
+	args = parser.parse_args()
+
+	dates = makeDates(args.dates)
+	# forms dateparser understands without the template syntax
+	plain = [date for date in dates if not date.startswith('{{')]
+
+	print('%d dates (%d without templates)' % (len(dates), len(plain)))
+	before = run(oldParse, plain)
+	print('dateparser (plain dates):          %10.0f dates/s' % before)
+	date_normalizer.parse_date.cache_clear()
+	cold = run(newParse, dates)
+	print('date_normalizer, cold (all forms): %10.0f dates/s' % cold)
+	warm = run(newParse, dates)
+	print('date_normalizer, warm (memoized):  %10.0f dates/s' % warm)
+	print('dateparser fallbacks: %d' % date_normalizer.fallback_calls)
+	print('speed-up: %.0fx cold, %.0fx warm' % (cold / before, warm / before))
+	return 0
+
+if __name__ == "__main__":
+	main()
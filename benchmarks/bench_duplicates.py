@@ -0,0 +1,135 @@
+# File name: benchmarks/bench_duplicates.py
+# Soccerway duplicate checks/sec: one SPARQL query per player (the old checkDuplicate) vs the
+# prefetched property_values.ValueIndex, against a local SPARQL stand-in
+#
+# usage: python -m benchmarks.bench_duplicates [--ids N] [--players N] [--latency MS]
+#        python -m benchmarks.bench_duplicates --serve [--port N]   (stand-in only, for test runs
+#        with WMF_SPARQL_ENDPOINT=http://127.0.0.1:N/sparql)
+
+import argparse
+import http.server
+import json
+import re
+import threading
+import time
+import urllib.parse
+
+import http_client
+import property_values
+
+PROP_ID = 'P2369'
+
+
+class SparqlStandIn(http.server.BaseHTTPRequestHandler):
+	"""
+	Answers the two query shapes of the duplicate check from an in-memory
+	{value: QID} table: every value of a property, or the items with one
+	value (FILTER (?var = "value"))
+
+	"""
+
+	protocol_version = 'HTTP/1.1'
+	disable_nagle_algorithm = True
+	values = dict()
+	# simulated query service time
+	latency = 0.0
+
+	def do_GET(self):
+		params = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+		query = params.get('query', [''])[0]
+		m = re.search(r'\?item\s+wdt:P\d+\s+\?(\w+)', query)
+		if not m:
+			self.send_error(400, 'Unsupported query')
+			return
+		variable = m.group(1)
+		wanted = re.search(r'FILTER\s*\(\s*\?%s\s*=\s*"([^"]*)"\s*\)' % variable, query)
+
+		time.sleep(self.latency)
+		if wanted:
+			rows = [(wanted.group(1), self.values[wanted.group(1)])] if wanted.group(1) in self.values else []
+		else:
+			rows = self.values.items()
+		bindings = [{'item': {'type': 'uri', 'value': 'http://www.wikidata.org/entity/%s' % qid},
+					variable: {'type': 'literal', 'value': value}} for value, qid in rows]
+		body = json.dumps({'head': {'vars': ['item', variable]}, 'results': {'bindings': bindings}}).encode('utf-8')
+
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/sparql-results+json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		pass
+
+
+def makeValues(count):
+	return dict(('player-%d/%d' % (i, 100000 + i), 'Q%d' % (1000 + i)) for i in range(count))
+
+def startStandIn(values, latency=0.0, port=0):
+	SparqlStandIn.values = values
+	SparqlStandIn.latency = latency
+	server = http.server.ThreadingHTTPServer(('127.0.0.1', port), SparqlStandIn)
+	server.daemon_threads = True
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server, 'http://127.0.0.1:%d/sparql' % server.server_address[1]
+
+def perPlayer(endpoint, players):
+	""" The old checkDuplicate: one query per player """
+	found = 0
+	for soccerway_id in players:
+		query = 'SELECT ?item WHERE { ?item wdt:'+ PROP_ID +' ?id . FILTER (?id = "'+ soccerway_id +'") . } LIMIT 10'
+		if property_values.runQuery(query=query, endpoint=endpoint):
+			found += 1
+	return found
+
+def prefetched(endpoint, players):
+	index = property_values.ValueIndex(prop_id=PROP_ID, endpoint=endpoint)
+	found = 0
+	for soccerway_id in players:
+		if soccerway_id in index:
+			found += 1
+		else:
+			index.add(soccerway_id)
+	return found
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--ids', type=int, default=50000, help='values of the property on the stand-in')
+	parser.add_argument('--players', type=int, default=300, help='players checked (half of them already have an ID)')
+	parser.add_argument('--latency', type=float, default=50.0, help='simulated query time (ms)')
+	parser.add_argument('--serve', action='store_true', help='only run the stand-in')
+	parser.add_argument('--port', type=int, default=0)
+	args = parser.parse_args()
+
+	values = makeValues(args.ids)
+	server, endpoint = startStandIn(values, latency=args.latency / 1000.0, port=args.port)
+	if args.serve:
+		print('SPARQL stand-in with %d values of %s: WMF_SPARQL_ENDPOINT=%s' % (len(values), PROP_ID, endpoint))
+		try:
+			while True:
+				time.sleep(3600)
+		except KeyboardInterrupt:
+			return 0
+
+	http_client.configure(cache=None)
+	existing = list(values)[:args.players // 2]
+	players = existing + ['new-player-%d/%d' % (i, 900000 + i) for i in range(args.players - len(existing))]
+
+	results = list()
+	for name, check in [('per-player queries', perPlayer), ('prefetched set', prefetched)]:
+		start = time.perf_counter()
+		found = check(endpoint, players)
+		elapsed = time.perf_counter() - start
+		results.append((name, found, elapsed))
+		print('%-20s %6d players %6d duplicates %8.2f s %10.1f checks/sec' % (name, len(players), found, elapsed, len(players) / elapsed))
+
+	if results[0][1] != results[1][1]:
+		print('Duplicate counts differ!')
+		return 1
+	print('speedup: %.1fx' % (results[0][2] / results[1][2]))
+	server.shutdown()
+	return 0
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,97 @@
+# File name: benchmarks/bench_http.py
+# Requests/sec of the old per-call urllib fetch vs the pooled http_client session,
+# against a local HTTP/1.1 stand-in
+#
+# usage: python -m benchmarks.bench_http [--requests N] [--threads N] [--connect-delay MS]
+
+import argparse
+import gzip
+import http.server
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import http_client
+
+# roughly the size of a wbsearchentities xml reply
+BODY = (b'<?xml version="1.0"?><api success="1"><search>'
+		+ b''.join(b'<entity id="Q%d" title="Q%d" label="Example %d" />' % (i, i, i) for i in range(50))
+		+ b'</search></api>')
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+	""" Keep-alive handler with a simulated connection setup (TCP + TLS) cost """
+
+	protocol_version = 'HTTP/1.1'
+	# like production servers: no Nagle delay between headers and body
+	disable_nagle_algorithm = True
+	connect_delay = 0.0
+
+	def setup(self):
+		time.sleep(self.connect_delay)
+		super().setup()
+
+	def do_GET(self):
+		body = BODY
+		self.send_response(200)
+		self.send_header('Content-Type', 'text/xml; charset=utf-8')
+		if 'gzip' in self.headers.get('Accept-Encoding', ''):
+			body = gzip.compress(body)
+			self.send_header('Content-Encoding', 'gzip')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		pass
+
+
+def urllibFetch(url):
+	""" The fetch getURL used to do: one new connection per call """
+	req = urllib.request.Request(url, headers={ 'User-Agent': http_client.USER_AGENT })
+	return urllib.request.urlopen(req, timeout=30).read().strip().decode('utf-8')
+
+def pooledFetch(url):
+	return http_client.getURL(url)
+
+def run(fetch, url, requests, threads):
+	start = time.perf_counter()
+	if threads > 1:
+		with ThreadPoolExecutor(max_workers=threads) as executor:
+			list(executor.map(fetch, [url] * requests))
+	else:
+		for i in range(requests):
+			fetch(url)
+	return requests / (time.perf_counter() - start)
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--requests', type=int, default=500)
+	parser.add_argument('--threads', type=int, default=1)
+	parser.add_argument('--connect-delay', type=float, default=20.0, help='simulated connection setup cost (ms)')
+	args = parser.parse_args()
+
+	StandInHandler.connect_delay = args.connect_delay / 1000.0
+	server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+	server.daemon_threads = True
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	url = 'http://127.0.0.1:%d/w/api.php?action=wbsearchentities&search=Example' % server.server_address[1]
+
+	http_client.configure(max_per_host=max(args.threads, 1), cache=None)
+	if pooledFetch(url) != urllibFetch(url):
+		print('Responses differ!')
+		return 1
+
+	print('%d requests, %d thread(s), %.0f ms connection setup' % (args.requests, args.threads, args.connect_delay))
+	before = run(urllibFetch, url, args.requests, args.threads)
+	print('urllib (new connection per call): %8.1f req/s' % before)
+	after = run(pooledFetch, url, args.requests, args.threads)
+	print('http_client (pooled keep-alive):  %8.1f req/s' % after)
+	print('speed-up: %.1fx' % (after / before))
+
+	server.shutdown()
+	return 0
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,83 @@
+# File name: benchmarks/bench_import.py
+# Import time of base_ops and the scripts, each in a fresh interpreter, optionally
+# compared with another git revision of the repository
+#
+# usage: python -m benchmarks.bench_import [--repeat N] [--baseline REV] [module ...]
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+MODULES = [
+	'search_patterns',
+	'template_parser',
+	'date_normalizer',
+	'base_ops',
+	'ships',
+	'import_soccerway_id',
+	'guerrilla_movements',
+	'list_folk_heroes',
+	'historicplaces_riverhead_ny',
+	'msft_codenames',
+]
+
+TIMER = 'import time; start = time.perf_counter(); import %s; print(time.perf_counter() - start)'
+
+
+def importTime(module='', directory='.', repeat=5):
+	"""
+	Median import time (seconds) of a module, or the last line of the error
+	if it cannot be imported
+
+	"""
+	# pywikibot runs without a user-config.py; the timing does not depend on it
+	env = dict(os.environ, PYWIKIBOT_NO_USER_CONFIG='1')
+	times = list()
+	for i in range(repeat):
+		result = subprocess.run([sys.executable, '-c', TIMER % module], cwd=directory, env=env,
+								capture_output=True, text=True, timeout=300)
+		lines = result.stdout.strip().splitlines()
+		if result.returncode != 0 or not lines:
+			error = (result.stderr.strip().splitlines() or ['exit code %d' % result.returncode])[-1]
+			return error
+		times.append(float(lines[-1]))
+	return statistics.median(times)
+
+def exportRevision(revision='', directory=''):
+	archive = subprocess.run(['git', 'archive', revision], capture_output=True, check=True)
+	subprocess.run(['tar', '-x', '-C', directory], input=archive.stdout, check=True)
+
+def show(value):
+	if isinstance(value, float):
+		return '%8.0f ms' % (value * 1000)
+	return 'failed: %s' % value[:60]
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('modules', nargs='*', default=MODULES)
+	parser.add_argument('--repeat', type=int, default=5)
+	parser.add_argument('--baseline', default='', help='git revision to compare with')
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as baseline_dir:
+		if args.baseline:
+			exportRevision(args.baseline, baseline_dir)
+			print('%-32s %-12s %s' % ('module', 'current', args.baseline))
+		else:
+			print('%-32s %s' % ('module', 'current'))
+
+		for module in args.modules:
+			current = importTime(module=module, repeat=args.repeat)
+			if args.baseline:
+				before = importTime(module=module, directory=baseline_dir, repeat=args.repeat)
+				print('%-32s %-12s %s' % (module, show(current), show(before)))
+			else:
+				print('%-32s %s' % (module, show(current)))
+
+	return 0
+
+if __name__ == "__main__":
+	main()
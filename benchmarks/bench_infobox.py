@@ -0,0 +1,93 @@
+# File name: benchmarks/bench_infobox.py
+# Infoboxes/sec of the old per-key regex scans vs the single-pass tokenizer in
+# search_patterns.infobox, on generated infoboxes of growing size
+#
+# usage: python -m benchmarks.bench_infobox [--params N [N ...]] [--repeat N]
+
+import argparse
+import contextlib
+import io
+import re
+import time
+
+import search_patterns
+
+# kinds of values found in real infoboxes
+VALUES = [
+	'[[New York City|New York]]',
+	'Example value %d',
+	'{{coord|40|51|N|72|40|W|display=inline,title}}',
+	'{{plainlist|\n* a\n* b\n}}',
+	'A<br>B<ref>citation %d</ref>',
+	'%d',
+]
+
+
+def makeInfobox(params=10):
+	""" Infobox with `params` distinct keys, followed by some article text """
+	lines = ['{{Infobox building']
+	for i in range(params):
+		key = 'param_' + ''.join(chr(ord('a') + int(digit)) for digit in str(i))
+		value = VALUES[i % len(VALUES)]
+		if '%d' in value:
+			value = value % i
+		lines.append('| %s = %s' % (key, value))
+	lines.append('}}')
+	lines.append('Lorem ipsum [[dolor]] sit amet. ' * (params * 4))
+	return '\n'.join(lines)
+
+
+def legacyValue(page_text='', word=''):
+	""" search_infobox_value before the tokenizer: two findall over the text per key """
+	found_items = re.findall(r'\|\s*%s\s*\=\s*{{coord\|(.*)}}' % word, page_text, re.IGNORECASE)
+	if not found_items:
+		found_items = re.findall(r'\|\s*%s\s*\=\s*([^\n\{\}\|\/]{1,}[\w\)]{1,})' % word, page_text, re.IGNORECASE)
+	if found_items:
+		return search_patterns.val_parser(code=1, found_items=found_items)
+	return 0
+
+def legacyInfobox(page_text=''):
+	properties = re.findall(r'\|\s*([A-Z_]{3,})\s*\=\s*', page_text, re.IGNORECASE)
+	propval_pair = dict()
+	for prop in properties:
+		value = legacyValue(page_text=page_text, word=prop)
+		try:
+			if len(value) == 1:
+				propval_pair[str(prop)] = value[0]
+			else:
+				propval_pair[str(prop)] = value
+		except:
+			pass
+	return propval_pair
+
+def tokenizedInfobox(page_text=''):
+	with contextlib.redirect_stdout(io.StringIO()):
+		return search_patterns.infobox(page_text=page_text, check_all='y')
+
+def run(parse, page_text, repeat):
+	start = time.perf_counter()
+	for i in range(repeat):
+		parse(page_text)
+	return repeat / (time.perf_counter() - start)
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--params', type=int, nargs='+', default=[10, 50, 200, 500])
+	parser.add_argument('--repeat', type=int, default=20)
+	args = parser.parse_args()
+
+	print('%8s %10s %14s %14s %9s' % ('params', 'text (KB)', 'per-key (/s)', 'single (/s)', 'speed-up'))
+	for params in args.params:
+		page_text = makeInfobox(params)
+		if legacyInfobox(page_text) != tokenizedInfobox(page_text):
+			print('Results differ for %d params!' % params)
+			return 1
+
+		before = run(legacyInfobox, page_text, args.repeat)
+		after = run(tokenizedInfobox, page_text, args.repeat)
+		print('%8d %10.1f %14.1f %14.1f %8.1fx' % (params, len(page_text) / 1024.0, before, after, after / before))
+
+	return 0
+
+if __name__ == "__main__":
+	main()
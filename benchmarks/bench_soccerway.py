@@ -0,0 +1,113 @@
+# File name: benchmarks/bench_soccerway.py
+# Pages/sec of the old regex extraction of Soccerway search results (two findall passes kept
+# aligned by index, a third regex per row for the ID) and profiles (one regex per field) vs
+# the single-pass patterns of soccerway_parser, on generated and saved pages
+#
+# usage: python -m benchmarks.bench_soccerway [--rows N [N ...]] [--saved DIR] [--min-time S]
+
+import argparse
+import os
+import re
+import time
+
+import soccerway_parser
+
+# page furniture around the result table, roughly what the site sends
+HEADER = ('<!DOCTYPE html><html><head><title>Search - Soccerway</title>'
+		+ ''.join('<script type="text/javascript" src="/media/js/%d.js"></script>' % i for i in range(30))
+		+ '</head><body><div id="page"><div id="navigation"><ul>'
+		+ ''.join('<li><a href="/national/%d/" class="nav">Competition %d</a></li>' % (i, i) for i in range(200))
+		+ '</ul></div><table class="playerstats table"><thead><tr><th>Player</th><th>Team</th></tr></thead><tbody>')
+FOOTER = '</tbody></table><div id="footer">' + '<p>Footer text</p>' * 50 + '</div></body></html>'
+
+# one cell per line, as the site sends them (the old greedy patterns depend on it)
+ROW = ('<tr class="%s">\n<td class="player"><a href="/players/player-%d-name/%d/" class="flag_16 left_16 england_16_left">'
+		'Player%d Name</a></td>\n<td class="team"><a href="/teams/england/club-%d/%d/" class="flag_16 left_16">Club %d</a></td>\n</tr>\n')
+
+PROFILE = (HEADER + '</tbody></table><div class="block_player_passport"><dl>'
+		+ '\n<dt>First name</dt>\n<dd data-first_name="first_name">John</dd>'
+		+ '\n<dt>Last name</dt>\n<dd data-last_name="last_name">Smith</dd>'
+		+ '\n<dt>Nationality</dt>\n<dd data-nationality="nationality">England</dd>'
+		+ '\n<dt>Date of birth</dt>\n<dd data-date_of_birth="date_of_birth">12 March 1990</dd>'
+		+ '\n<dt>Position</dt>\n<dd data-position="position">Midfielder</dd>\n</dl></div>'
+		+ '<table class="playerstats career">' + '<tr><td class="season">2019/2020</td><td class="team">Club</td><td>30</td></tr>' * 300
+		+ '</table>' + FOOTER)
+
+
+def makeSearchPage(rows=50):
+	return HEADER + ''.join(ROW % ('odd' if i % 2 else 'even', i, 100000 + i, i, i, i, i) for i in range(rows)) + FOOTER
+
+
+def legacySearch(raw=''):
+	""" searchPlayer/getId before soccerway_parser: (soccerway_id, display_name) of every row """
+	players = re.findall(r'<td class="player"><a href="[\/\-\w]*" class="[\_\s\/\-\w]*">.*</a></td>', raw, re.IGNORECASE)
+	names = re.findall(r'<td class="player"><a href="[\/\-\w]*" class="[\_\s\/\-\w]*">(.*)</a></td>', raw, re.IGNORECASE)
+	records = list()
+	for i, name in enumerate(names):
+		soccerway_id = re.findall(r'<td class="player"><a href="/players/([\/\-\w]*)" class="[\_\s\/\-\w]*">.*</a></td>', players[i], re.IGNORECASE)
+		records.append((soccerway_id[0].strip('/'), name))
+	return records
+
+def newSearch(raw=''):
+	return [(record.soccerway_id, record.display_name) for record in soccerway_parser.iter_search_results(raw)]
+
+def legacyProfile(raw=''):
+	""" checkAuthenticity/birthDate before soccerway_parser: one regex per field """
+	fields = dict()
+	for field, pattern in [('first_name', r'<dd data-first_name="first_name">(.*)</dd>'),
+							('last_name', r'<dd data-last_name="last_name">(.*)</dd>'),
+							('date_of_birth', r'<dd data-date_of_birth="date_of_birth">([\w\s]*)</dd>')]:
+		found = re.findall(pattern, raw, re.IGNORECASE)
+		if found:
+			fields[field] = found[0]
+	return fields
+
+def newProfile(raw=''):
+	fields = soccerway_parser.parse_profile(raw)
+	return dict((field, fields[field]) for field in ['first_name', 'last_name', 'date_of_birth'] if field in fields)
+
+
+def rate(function, raw, min_time):
+	""" Calls/sec of function(raw), repeated for at least min_time seconds """
+	calls = 0
+	start = time.perf_counter()
+	while True:
+		function(raw)
+		calls += 1
+		elapsed = time.perf_counter() - start
+		if elapsed >= min_time:
+			return calls / elapsed
+
+def compare(label, raw, legacy, new, min_time):
+	same = legacy(raw) == new(raw)
+	old_rate = rate(legacy, raw, min_time)
+	new_rate = rate(new, raw, min_time)
+	print('%-28s %8d KB %12.1f %12.1f %8.2fx %s' % (label, len(raw) // 1024, old_rate, new_rate, new_rate / old_rate,
+														'' if same else '(results differ)'))
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--rows', type=int, nargs='+', default=[10, 100, 1000, 5000], help='rows of the generated search pages')
+	parser.add_argument('--saved', default='', help='directory of saved search result (search*.html) and profile pages (*.html)')
+	parser.add_argument('--min-time', type=float, default=1.0)
+	args = parser.parse_args()
+
+	print('%-28s %11s %12s %12s %9s' % ('page', 'size', 'regex/sec', 'parser/sec', 'speedup'))
+	for rows in args.rows:
+		compare('search, %d rows' % rows, makeSearchPage(rows), legacySearch, newSearch, args.min_time)
+	compare('profile', PROFILE, legacyProfile, newProfile, args.min_time)
+
+	if args.saved:
+		for name in sorted(os.listdir(args.saved)):
+			if not name.endswith('.html'):
+				continue
+			with open(os.path.join(args.saved, name), encoding='utf-8', errors='replace') as f:
+				raw = f.read()
+			if name.startswith('search'):
+				compare(name, raw, legacySearch, newSearch, args.min_time)
+			else:
+				compare(name, raw, legacyProfile, newProfile, args.min_time)
+	return 0
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,402 @@
+# File name: benchmarks/bench_suite.py
+# Ops/sec and scaling of the infobox extraction functions (search_patterns, base_ops.calc_coord,
+# ships.searchInfobox) on sample and generated pages - 10 to 500 parameters, 1 KB to 500 KB -
+# with a regression gate against saved results or another git revision
+#
+# usage: python -m benchmarks.bench_suite [--quick] [--only TEXT] [--corpus DIR]
+#                                          [--save FILE] [--check FILE] [--baseline REV] [--tolerance F]
+
+import argparse
+import contextlib
+import importlib
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+PARAM_COUNTS = [10, 50, 200, 500]
+# KB, for a page with SIZE_PARAMS parameters padded with article text
+PAGE_SIZES = [1, 10, 100, 500]
+SIZE_PARAMS = 20
+
+# kinds of values found in real infoboxes ('date' ones get a date_ key)
+VALUES = [
+	'[[New York City|New York]]',
+	'Example value %(i)d',
+	'{{coord|40|51|N|72|40|W|display=inline,title}}',
+	'{{start date|%(y)d|%(m)d|%(d)d|df=y}}',
+	'{{plainlist|\n* a\n* b\n}}',
+	'A<br>B<ref>citation %(i)d</ref>',
+	'%(i)d',
+]
+
+# article text after the infobox: links, refs and templates, but no "|key =" of its own
+PROSE = ("'''Example''' was built by [[Harland and Wolff]] in [[Belfast]] and entered service in 1911.<ref>Smith (1998), p. 12.</ref> "
+		"She displaced {{convert|46328|LT|t}} and was {{convert|882|ft|9|in|m}} long. "
+		"After the [[First World War|war]] she returned to the [[North Atlantic]] route.\n\n")
+
+SHIP_PAGE = """{{Infobox ship begin}}
+{{Infobox ship image
+|Ship image=RMS Olympic.jpg
+|Ship caption=''Olympic'' in 1911
+}}
+{{Infobox ship career
+|Hide header=
+|Ship country=United Kingdom
+|Ship flag={{shipboxflag|United Kingdom|civil}}
+|Ship name=RMS ''Olympic''
+|Ship namesake=[[Mount Olympus]]
+|Ship owner=[[White Star Line]]
+|Ship port of registry=[[Liverpool]], England
+|Ship route=[[Southampton]] - [[Cherbourg]] - [[New York City|New York]]
+|Ship ordered=17 September 1908
+|Ship builder=[[Harland and Wolff]], [[Belfast]]
+|Ship yard number=400
+|Ship laid down=16 December 1908
+|Ship launched={{start date|1910|10|20|df=y}}
+|Ship completed=31 May 1911
+|Ship maiden voyage=14 June 1911
+|Ship in service=1911-1935
+|Ship identification=Official number 131346
+|Ship nickname=''Old Reliable''
+|Ship fate=Scrapped 1935-1937
+}}
+{{Infobox ship characteristics
+|Hide header=
+|Ship class=[[Olympic-class ocean liner|''Olympic''-class]] [[ocean liner]]
+|Ship tonnage={{GRT|45324}}
+|Ship length={{convert|882|ft|9|in|m|abbr=on}}
+|Ship beam={{convert|92|ft|6|in|m|abbr=on}}
+|Ship propulsion=Two four-cylinder triple-expansion steam engines
+|Ship speed={{convert|21|kn}}
+|Ship capacity=2,435 passengers
+}}
+"""
+
+NRHP_PAGE = """{{Infobox NRHP
+| name = Sylvester Manor
+| nrhp_type =
+| image = Sylvester Manor.jpg
+| caption = Manor house in 2008
+| location = 80 Manwaring Road, [[Shelter Island, New York]]
+| coordinates = {{coord|41|4|34|N|72|20|15|W|display=inline,title}}
+| built = 1735
+| architect = Unknown
+| architecture = [[Georgian architecture|Georgian]]
+| added = {{start date|1985|11|7}}
+| area = {{convert|243|acre}}
+| refnum = 85003002<ref name="nris">{{NRISref|version=2010a}}</ref>
+| designated_other1_date = 1992
+| governing_body = Private
+}}
+"""
+
+# name -> (text, key searched with search_infobox_value, key searched with date_val)
+SAMPLE_PAGES = {
+	'ship': (SHIP_PAGE + PROSE * 8, 'Ship builder', 'Ship launched'),
+	'nrhp': (NRHP_PAGE + PROSE * 8, 'architect', 'added'),
+}
+
+COORDS = {
+	'dms': ['40', '51', '12.5', 'N', '72', '40', '30', 'W'],
+	'dm': ['40', '51.25', 'N', '72', '40.5', 'W'],
+	'ns': ['40.8535', 'N', '72.675', 'W'],
+	'decimal': ['40.8535', '-72.675'],
+}
+
+# a scaling exponent this much higher than the baseline's fails the check
+EXPONENT_TOLERANCE = 0.25
+
+
+class Page:
+	""" Benchmark input: the text and the keys searched in it """
+
+	def __init__(self, text='', value_key='', date_key=''):
+		self.text = text
+		self.value_key = value_key
+		self.date_key = date_key
+
+
+def keyName(prefix='param', i=0):
+	return prefix + '_' + ''.join(chr(ord('a') + int(digit)) for digit in str(i))
+
+def makePage(params=10, size=0):
+	"""
+	Infobox with `params` distinct keys followed by article text, padded to
+	`size` KB if given
+
+	"""
+	lines = ['{{Infobox building']
+	value_keys = list()
+	date_keys = list()
+	for i in range(params):
+		value = VALUES[i % len(VALUES)] % {'i': i, 'y': 1700 + i % 300, 'm': i % 12 + 1, 'd': i % 28 + 1}
+		if 'date' in value:
+			key = keyName('date', i)
+			date_keys.append(key)
+		else:
+			key = keyName('param', i)
+			value_keys.append(key)
+		lines.append('| %s = %s' % (key, value))
+	lines.append('}}')
+
+	text = '\n'.join(lines) + '\n' + PROSE * 4
+	if size:
+		text += PROSE * max(0, (size * 1024 - len(text)) // len(PROSE))
+	return Page(text=text, value_key=value_keys[len(value_keys) // 2], date_key=date_keys[-1])
+
+def makeCorpus(directory=''):
+	"""
+	Inputs by axis: 'params' and 'size' (generated pages), 'page' (the samples
+	and the *.txt/*.wiki files of `directory`, searched for the keys of the
+	first infobox) and 'items' (lists of values for val_parser)
+
+	"""
+	corpus = {
+		'params': [(params, makePage(params=params)) for params in PARAM_COUNTS],
+		'size': [(size, makePage(params=SIZE_PARAMS, size=size)) for size in PAGE_SIZES],
+		'page': [(name, Page(*sample)) for name, sample in sorted(SAMPLE_PAGES.items())],
+		'items': [(count, ['[[Example %d]]<br>Value %d<ref>c</ref>' % (i, i) for i in range(count)]) for count in PARAM_COUNTS],
+	}
+	if directory:
+		search_patterns = module('search_patterns')
+		for file_name in sorted(os.listdir(directory)):
+			if not file_name.endswith(('.txt', '.wiki')):
+				continue
+			with open(os.path.join(directory, file_name), encoding='utf-8') as f:
+				text = f.read()
+			keys = search_patterns.search_infobox_prop(page_text=text) or ['name']
+			date_keys = [key for key in keys if 'date' in key.lower()] or keys
+			corpus['page'].append((os.path.splitext(file_name)[0], Page(text=text, value_key=keys[len(keys) // 2], date_key=date_keys[0])))
+	return corpus
+
+
+"""
+=====
+Cases
+=====
+"""
+def module(name=''):
+	""" The module, or None if it cannot be imported (e.g. in an older revision) """
+	try:
+		return importlib.import_module(name)
+	except Exception:
+		return None
+
+def firstInfobox(text=''):
+	template_parser = module('template_parser')
+	return template_parser.find_infoboxes(text)[0]
+
+def parsedInfobox(page=None):
+	""" What WpPage.findInfobox does: parse the page, then extract the first infobox """
+	search_patterns = module('search_patterns')
+	infobox = firstInfobox(page.text)
+	return search_patterns.infobox(page_text=infobox.text, check_all='y', template=infobox)
+
+def parsedShipInfoboxes(page=None):
+	""" What ships.main does: every infobox of the page through searchInfobox """
+	ships = module('ships')
+	template_parser = module('template_parser')
+	return [ships.searchInfobox(template=infobox) for infobox in template_parser.find_infoboxes(page.text)]
+
+def makeCases():
+	"""
+	Benchmarks as (name, axes, function of the input); functions missing
+	from the tree are left out
+
+	"""
+	search_patterns = module('search_patterns')
+	base_ops = module('base_ops')
+	ships = module('ships')
+	pages = ['params', 'size', 'page']
+
+	cases = list()
+	if search_patterns:
+		cases += [
+			('infobox', pages, lambda page: search_patterns.infobox(page_text=page.text, check_all='y')),
+			('search_infobox_value', pages, lambda page: search_patterns.search_infobox_value(page_text=page.text, word=page.value_key)),
+			('date_val', pages, lambda page: search_patterns.date_val(page_text=page.text, word=page.date_key)),
+			('val_parser', ['items'], lambda items: search_patterns.val_parser(code=1, found_items=items)),
+			('val_parser_date', [None], lambda x: search_patterns.val_parser(code=2, found_items=[('1921', '3', '12')])),
+		]
+	if module('template_parser') and search_patterns:
+		cases.append(('infobox_parsed', pages, parsedInfobox))
+	if base_ops:
+		cases += [('calc_coord_' + form, [None], lambda x, params=params: base_ops.calc_coord(params)) for form, params in sorted(COORDS.items())]
+		cases.append(('get_precision', [None], lambda x: base_ops.get_precision('40.8535')))
+	if ships:
+		cases.append(('ships.searchInfobox', pages, lambda page: ships.searchInfobox(text=page.text)))
+		if module('template_parser'):
+			cases.append(('ships.searchInfobox_parsed', pages, parsedShipInfoboxes))
+	return cases
+
+
+"""
+===========
+Measurement
+===========
+"""
+def measure(call=None, min_time=0.1, rounds=3):
+	""" Best ops/sec of `rounds` timings, each running `call` for at least `min_time` seconds """
+	timer = timeit.Timer(call)
+	number = 1
+	while True:
+		elapsed = timer.timeit(number)
+		if elapsed >= min_time:
+			break
+		number = max(number * 2, int(number * min_time / max(elapsed, 1e-9) * 1.2))
+
+	best = number / elapsed
+	for i in range(rounds - 1):
+		best = max(best, number / timer.timeit(number))
+	return best
+
+def exponent(points=None):
+	"""
+	Least-squares slope of log(time per op) over log(input size): ~1 for
+	linear scaling, ~2 for quadratic
+
+	"""
+	points = [(math.log(n), math.log(1.0 / ops)) for n, ops in points if ops]
+	if len(points) < 2:
+		return None
+	mean_x = sum(x for x, y in points) / len(points)
+	mean_y = sum(y for x, y in points) / len(points)
+	spread = sum((x - mean_x) ** 2 for x, y in points)
+	if not spread:
+		return None
+	return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+def runSuite(corpus=None, only='', min_time=0.1):
+	"""
+	Runs every case on every input of its axes
+
+	@return value: {'results': {'case axis=value': ops/sec or None if it
+				failed}, 'scaling': {'case axis': {'exponent': ..., 'largest':
+				key of the largest input}}}
+
+	"""
+	results = dict()
+	scaling = dict()
+	devnull = open(os.devnull, 'w')
+	for name, axes, function in makeCases():
+		if only and only not in name:
+			continue
+		for axis in axes:
+			inputs = corpus[axis] if axis else [('-', None)]
+			points = list()
+			for value, data in inputs:
+				key = '%s %s=%s' % (name, axis, value) if axis else name
+				try:
+					with contextlib.redirect_stdout(devnull):
+						function(data)
+						ops = measure(lambda: function(data), min_time=min_time)
+				except Exception as e:
+					print('%-48s failed: %s' % (key, e))
+					results[key] = None
+					continue
+				results[key] = ops
+				print('%-48s %14.1f ops/s' % (key, ops))
+				if axis in ['params', 'size', 'items']:
+					points.append((value, ops))
+			slope = exponent(points)
+			if slope is not None:
+				scaling['%s %s' % (name, axis)] = {'exponent': slope, 'largest': key}
+				print('%-48s %14s ~n^%.2f' % ('%s scaling over %s' % (name, axis), '', slope))
+	devnull.close()
+	return {'python': platform.python_version(), 'machine': platform.machine(), 'results': results, 'scaling': scaling}
+
+def runRevision(revision='', only='', min_time=0.1):
+	""" The suite run on another git revision of the repository (this script copied into it) """
+	with tempfile.TemporaryDirectory() as directory:
+		archive = subprocess.run(['git', 'archive', revision], capture_output=True, check=True)
+		subprocess.run(['tar', '-x', '-C', directory], input=archive.stdout, check=True)
+		os.makedirs(os.path.join(directory, 'benchmarks'), exist_ok=True)
+		shutil.copy(os.path.abspath(__file__), os.path.join(directory, 'benchmarks', 'bench_suite.py'))
+
+		output = os.path.join(directory, 'results.json')
+		command = [sys.executable, '-m', 'benchmarks.bench_suite', '--save', output, '--min-time', str(min_time)]
+		if only:
+			command += ['--only', only]
+		print('Running the suite on %s...' % revision)
+		subprocess.run(command, cwd=directory, check=True)
+		with open(output, encoding='utf-8') as f:
+			return json.load(f)
+
+def compare(current=None, baseline=None, tolerance=0.2):
+	"""
+	Prints the ratio of every result to the baseline's
+
+	@return value: number of results (and scaling exponents) that got
+				noticeably worse: ops/sec below (1 - tolerance) of the baseline,
+				or an exponent more than EXPONENT_TOLERANCE higher while the
+				largest input got slower (a higher exponent alone can just be a
+				constant cost that went away)
+
+	"""
+	regressions = 0
+	print('\n%-48s %14s %14s %8s' % ('benchmark', 'baseline', 'current', 'ratio'))
+	for key in sorted(current['results']):
+		now = current['results'][key]
+		before = baseline['results'].get(key)
+		if not now or not before:
+			continue
+		ratio = now / before
+		slower = ratio < 1 - tolerance
+		regressions += slower
+		print('%-48s %14.1f %14.1f %7.2fx%s' % (key, before, now, ratio, '  SLOWER' if slower else ''))
+
+	for key in sorted(current['scaling']):
+		now = current['scaling'][key]
+		before = baseline.get('scaling', dict()).get(key)
+		if before is None:
+			continue
+		largest_now = current['results'].get(now['largest'])
+		largest_before = baseline['results'].get(before['largest'])
+		slower = bool(largest_now and largest_before and largest_now < largest_before)
+		worse = slower and now['exponent'] - before['exponent'] > EXPONENT_TOLERANCE
+		regressions += worse
+		print('%-48s %14s %14s  n^%.2f -> n^%.2f%s' % (key + ' scaling', '', '', before['exponent'], now['exponent'], '  WORSE' if worse else ''))
+	return regressions
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--only', default='', help='run the benchmarks whose name contains this')
+	parser.add_argument('--corpus', default='', help='directory of article texts (*.txt, *.wiki) to add')
+	parser.add_argument('--min-time', type=float, default=0.1, help='seconds per timing round')
+	parser.add_argument('--quick', action='store_true', help='shorter timings (--min-time 0.02)')
+	parser.add_argument('--save', default='', help='write the results to this json file')
+	parser.add_argument('--check', default='', help='compare with results saved by --save')
+	parser.add_argument('--baseline', default='', help='compare with the suite run on this git revision')
+	parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown (0.2 = 20%%)')
+	args = parser.parse_args()
+	min_time = 0.02 if args.quick else args.min_time
+
+	current = runSuite(corpus=makeCorpus(args.corpus), only=args.only, min_time=min_time)
+	if args.save:
+		with open(args.save, 'w', encoding='utf-8') as f:
+			json.dump(current, f, indent=1, sort_keys=True)
+
+	baseline = None
+	if args.check:
+		with open(args.check, encoding='utf-8') as f:
+			baseline = json.load(f)
+	elif args.baseline:
+		baseline = runRevision(revision=args.baseline, only=args.only, min_time=min_time)
+	if baseline is None:
+		return 0
+
+	regressions = compare(current=current, baseline=baseline, tolerance=args.tolerance)
+	if regressions:
+		print('\n%d benchmark(s) got slower' % regressions)
+		return 1
+	print('\nNo regressions')
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
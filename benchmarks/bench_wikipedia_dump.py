@@ -0,0 +1,138 @@
+# File name: benchmarks/bench_wikipedia_dump.py
+# Article texts/sec read from a generated multistream dump: decompressing the whole dump to find
+# the titles, one stream decompressed per title (no cache, list order), and wikipedia_dump reading
+# the titles grouped by stream
+#
+# usage: python -m benchmarks.bench_wikipedia_dump [--pages N] [--titles N [N ...]] [--dir DIR]
+
+import argparse
+import bz2
+import html
+import os
+import random
+import tempfile
+import time
+
+import wikipedia_dump
+
+HEADER = '<mediawiki xml:lang="en">\n  <siteinfo>\n    <sitename>Wikipedia</sitename>\n  </siteinfo>\n'
+FOOTER = '</mediawiki>\n'
+
+PAGE = ('  <page>\n    <title>%s</title>\n    <ns>0</ns>\n    <id>%d</id>\n%s    <revision>\n      <id>%d</id>\n'
+		'      <parentid>%d</parentid>\n      <timestamp>2024-01-01T00:00:00Z</timestamp>\n'
+		'      <text bytes="%d" xml:space="preserve">%s</text>\n    </revision>\n  </page>\n')
+
+# an article with an infobox
+INFOBOX = ('{{Infobox military unit\n| name = Movement %d\n| founded = %d March 19%02d\n| country = [[Country %d]]\n'
+		'| leaders = [[Leader %d]] & [[Leader %d]]\n}}\n')
+WORDS = ['group', 'movement', 'war', 'the', 'of', 'and', 'in', 'was', 'founded', 'government', 'army', 'rebels',
+		'province', 'leader', 'attack', 'peace', 'agreement', 'party', 'national', 'liberation', 'front', 'forces']
+
+def makeText(i=0):
+	""" Text of article i, about 6 KB: varied enough words to compress like articles do (4-5x) """
+	rng = random.Random(i)
+	sentences = list()
+	for j in range(80):
+		words = [rng.choice(WORDS) + ('' if rng.random() < 0.7 else str(rng.randint(1, 2000))) for k in range(rng.randint(6, 14))]
+		sentences.append(' '.join(words).capitalize() + ('.<ref>Source %d, p. %d</ref>' % (rng.randint(1, 500), rng.randint(1, 300)) if j % 4 == 0 else '.'))
+	return INFOBOX % (i, i % 28 + 1, i % 100, i, i, i + 1) + '\n'.join(sentences)
+
+
+def makeDump(directory='', pages=10000, per_stream=100):
+	"""
+	Writes a multistream dump of `pages` articles (and its offsets file) as
+	the enwiki ones are laid out: a stream for the header, `per_stream`
+	pages per stream, a stream for the footer
+
+	@return value: (dump path, offsets path, titles)
+
+	"""
+	dump_path = os.path.join(directory, 'enwiki-20240101-pages-articles-multistream.xml.bz2')
+	offsets_path = wikipedia_dump.offsetsPathOf(dump_path)
+	titles = list()
+	with open(dump_path, 'wb') as dump, bz2.open(offsets_path, 'wt', encoding='utf-8') as offsets:
+		dump.write(bz2.compress(HEADER.encode('utf-8')))
+		for start in range(0, pages, per_stream):
+			offset = dump.tell()
+			xml = list()
+			for i in range(start, min(start + per_stream, pages)):
+				title = 'Movement %d: the "%d" group' % (i, i)
+				text = makeText(i)
+				redirect = ''
+				# every 50th page is a redirect to the previous one
+				if i % 50 == 49:
+					text = '#REDIRECT [[Movement %d: the "%d" group]]' % (i - 1, i - 1)
+					redirect = '    <redirect title="%s" />\n' % html.escape('Movement %d: the "%d" group' % (i - 1, i - 1))
+				xml.append(PAGE % (html.escape(title, quote=False), i + 1, redirect, 1000000 + i, 999999 + i, len(text), html.escape(text, quote=False)))
+				offsets.write('%d:%d:%s\n' % (offset, i + 1, title))
+				titles.append(title)
+			dump.write(bz2.compress(''.join(xml).encode('utf-8')))
+		dump.write(bz2.compress(FOOTER.encode('utf-8')))
+	return dump_path, offsets_path, titles
+
+
+def scanWhole(dump_path='', titles=''):
+	""" Texts of the titles found by decompressing the whole dump """
+	wanted = set(titles)
+	found = dict()
+	with bz2.open(dump_path, 'rt', encoding='utf-8') as f:
+		for record in wikipedia_dump.parse_pages(f.read()):
+			if record.title in wanted:
+				found[record.title] = record.text
+	return found
+
+def perTitle(dump_path='', index=None, titles=''):
+	""" Texts of the titles, one stream decompressed per title, in list order """
+	offsets = index.offsets(titles)
+	lengths = dict(index.db.execute('SELECT offset, length FROM streams').fetchall())
+	found = dict()
+	with open(dump_path, 'rb') as f:
+		for title in titles:
+			f.seek(offsets[title])
+			xml = bz2.BZ2Decompressor().decompress(f.read(lengths[offsets[title]])).decode('utf-8')
+			for record in wikipedia_dump.parse_pages(xml):
+				if record.title == title:
+					found[title] = record.text
+	return found
+
+def grouped(index_path='', titles=''):
+	""" Texts of the titles read by wikipedia_dump (fresh stream cache) """
+	dump = wikipedia_dump.MultistreamDump(path=index_path, max_age=float('inf'))
+	found = dict((title, record.text) for title, record in dump.records(titles))
+	dump.close()
+	return found
+
+
+def timed(function, *args):
+	start = time.perf_counter()
+	result = function(*args)
+	return result, time.perf_counter() - start
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--pages', type=int, default=10000, help='articles in the generated dump')
+	parser.add_argument('--titles', type=int, nargs='+', default=[50, 500, 2000], help='titles read (a random list)')
+	parser.add_argument('--dir', default='', help='directory for the dump (default: a temporary one)')
+	args = parser.parse_args()
+
+	directory = args.dir or tempfile.mkdtemp(prefix='bench_wikipedia_dump')
+	dump_path, offsets_path, titles = makeDump(directory=directory, pages=args.pages)
+	index_path = os.path.join(directory, 'wikipedia_dump.sqlite')
+	wikipedia_dump.build(dump_path=dump_path, path=index_path, offsets_path=offsets_path, progress=0)
+	index = wikipedia_dump.MultistreamDump(path=index_path, max_age=float('inf'))
+	print('%d articles, %.1f MB compressed' % (len(titles), os.path.getsize(dump_path) / 1048576.0))
+
+	print('%-8s %14s %14s %14s %9s' % ('titles', 'scan/sec', 'per title/sec', 'grouped/sec', 'speedup'))
+	rng = random.Random(0)
+	for count in args.titles:
+		wanted = [rng.choice(titles) for i in range(count)]
+		scanned, scan_time = timed(scanWhole, dump_path, wanted)
+		single, single_time = timed(perTitle, dump_path, index, wanted)
+		batch, batch_time = timed(grouped, index_path, wanted)
+		same = scanned == single == batch
+		print('%-8d %14.1f %14.1f %14.1f %8.1fx %s' % (count, count / scan_time, count / single_time, count / batch_time,
+													single_time / batch_time, '' if same else '(results differ)'))
+	return 0
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,215 @@
+# File name: cassette.py
+# Record/replay of the HTTP (http_client) and MediaWiki/Wikibase API (pywikibot) traffic of a run,
+# so runs can be repeated offline, deterministically and with injected latency
+
+import atexit
+import base64
+import collections
+import json
+import os
+import threading
+import time
+
+import http_cache
+import http_client
+
+RECORD = 'record'
+REPLAY = 'replay'
+
+# API parameters that differ between otherwise identical requests
+volatile_params = ['token', 'maxlag', 'requestid', 'curtimestamp']
+
+
+class CassetteMiss(Exception):
+	""" A request made while replaying was not recorded """
+
+
+class Cassette:
+	"""
+	Interactions of a run, stored as json lines
+
+	Responses are kept in recording order for every request, so a request
+	made several times (e.g. an item fetched before and after an edit) gets
+	the same sequence of responses when replayed; once they are used up the
+	last one is repeated.
+
+	@param path: cassette file
+	@param mode: RECORD (the file is started afresh) or REPLAY
+	@param latency: delay (seconds) added to every replayed request
+
+	"""
+
+	def __init__(self, path='', mode=REPLAY, latency=0.0):
+		self.path = path
+		self.mode = mode
+		self.latency = latency
+		self.lock = threading.Lock()
+		self.interactions = collections.defaultdict(list)
+		self.positions = collections.defaultdict(int)
+		self.stats = {'recorded': 0, 'replayed': 0, 'missed': 0}
+		self.file = None
+
+		if mode == RECORD:
+			directory = os.path.dirname(path)
+			if directory:
+				os.makedirs(directory, exist_ok=True)
+			self.file = open(path, 'w', encoding='utf-8')
+		else:
+			with open(path, encoding='utf-8') as f:
+				for line in f:
+					if line.strip():
+						interaction = json.loads(line)
+						self.interactions[(interaction['type'], interaction['key'])].append(interaction)
+
+	def record(self, kind='', key='', **response):
+		interaction = dict(response, type=kind, key=key)
+		with self.lock:
+			self.file.write(json.dumps(interaction, sort_keys=True) + '\n')
+			self.file.flush()
+			self.stats['recorded'] += 1
+
+	def replay(self, kind='', key=''):
+		""" Next recorded response to a request; raises CassetteMiss if there is none """
+		with self.lock:
+			responses = self.interactions.get((kind, key))
+			if not responses:
+				self.stats['missed'] += 1
+				raise CassetteMiss('%s request not in %s: %s' % (kind, self.path, key))
+			position = self.positions[(kind, key)]
+			self.positions[(kind, key)] = position + 1
+			self.stats['replayed'] += 1
+		if self.latency:
+			time.sleep(self.latency)
+		return responses[min(position, len(responses) - 1)]
+
+	def close(self):
+		if self.file is not None:
+			self.file.close()
+			self.file = None
+
+	def printStats(self):
+		print('Cassette %s (%s): %d recorded, %d replayed, %d missed' % (
+			self.path, self.mode, self.stats['recorded'], self.stats['replayed'], self.stats['missed']))
+
+
+def apiKey(request=None):
+	""" Site and sorted parameters of a pywikibot api.Request """
+	try:
+		items = request._encoded_items()
+	except:
+		items = dict((key, '|'.join(str(value) for value in values)) for key, values in request._params.items())
+	params = list()
+	for key in sorted(items):
+		if key in volatile_params:
+			continue
+		value = items[key]
+		if isinstance(value, bytes):
+			value = value.decode('utf-8', errors='replace')
+		params.append('%s=%s' % (key, value))
+	return '%s?%s' % (request.site, '&'.join(params))
+
+
+"""
+=====
+Hooks
+=====
+"""
+active = None
+originals = dict()
+# set while a hooked call runs, so that CachedRequest.submit -> Request.submit is recorded once
+nested = threading.local()
+
+def sessionGet(session, url='', headers=None, retry=True, timeout=None):
+	""" http_client.Session.get through the cassette (in front of the response cache) """
+	key = http_cache.normalizeURL(url)
+	if active.mode == REPLAY:
+		interaction = active.replay('http', key)
+		if interaction['status'] is None:
+			return None
+		return http_client.Response(url=url, status=interaction['status'], headers=interaction['headers'],
+									body=base64.b64decode(interaction['body']))
+
+	response = originals['get'](session, url=url, headers=headers, retry=retry, timeout=timeout)
+	if response is None:
+		active.record('http', key, status=None)
+	else:
+		active.record('http', key, status=response.status, headers=response.headers,
+					body=base64.b64encode(response.body).decode('ascii'))
+	return response
+
+def wrapSubmit(submit):
+	def hookedSubmit(request):
+		""" pywikibot api.Request.submit through the cassette """
+		if getattr(nested, 'active', False):
+			return submit(request)
+
+		key = apiKey(request)
+		if active.mode == REPLAY:
+			return active.replay('api', key)['data']
+
+		nested.active = True
+		try:
+			data = submit(request)
+		finally:
+			nested.active = False
+		active.record('api', key, data=data)
+		return data
+	return hookedSubmit
+
+def install(path='', mode=REPLAY, latency=0.0):
+	"""
+	Sends the run's traffic through a cassette
+
+	@param path: cassette file
+	@param mode: RECORD or REPLAY
+	@param latency: delay (seconds) added to every replayed request
+
+	"""
+	global active
+	if mode not in [RECORD, REPLAY]:
+		raise ValueError('Cassette mode must be %r or %r, not %r' % (RECORD, REPLAY, mode))
+	uninstall()
+	active = Cassette(path=path, mode=mode, latency=latency)
+
+	originals['get'] = http_client.Session.get
+	http_client.Session.get = sessionGet
+	try:
+		from pywikibot.data import api
+		originals['submit'] = api.Request.submit
+		originals['cached_submit'] = api.CachedRequest.submit
+		api.Request.submit = wrapSubmit(originals['submit'])
+		api.CachedRequest.submit = wrapSubmit(originals['cached_submit'])
+	except ImportError:
+		pass
+
+	print('%s traffic %s %s' % ('Recording' if mode == RECORD else 'Replaying', 'to' if mode == RECORD else 'from', path))
+	return active
+
+def uninstall():
+	global active
+	if active is None:
+		return
+	http_client.Session.get = originals.pop('get')
+	if 'submit' in originals:
+		from pywikibot.data import api
+		api.Request.submit = originals.pop('submit')
+		api.CachedRequest.submit = originals.pop('cached_submit')
+	active.close()
+	active = None
+
+def installFromEnvironment():
+	"""
+	Installs the cassette named by $WMF_CASSETTE, if any
+
+	$WMF_CASSETTE_MODE: 'record' or 'replay' (default)
+	$WMF_CASSETTE_LATENCY: milliseconds added to every replayed request
+
+	"""
+	path = os.environ.get('WMF_CASSETTE', '')
+	if not path or active is not None:
+		return active
+	mode = os.environ.get('WMF_CASSETTE_MODE', REPLAY).lower()
+	latency = float(os.environ.get('WMF_CASSETTE_LATENCY', 0)) / 1000.0
+	cassette = install(path=path, mode=mode, latency=latency)
+	atexit.register(cassette.printStats)
+	return cassette
@@ -0,0 +1,165 @@
+# File name: date_normalizer.py
+# Fast, memoized parsing of the date forms found in infoboxes into (year, month, day, precision),
+# falling back to dateparser (English only) for anything else
+
+import calendar
+import functools
+import re
+
+# WbTime precisions
+YEAR = 9
+MONTH = 10
+DAY = 11
+
+months = {
+	'january': 1, 'february': 2, 'march': 3, 'april': 4, 'may': 5, 'june': 6,
+	'july': 7, 'august': 8, 'september': 9, 'october': 10, 'november': 11, 'december': 12,
+	'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'jun': 6, 'jul': 7, 'aug': 8,
+	'sep': 9, 'sept': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+}
+
+month_names = '|'.join(sorted(months, key=len, reverse=True))
+# whitespace and separators ignored around the numbers
+iso_pattern = re.compile(r'(\d{1,4})-(\d{1,2})(?:-(\d{1,2}))?')
+numeric_pattern = re.compile(r'(\d{3,4})(?:\s+(\d{1,2}))?(?:\s+(\d{1,2}))?')
+day_month_year_pattern = re.compile(r'(\d{1,2})(?:st|nd|rd|th)?\s+(%s)\.?,?\s+(\d{1,4})' % month_names, re.IGNORECASE)
+month_day_year_pattern = re.compile(r'(%s)\.?\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{1,4})' % month_names, re.IGNORECASE)
+month_year_pattern = re.compile(r'(%s)\.?,?\s+(\d{1,4})' % month_names, re.IGNORECASE)
+# {{birth date|1921|3|12}}, {{start date|df=y|1850|2}}, ...
+template_pattern = re.compile(r'\{\{\s*[^\{\}\|]*\|([^\{\}]*)\}\}')
+number_pattern = re.compile(r'\d{1,4}')
+
+cache_size = 4096
+fallback_calls = 0
+
+
+def make_date(year='', month='', day=''):
+	""" (year, month, day, precision) from the matched strings, None if out of range """
+	year = int(year)
+	if not month:
+		return (year, None, None, YEAR)
+	month = int(month)
+	if not 1 <= month <= 12:
+		return None
+	if not day:
+		return (year, month, None, MONTH)
+	day = int(day)
+	# calendar.monthrange() does not take year 0
+	if not 1 <= day <= calendar.mdays[month] + (month == 2 and calendar.isleap(year)):
+		return None
+	return (year, month, day, DAY)
+
+def parse_template(params=''):
+	""" Date of the leading numeric positional parameters of a date template """
+	numbers = list()
+	for param in params.split('|'):
+		param = param.strip()
+		if '=' in param:
+			continue
+		if not number_pattern.fullmatch(param):
+			break
+		numbers.append(param)
+		if len(numbers) == 3:
+			break
+	if not numbers:
+		return None
+	return make_date(*numbers)
+
+def parse_fallback(text=''):
+	"""
+	dateparser, English only; the precision follows the number of words as
+	in the scripts (3 - day, 2 - month, 1 - year)
+
+	"""
+	global fallback_calls
+	import dateparser
+
+	fallback_calls += 1
+	value = dateparser.parse(text, languages=['en'])
+	if value is None:
+		return None
+	words = len(text.split())
+	if words >= 3:
+		return (value.year, value.month, value.day, DAY)
+	elif words == 2:
+		return (value.year, value.month, None, MONTH)
+	return (value.year, None, None, YEAR)
+
+@functools.lru_cache(maxsize=cache_size)
+def parse_date(text=''):
+	"""
+	Parses a date
+
+	Recognizes date templates ({{birth date|1921|3|12}}), ISO dates
+	(1921-03-12, 1921-3), "12 March 1921", "March 12, 1921", "March 1921",
+	"1921 3 12" and "1921"; anything else goes to dateparser.
+
+	@param text: the date as found in the article
+	@return value: (year, month, day, precision) - month and day are None
+				below their precision - or None if it is not a date
+
+	"""
+	text = text.strip().replace('[', '').replace(']', '')
+	if not text:
+		return None
+
+	m = template_pattern.fullmatch(text)
+	if m:
+		date = parse_template(m.group(1))
+		if date:
+			return date
+
+	m = iso_pattern.fullmatch(text)
+	if m:
+		date = make_date(*m.groups())
+		# "1921-22" is a range, not a month: left to the patterns below and dateparser
+		if date:
+			return date
+
+	m = numeric_pattern.fullmatch(text)
+	if m:
+		return make_date(*m.groups())
+
+	m = day_month_year_pattern.fullmatch(text)
+	if m:
+		return make_date(m.group(3), months[m.group(2).lower()], m.group(1))
+
+	m = month_day_year_pattern.fullmatch(text)
+	if m:
+		return make_date(m.group(3), months[m.group(1).lower()], m.group(2))
+
+	m = month_year_pattern.fullmatch(text)
+	if m:
+		return make_date(m.group(2), months[m.group(1).lower()])
+
+	try:
+		return parse_fallback(text)
+	except:
+		return None
+
+def to_string(date=None):
+	""" 'y-m-d', 'y-m' or 'y' (the format used by the scripts) """
+	year, month, day, precision = date
+	if precision >= DAY:
+		return '%d-%d-%d' % (year, month, day)
+	elif precision == MONTH:
+		return '%d-%d' % (year, month)
+	return str(year)
+
+def to_wbtime(date=None):
+	import pywikibot
+
+	year, month, day, precision = date
+	return pywikibot.WbTime(year=year, month=month, day=day, precision=precision)
+
+def same_date(date=None, wbtime=None):
+	""" Compares a parsed date with a WbTime, up to the lower of their precisions """
+	year, month, day, precision = date
+	precision = min(precision, getattr(wbtime, 'precision', DAY))
+	if year != wbtime.year:
+		return False
+	if precision >= MONTH and month != wbtime.month:
+		return False
+	if precision >= DAY and day != wbtime.day:
+		return False
+	return True
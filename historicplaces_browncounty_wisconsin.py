@@ -3,13 +3,12 @@
 
 import re
 import pywikibot
-import dateparser
-import time
 import urllib
-import urllib.request
 import urllib.parse
 import base_ops as base
+import plan
 import search_patterns
+import tracing
 
 # properties to be imported
 prop_ids = {
@@ -29,40 +28,21 @@ identifier = ['P649']
 single_values = ['P131', 'P625', 'P649']
 
 lang = 'en'
-enwd = pywikibot.Site("wikidata", "wikidata")
-repo = enwd.data_repository()
-
 
 """ 
 =====================================
 Searching and creating Wikidata Items
 =====================================
 """
-def getURL(url='', retry=True, timeout=30):
-	raw = ''
-	req = urllib.request.Request(url, headers={ 'User-Agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:55.0) Gecko/20100101 Firefox/55.0' })
-	try:
-		raw = urllib.request.urlopen(req, timeout=timeout).read().strip().decode('utf-8')
-	except:
-		sleep = 10 # seconds
-		maxsleep = 100
-		while retry and sleep <= maxsleep:
-			print('Error while retrieving: %s' % (url))
-			print('Retry in %s seconds...' % (sleep))
-			time.sleep(sleep)
-			try:
-				raw = urllib.request.urlopen(req, timeout=timeout).read().strip().decode('utf-8')
-			except:
-				pass
-			sleep = sleep * 2
-	return raw
+def searchURL(article_name=''):
+	""" wbsearchentities url of an article's name """
+	article_name_ = article_name.split('(')[0].strip()
+	return 'https://www.wikidata.org/w/api.php?action=wbsearchentities&search=%s&language=en&format=xml' % (urllib.parse.quote(article_name_))
 
 def searchWdPage(article_name=''):
 	""" Searches for a Wp article in Wd """ 
 
-	article_name_ = article_name.split('(')[0].strip()
-	searchitemurl = 'https://www.wikidata.org/w/api.php?action=wbsearchentities&search=%s&language=en&format=xml' % (urllib.parse.quote(article_name_))
-	raw = getURL(searchitemurl)
+	raw = base.getURL(searchURL(article_name))
 
 	if not '<search />' in raw:
 		return 1
@@ -71,10 +51,15 @@ def searchWdPage(article_name=''):
 
 # reference: https://bitbucket.org/mikepeel/wikicode/src/master/enwp_wikidata_newitem.py
 def createWdPage(article_name=''):
-	""" Creates a new Wikidata Page """
+	""" Creates a new Wikidata Page (planned in plan mode, see plan.createItem) """
+
+	if plan.isPlanning():
+		return plan.createItem(labels={"en":article_name}, summary="Creating item")
 
-	new_item = pywikibot.ItemPage(repo)
+	new_item = pywikibot.ItemPage(base.getRepo())
 	new_item.editLabels(labels={"en":article_name}, summary="Creating item")
+	# the search found nothing: a rerun must not see that
+	base.invalidateURL(searchURL(article_name))
 	return new_item.getID()
 
 	# return 0
@@ -106,8 +91,7 @@ def checkExistence(claim='', prop_id='', prop_value='',):
 
 		elif prop_id in wikibase_item:
 			wd_propval = item_value.title()
-			wdpage_val = base.WdPage(wd_value=wd_propval)
-			wdpage_value = wdpage_val.page.labels['en'].lower()
+			wdpage_value = base.getLabel(wd_propval).lower()
 			prop_value_refined = prop_value.replace('[', '').replace(']', '')
 			if prop_value_refined.lower() == wdpage_value:
 				return True
@@ -134,6 +118,7 @@ def checkExistence(claim='', prop_id='', prop_value='',):
 
 	return False
 
+@tracing.traced()
 def addToWd(wp_page='', wd_page='', prop_id='', prop_value='', prop_list='', import_url=''):
 	""" Adds info to Wikidata """
 
@@ -210,12 +195,17 @@ def main():
 	list_items = re.split(r'==[\w\s]*==', contents)[1]
 	indiv_items = re.split(r'{{NRHP row', list_items)
 
+	# rows with an article, whose texts are then fetched 50 per request
+	rows = list()
 	for item in indiv_items:
 		# print(item)
 		article_name = re.findall(r'\|article\=(.+)', item)
-		if not article_name:
-			continue
-		wp_page = base.WpPage(article_name[0])
+		if article_name:
+			rows.append((article_name, item))
+	wp_pages = base.WpPage.preload([article_name[0] for article_name, item in rows], resolve_items=True)
+
+	for (article_name, item), wp_page in zip(rows, wp_pages):
+		tracing.setArticle(title=article_name[0])
 		# print(article_name)
 
 		if wp_page.getWpContents():
@@ -244,38 +234,48 @@ def main():
 			# addition of source url
 			import_url = 'https://en.wikipedia.org/w/index.php?title=%s&oldid=%s' % (wp_list.title.replace(' ', '_'), wp_list.latest_revision_id)
 
-			properties = search_patterns.search_prop(item)
-			for prop in properties:
-				# print(prop)
-				if prop in prop_ids:
-					prop_val = search_patterns.search_prop_value(page_text=item, word=prop)
-					print(str(prop) + ': ' + str(prop_val))
-					try:
-						# multiple values for a prop - add each value separately
-						if type(prop_val) is list:
-							for val in prop_val:
-								try:
-									addToWd(wp_page=wp_page, wd_page=wd_page, prop_id=prop_ids[str(prop)], prop_value=val, prop_list=properties, import_url=import_url)
-								except:
-									print('Error adding property.')
-									continue
-
-						print('\n')
-					except:
-						pass
-
-				if prop == 'lat':
-					try:
-						lat = search_patterns.search_prop_value(page_text=item, word=properties[properties.index('lat')])[0]
-						lon = search_patterns.search_prop_value(page_text=item, word=properties[properties.index('lon')])[0]
-						val = str(lat) + '|' + str(lon)
-						addToWd(wp_page=wp_page, wd_page=wd_page, prop_id=prop_ids['coordinates'], prop_value=val, prop_list=properties, import_url=import_url)
-					except:
-						print('Error adding coordinates.')
+			# labels of the item's current values, for the existence checks
+			wd_page.preloadLabels()
+			# claims, references and qualifiers of the item are saved in one edit
+			try:
+				with wd_page.batch():
+					properties = search_patterns.search_prop(item)
+					for prop in properties:
+						# print(prop)
+						if prop in prop_ids:
+							prop_val = search_patterns.search_prop_value(page_text=item, word=prop)
+							print(str(prop) + ': ' + str(prop_val))
+							try:
+								# multiple values for a prop - add each value separately
+								if type(prop_val) is list:
+									for val in prop_val:
+										try:
+											addToWd(wp_page=wp_page, wd_page=wd_page, prop_id=prop_ids[str(prop)], prop_value=val, prop_list=properties, import_url=import_url)
+										except:
+											print('Error adding property.')
+											continue
+
+								print('\n')
+							except:
+								pass
+
+						if prop == 'lat':
+							try:
+								lat = search_patterns.search_prop_value(page_text=item, word=properties[properties.index('lat')])[0]
+								lon = search_patterns.search_prop_value(page_text=item, word=properties[properties.index('lon')])[0]
+								val = str(lat) + '|' + str(lon)
+								addToWd(wp_page=wp_page, wd_page=wd_page, prop_id=prop_ids['coordinates'], prop_value=val, prop_list=properties, import_url=import_url)
+							except:
+								print('Error adding coordinates.')
+								continue
+					else:
+						print('No such page exists. Skipping...\n')
 						continue
-			else:
-				print('No such page exists. Skipping...\n')
-				continue
+			except Exception as e:
+				# the claims of this article are discarded (see batch), the next articles are still imported
+				print('Error importing %s: %s. Skipping...\n' % (wp_page.title, e))
 
 if __name__ == "__main__":
+	# --plan FILE: write the edits to FILE instead of making them (see plan.py)
+	plan.installFromArguments()
 	main()
@@ -3,8 +3,11 @@
 
 import re
 import pywikibot
-import dateparser
 import base_ops as base
+import date_normalizer
+import pipeline
+import plan
+import tracing
 
 # properties to be imported
 prop_ids = {
@@ -32,6 +35,7 @@ single_values = ['P149', 'P571', 'P625', 'P649']
 
 lang = 'en'
 
+@tracing.traced()
 def addToWd(wd_page='', prop_id='', prop_value='', prop_list=''):
 
 	""" check for previous existence of property-value pair in page """
@@ -48,20 +52,11 @@ def addToWd(wd_page='', prop_id='', prop_value='', prop_list=''):
 				item_value = value.getTarget()
 				if prop_id in time:
 					flag = 0
-					date = prop_value.split()
 					try:
-						if len(date) == 3:
-							import_date = dateparser.parse(str(date[0])+' '+str(date[1])+' '+str(date[2]))
-							if import_date.year == item_value.year and import_date.month == item_value.month and import_date.day == item_value.day:
-								flag = 1
-						elif len(date) == 2:
-							import_date = dateparser.parse(str(date[0])+' '+str(date[1]))
-							if import_date.year == item_value.year and import_date.month == item_value.month:
-								flag = 1
-						elif len(date) == 1:
-							import_date = dateparser.parse(str(date[0]))
-							if import_date.year == item_value.year:
-								flag = 1
+						# memoized - parsed once for all the existing claims
+						import_date = date_normalizer.parse_date(prop_value)
+						if date_normalizer.same_date(date=import_date, wbtime=item_value):
+							flag = 1
 					except:
 						print('Error in extracting date.\n')
 						return
@@ -84,8 +79,7 @@ def addToWd(wd_page='', prop_id='', prop_value='', prop_list=''):
 
 				elif prop_id in wikibase_item:
 					wd_propval = item_value.title()
-					wdpage_val = base.WdPage(wd_value=wd_propval)
-					wdpage_value = wdpage_val.page.labels['en'].lower()
+					wdpage_value = base.getLabel(wd_propval).lower()
 					if prop_value.lower() == wdpage_value:
 						print('Same property-value exist in the page already. Skipping...')
 						return 1
@@ -141,68 +135,51 @@ def addToWd(wd_page='', prop_id='', prop_value='', prop_list=''):
 
 	return 0
 
+def importInfo(wp_page='', wd_page='', info=''):
+	""" Adds the info extracted from an article's infobox to its Wd item """
+	# claims, references and qualifiers of the item are saved in one edit
+	try:
+		with wd_page.batch():
+			# iterate through each info extracted from infobox
+			for prop in info.keys():
+				print(str(prop) + ': ' + str(info[prop]))
+				try:
+					# multiple values for a prop - add each value separately
+					if type(info[prop]) is list:
+						for val in info[prop]:
+							try:
+								addToWd(wd_page=wd_page, prop_id=prop_ids[str(prop)], prop_value=val, prop_list=info)
+							except:
+								print('Error adding property.')
+								continue
+					else:
+						addToWd(wd_page=wd_page, prop_id= prop_ids[str(prop)], prop_value=info[prop], prop_list=info)
+
+					print('\n')
+				except:
+					pass
+	except Exception as e:
+		print('Error importing %s: %s. Skipping...\n' % (wp_page.title, e))
+		# the pipeline goes on with the next article; the run journal marks this one failed
+		raise
+
+def getArticleNames(contents=''):
+	""" Retrieving names of the Wp articles """
+	list_items = re.split(r'==[\w\s]*==', contents)[1]
+	return re.findall(r'\|article\=(.+)', list_items)
+
 def main():
 	page_name = 'National Register of Historic Places listings in Riverhead (town), New York'
 
 	wp_list = base.WpPage(page_name)
 	# wp_list.printWpContents()
 
-	""" Retrieving names of the Wp articles """
-	contents = wp_list.getWpContents()
-	list_items = re.split(r'==[\w\s]*==', contents)[1]
-
-	article_names = re.findall(r'\|article\=(.+)', list_items)
-
-	# i = 0
-	rows = list()
-	for article_name in article_names:
-		wp_page = base.WpPage(article_name)
-
-		# check for existence of page
-		if wp_page.getWpContents():
-			print(wp_page.title)
-
-			""" Extracting info from infobox and adding to Wikidata """
-			# find info from the infobox
-			info = wp_page.findInfobox(check_all='y')
-
-			# get the Wd page
-			wd_page = ''
-			try:
-				wd_page = base.WdPage(page_name=wp_page.title)
-			except:
-				pass
-
-			# wd_page = base.WdPage(wd_value='Q4115189')
-
-			if info and wd_page:
-				# iterate through each info extracted from infobox
-				for prop in info.keys():
-					print(str(prop) + ': ' + str(info[prop]))
-					try:
-						# multiple values for a prop - add each value separately
-						if type(info[prop]) is list:
-							for val in info[prop]:
-								try:
-									addToWd(wd_page=wd_page, prop_id=prop_ids[str(prop)], prop_value=val, prop_list=info)
-								except:
-									print('Error adding property.')
-									continue
-						else:
-							addToWd(wd_page=wd_page, prop_id= prop_ids[str(prop)], prop_value=info[prop], prop_list=info)
-
-						print('\n')
-					except:
-						pass
-
-		else:
-			print('No such page exists. Skipping...\n')
-			continue
+	article_names = getArticleNames(wp_list.getWpContents())
 
-		# if i < 25:
-		# 	i += 1
-		# else:
-		# 	break
+	""" Extracting info from infoboxes and adding to Wikidata """
+	pipeline.importList(article_names=article_names, prop_ids=prop_ids, import_info=importInfo, run=page_name)
 
 if __name__ == "__main__":
+	# --plan FILE: write the edits to FILE instead of making them (see plan.py)
+	plan.installFromArguments()
 	main()
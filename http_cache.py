@@ -0,0 +1,200 @@
+# File name: http_cache.py
+# Persistent (sqlite) response cache for http_client: per-host TTLs, size-bounded
+# LRU eviction and ETag/Last-Modified revalidation
+
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'outreachy-wmf', 'http_cache.sqlite')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_TTL = 24 * 60 * 60 # seconds
+
+# how long a response stays fresh (seconds), by host
+host_ttls = {
+	'www.wikidata.org': 24 * 60 * 60,
+	'en.wikipedia.org': 24 * 60 * 60,
+	'int.soccerway.com': 7 * 24 * 60 * 60,
+}
+
+def normalizeURL(url=''):
+	"""
+	Returns the cache key of a url: lower-case scheme and host, no default
+	port, no fragment and sorted query parameters
+
+	"""
+	parts = urllib.parse.urlsplit(url.strip())
+	scheme = parts.scheme.lower()
+	host = (parts.hostname or '').lower()
+	if parts.port and not (scheme == 'http' and parts.port == 80) and not (scheme == 'https' and parts.port == 443):
+		host += ':%d' % parts.port
+	query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True)))
+	return urllib.parse.urlunsplit((scheme, host, parts.path or '/', query, ''))
+
+
+def isEmptySearch(url='', body=b''):
+	"""
+	True for a wbsearchentities response without results: never cached, as
+	the scripts create an item when the search finds none and a cached
+	"no item" would make a rerun create it again
+
+	"""
+	if 'action=wbsearchentities' not in url:
+		return False
+	return b'<search />' in body or b'"search":[]' in body
+
+
+class CacheEntry:
+	def __init__(self, url='', body=b'', content_type='', etag='', last_modified='', expires=0):
+		self.url = url
+		self.body = body
+		self.content_type = content_type
+		self.etag = etag
+		self.last_modified = last_modified
+		self.expires = expires
+
+	def isFresh(self, now=None):
+		return (now or time.time()) < self.expires
+
+	def validators(self):
+		""" Headers for a conditional request """
+		headers = dict()
+		if self.etag:
+			headers['If-None-Match'] = self.etag
+		if self.last_modified:
+			headers['If-Modified-Since'] = self.last_modified
+		return headers
+
+
+class HTTPCache:
+	"""
+	On-disk response cache
+
+	@param path: sqlite file
+	@param max_bytes: total body size kept before least recently used entries are evicted
+	@param default_ttl: freshness (seconds) for hosts missing from host_ttls
+	@param ttls: per-host freshness overrides
+
+	"""
+
+	def __init__(self, path=DEFAULT_PATH, max_bytes=DEFAULT_MAX_BYTES, default_ttl=DEFAULT_TTL, ttls=None):
+		self.path = path
+		self.max_bytes = max_bytes
+		self.default_ttl = default_ttl
+		self.ttls = dict(host_ttls)
+		if ttls:
+			self.ttls.update(ttls)
+		self.stats = {'hits': 0, 'misses': 0, 'revalidated': 0, 'stored': 0, 'evicted': 0}
+
+		directory = os.path.dirname(path)
+		if directory:
+			os.makedirs(directory, exist_ok=True)
+		self.lock = threading.Lock()
+		self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+		self.db.execute('PRAGMA journal_mode=WAL')
+		self.db.execute('''CREATE TABLE IF NOT EXISTS responses (
+			url TEXT PRIMARY KEY,
+			body BLOB,
+			content_type TEXT,
+			etag TEXT,
+			last_modified TEXT,
+			expires REAL,
+			last_used REAL,
+			size INTEGER)''')
+		self.db.execute('CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)')
+		self.db.commit()
+		self.total_bytes = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+	def ttlFor(self, url=''):
+		host = (urllib.parse.urlsplit(url).hostname or '').lower()
+		return self.ttls.get(host, self.default_ttl)
+
+	def lookup(self, url=''):
+		""" Returns the CacheEntry stored for url (fresh or stale) or None """
+		key = normalizeURL(url)
+		with self.lock:
+			row = self.db.execute('SELECT body, content_type, etag, last_modified, expires FROM responses WHERE url = ?', (key,)).fetchone()
+			if row is None:
+				return None
+			self.db.execute('UPDATE responses SET last_used = ? WHERE url = ?', (time.time(), key))
+			self.db.commit()
+		return CacheEntry(url=key, body=row[0], content_type=row[1], etag=row[2], last_modified=row[3], expires=row[4])
+
+	def store(self, url='', body=b'', headers=None):
+		""" Stores a 200 response (not an empty search, see isEmptySearch) """
+		headers = headers or dict()
+		key = normalizeURL(url)
+		if isEmptySearch(key, body):
+			self.invalidate(key)
+			return
+		now = time.time()
+		with self.lock:
+			old = self.db.execute('SELECT size FROM responses WHERE url = ?', (key,)).fetchone()
+			if old:
+				self.total_bytes -= old[0]
+			self.db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+				(key, body, headers.get('content-type', ''), headers.get('etag', ''), headers.get('last-modified', ''),
+				now + self.ttlFor(key), now, len(body)))
+			self.total_bytes += len(body)
+			self.stats['stored'] += 1
+			self.evict()
+			self.db.commit()
+
+	def refresh(self, url=''):
+		""" Marks a stale entry fresh again (after a 304 Not Modified) """
+		key = normalizeURL(url)
+		now = time.time()
+		with self.lock:
+			self.db.execute('UPDATE responses SET expires = ?, last_used = ? WHERE url = ?', (now + self.ttlFor(key), now, key))
+			self.db.commit()
+
+	def invalidate(self, url=''):
+		""" Drops the entry of a url, so the next get() fetches it """
+		key = normalizeURL(url)
+		with self.lock:
+			old = self.db.execute('SELECT size FROM responses WHERE url = ?', (key,)).fetchone()
+			if old:
+				self.db.execute('DELETE FROM responses WHERE url = ?', (key,))
+				self.total_bytes -= old[0]
+				self.db.commit()
+
+	def evict(self):
+		""" Drops least recently used entries until the cache fits in max_bytes """
+		while self.total_bytes > self.max_bytes:
+			rows = self.db.execute('SELECT url, size FROM responses ORDER BY last_used LIMIT 100').fetchall()
+			if not rows:
+				self.total_bytes = 0
+				break
+			for url, size in rows:
+				self.db.execute('DELETE FROM responses WHERE url = ?', (url,))
+				self.total_bytes -= size
+				self.stats['evicted'] += 1
+				if self.total_bytes <= self.max_bytes:
+					break
+
+	def clear(self):
+		with self.lock:
+			self.db.execute('DELETE FROM responses')
+			self.db.commit()
+			self.total_bytes = 0
+
+	def count(self, name=''):
+		""" Adds 1 to a counter of stats ('hits', 'misses', 'revalidated'); sessions share the cache across threads """
+		with self.lock:
+			self.stats[name] += 1
+
+	def printStats(self):
+		with self.lock:
+			stats = dict(self.stats)
+			total_bytes = self.total_bytes
+		lookups = stats['hits'] + stats['misses'] + stats['revalidated']
+		rate = 100.0 * (stats['hits'] + stats['revalidated']) / lookups if lookups else 0.0
+		print('HTTP cache: %d hits, %d revalidated, %d misses (%.1f%% served locally), %d stored, %d evicted, %.1f MB on disk' % (
+			stats['hits'], stats['revalidated'], stats['misses'], rate,
+			stats['stored'], stats['evicted'], total_bytes / (1024.0 * 1024.0)))
+
+	def close(self):
+		with self.lock:
+			self.db.close()
@@ -0,0 +1,320 @@
+# File name: http_client.py
+# Shared, pooled HTTP client used by base_ops.getURL and the scripts
+
+import atexit
+import gzip
+import http.client
+import os
+import random
+import threading
+import time
+import urllib.parse
+import zlib
+
+import http_cache
+
+USER_AGENT = 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:55.0) Gecko/20100101 Firefox/55.0'
+
+# errors after which a request is worth retrying
+RETRY_STATUS = [429, 500, 502, 503, 504]
+REDIRECT_STATUS = [301, 302, 303, 307, 308]
+MAX_REDIRECTS = 5
+
+
+class Response:
+	""" Status, headers and (decompressed) body of a finished request """
+
+	def __init__(self, url='', status=0, headers=None, body=b''):
+		self.url = url
+		self.status = status
+		self.headers = headers or dict()
+		self.body = body
+
+	@property
+	def text(self):
+		charset = 'utf-8'
+		content_type = self.headers.get('content-type', '')
+		if 'charset=' in content_type:
+			charset = content_type.split('charset=')[1].split(';')[0].strip() or charset
+		return self.body.strip().decode(charset, errors='replace')
+
+
+class HostPool:
+	"""
+	Keep-alive connections to a single scheme/host/port
+
+	At most `maxsize` connections are in use at once; further callers wait
+	until one is handed back.
+
+	"""
+
+	def __init__(self, scheme='https', host='', port=None, maxsize=4, timeout=30):
+		self.scheme = scheme
+		self.host = host
+		self.port = port
+		self.timeout = timeout
+		self.slots = threading.BoundedSemaphore(maxsize)
+		self.lock = threading.Lock()
+		self.idle = list()
+
+	def acquire(self):
+		""" Returns (connection, reused) """
+		self.slots.acquire()
+		with self.lock:
+			if self.idle:
+				return self.idle.pop(), True
+		if self.scheme == 'https':
+			conn = http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+		else:
+			conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+		return conn, False
+
+	def release(self, conn, reusable=True):
+		if reusable:
+			with self.lock:
+				self.idle.append(conn)
+		else:
+			conn.close()
+		self.slots.release()
+
+	def close(self):
+		with self.lock:
+			for conn in self.idle:
+				conn.close()
+			self.idle = list()
+
+
+class Session:
+	"""
+	Pooled HTTP session
+
+	@param max_per_host: maximum number of simultaneous connections per host
+	@param timeout: socket timeout (seconds)
+	@param retries: number of retries after a failed request
+	@param backoff: first retry delay (seconds), doubled on every retry
+	@param max_backoff: upper limit of a single retry delay (seconds)
+	@param headers: extra headers sent with every request
+	@param cache: http_cache.HTTPCache used by get(), or None
+
+	"""
+
+	def __init__(self, max_per_host=4, timeout=30, retries=4, backoff=10, max_backoff=100, headers=None, cache=None):
+		self.max_per_host = max_per_host
+		self.timeout = timeout
+		self.retries = retries
+		self.backoff = backoff
+		self.max_backoff = max_backoff
+		self.headers = {
+			'User-Agent': USER_AGENT,
+			'Accept-Encoding': 'gzip, deflate',
+			'Connection': 'keep-alive',
+		}
+		if headers:
+			self.headers.update(headers)
+		self.cache = cache
+		self.lock = threading.Lock()
+		self.pools = dict()
+
+	def getPool(self, scheme, host, port):
+		key = (scheme, host, port)
+		with self.lock:
+			if key not in self.pools:
+				self.pools[key] = HostPool(scheme=scheme, host=host, port=port, maxsize=self.max_per_host, timeout=self.timeout)
+			return self.pools[key]
+
+	def send(self, url='', headers=None, method='GET', timeout=None):
+		"""
+		Sends a single request (no retries, no redirects)
+
+		A kept-alive connection closed by the server in the meantime is
+		replaced by a fresh one once.
+
+		@param timeout: socket timeout (seconds) of this request (default:
+					the session's)
+
+		"""
+		parts = urllib.parse.urlsplit(url)
+		pool = self.getPool(parts.scheme, parts.hostname, parts.port)
+		path = parts.path or '/'
+		if parts.query:
+			path += '?' + parts.query
+
+		request_headers = dict(self.headers)
+		if headers:
+			request_headers.update(headers)
+
+		while True:
+			conn, reused = pool.acquire()
+			# pooled connections keep the timeout of the request that used them last
+			conn.timeout = self.timeout if timeout is None else timeout
+			if conn.sock is not None:
+				conn.sock.settimeout(conn.timeout)
+			try:
+				conn.request(method, path, headers=request_headers)
+				resp = conn.getresponse()
+				body = resp.read()
+			except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+				pool.release(conn, reusable=False)
+				if reused:
+					continue
+				raise
+			except:
+				pool.release(conn, reusable=False)
+				raise
+			pool.release(conn, reusable=not resp.will_close)
+			break
+
+		response_headers = dict((key.lower(), value) for key, value in resp.getheaders())
+		encoding = response_headers.get('content-encoding', '')
+		if encoding == 'gzip':
+			body = gzip.decompress(body)
+		elif encoding == 'deflate':
+			body = zlib.decompress(body)
+
+		return Response(url=url, status=resp.status, headers=response_headers, body=body)
+
+	def request(self, url='', headers=None, method='GET', timeout=None):
+		""" Sends a request, following redirects """
+		for i in range(MAX_REDIRECTS + 1):
+			response = self.send(url=url, headers=headers, method=method, timeout=timeout)
+			if response.status not in REDIRECT_STATUS or 'location' not in response.headers:
+				return response
+			url = urllib.parse.urljoin(url, response.headers['location'])
+			if response.status == 303:
+				method = 'GET'
+		return response
+
+	def retryDelay(self, attempt, response=None):
+		""" Jittered exponential backoff, honouring Retry-After when given """
+		if response is not None and 'retry-after' in response.headers:
+			try:
+				return min(float(response.headers['retry-after']), self.max_backoff)
+			except ValueError:
+				pass
+		delay = min(self.backoff * (2 ** attempt), self.max_backoff)
+		return random.uniform(delay / 2.0, delay)
+
+	def fetch(self, url='', headers=None, retry=True, timeout=None):
+		"""
+		GETs a url, retrying on connection errors and 429/5xx responses
+
+		@return value: Response, or None if every attempt failed
+
+		"""
+		retries = self.retries if retry else 0
+		for attempt in range(retries + 1):
+			response = None
+			try:
+				response = self.request(url=url, headers=headers, timeout=timeout)
+				if response.status not in RETRY_STATUS:
+					return response
+			except (OSError, http.client.HTTPException):
+				pass
+
+			if attempt < retries:
+				sleep = self.retryDelay(attempt, response)
+				print('Error while retrieving: %s' % (url))
+				print('Retry in %.1f seconds...' % (sleep))
+				time.sleep(sleep)
+
+		return None
+
+	def get(self, url='', headers=None, retry=True, timeout=None):
+		"""
+		GETs a url through the response cache (if any)
+
+		Fresh entries are served from disk, stale ones are revalidated with
+		their ETag/Last-Modified and everything else is fetched.
+
+		@return value: Response, or None if every attempt failed
+
+		"""
+		if self.cache is None:
+			return self.fetch(url=url, headers=headers, retry=retry, timeout=timeout)
+
+		entry = self.cache.lookup(url)
+		if entry is not None and entry.isFresh():
+			self.cache.count('hits')
+			return Response(url=url, status=200, headers={'content-type': entry.content_type}, body=entry.body)
+
+		request_headers = dict(headers or dict())
+		if entry is not None:
+			request_headers.update(entry.validators())
+
+		response = self.fetch(url=url, headers=request_headers, retry=retry, timeout=timeout)
+		if response is not None and response.status == 304 and entry is not None:
+			self.cache.refresh(url)
+			self.cache.count('revalidated')
+			return Response(url=url, status=200, headers={'content-type': entry.content_type}, body=entry.body)
+
+		self.cache.count('misses')
+		if response is not None and response.status == 200:
+			self.cache.store(url, response.body, response.headers)
+		return response
+
+	def close(self):
+		with self.lock:
+			for pool in self.pools.values():
+				pool.close()
+			self.pools = dict()
+
+
+default_session = None
+session_lock = threading.Lock()
+
+def defaultCache():
+	"""
+	Opens the response cache named by $WMF_HTTP_CACHE (default:
+	http_cache.DEFAULT_PATH); set it to 'off' to disable caching. Its
+	statistics are printed when the script exits
+
+	"""
+	path = os.environ.get('WMF_HTTP_CACHE', http_cache.DEFAULT_PATH)
+	if not path or path.lower() == 'off':
+		return None
+	cache = http_cache.HTTPCache(path=path)
+	atexit.register(cache.printStats)
+	return cache
+
+def getSession():
+	""" Returns the session shared by every script """
+	global default_session
+	with session_lock:
+		if default_session is None:
+			default_session = Session(cache=defaultCache())
+		return default_session
+
+def configure(**kwargs):
+	"""
+	Replaces the shared session with one built from the given settings
+	(see Session for the accepted parameters)
+
+	"""
+	global default_session
+	with session_lock:
+		if default_session is not None:
+			default_session.close()
+		if 'cache' not in kwargs:
+			kwargs['cache'] = defaultCache()
+		default_session = Session(**kwargs)
+		return default_session
+
+def getURL(url='', retry=True, timeout=None):
+	"""
+	Returns the body of a url as text ('' on failure)
+
+	@param retry: retry with backoff on errors
+	@param timeout: socket timeout (seconds) of each attempt (default: the
+				session's, see configure())
+
+	"""
+	response = getSession().get(url=url, retry=retry, timeout=timeout)
+	if response is None or response.status >= 400:
+		return ''
+	return response.text
+
+def invalidate(url=''):
+	""" Drops the cached response of a url (after an edit that changes it) """
+	cache = getSession().cache
+	if cache is not None:
+		cache.invalidate(url)
@@ -1,73 +1,68 @@
-import json
 import re
 import urllib
 import urllib.request
 import urllib.parse
-from unidecode import unidecode
 
 import pywikibot
-from pywikibot import pagegenerators
 # link to base_ops: https://github.com/nizz009/pywikibot/blob/master/scripts/userscripts/base_ops.py
 import base_ops as base
 # link to search_patterns: https://github.com/nizz009/pywikibot/blob/master/scripts/userscripts/search_patterns.py
 import search_patterns
-
-enwiki = pywikibot.Site('en', 'wikipedia')
-enwd = pywikibot.Site('wikidata', 'wikidata')
-repo = enwd.data_repository()
+import name_match
+import plan
+import property_values
+import soccerway
+import soccerway_parser
+import tracing
 
 prop_id = 'P2369'
+# every Soccerway ID on Wikidata, fetched on the first duplicate check
+soccerway_ids = property_values.ValueIndex(prop_id=prop_id)
+
+def birthDate(raw=''):
+	""" Birth date on a player's profile page ('' if it has none) """
+	bday_site = soccerway_parser.parse_profile(raw).get('date_of_birth', '')
+	if not bday_site:
+		return ''
+	return search_patterns.val_parser(code=2, found_items=[bday_site.split()])
 
+@tracing.traced()
 def searchPlayer(wp_page='', player_name=''):
-	""" Searches for the player in the official site """
+	"""
+	Searches for the player in the official site
 
-	if player_name:
-		player_name = player_name.replace(' ', '+')
-		searchitemurl = 'https://int.soccerway.com/search/players/?q=%s' % (player_name)
-		raw = base.getURL(searchitemurl)
-		players = re.findall(r'<td class="player"><a href="[\/\-\w]*" class="[\_\s\/\-\w]*">.*</a></td>', raw, re.IGNORECASE)
-		names = re.findall(r'<td class="player"><a href="[\/\-\w]*" class="[\_\s\/\-\w]*">(.*)</a></td>', raw, re.IGNORECASE)
+	@return value: soccerway_parser.PlayerRecord of the player, '' if none
+				or several players match
 
-		player_name = player_name.replace('+', ' ')
-		matches = list()
-		i = 0
-		for name in names:
-			flag = 'y'
-			name = unidecode(name)
-			name = re.split(r'\s|\-', name)
-			name_parts = re.split(r'\s|\-', player_name)
-
-			for name_part in name_parts:
-				name_part = unidecode(name_part)
-				if name_part != 'career' and name_part != 'statistics' and '(' not in name_part and ')' not in name_part and not name_part.isnumeric():
-					if name_part not in name:
-						flag = 'n'
-						break
+	"""
 
-			if flag == 'n':
-				i += 1
-				continue
+	if player_name:
+		raw = soccerway.getClient().search(player_name)
 
-			matches.append(players[i])
+		matches = list()
+		seen = set()
+		for record in soccerway_parser.iter_search_results(raw):
+			if record.soccerway_id not in seen and name_match.matches_all(player_name, record.display_name):
+				seen.add(record.soccerway_id)
+				matches.append(record)
 
 		if len(matches) == 1:
 			return matches[0]
 		elif len(matches) > 1:
+			bday_wp = search_patterns.date_val(page_text=wp_page.text, word='birth_date')
+			if not bday_wp:
+				print('No birth date in the article to tell the players apart.\n')
+				return ''
+
+			candidates = dict((record.soccerway_id, record) for record in matches)
+
+			# profiles are fetched concurrently; a second match makes the search ambiguous
 			final_list = list()
-			for text in matches:
-				soccerway_id = re.findall(r'<td class="player"><a href="/players/([\/\-\w]*)" class="[\_\s\/\-\w]*">.*</a></td>', text, re.IGNORECASE)
-				
-				if soccerway_id:
-					searchitemurl = 'https://int.soccerway.com/players/%s' % (soccerway_id[0])
-					raw = base.getURL(searchitemurl)
-					
-					bday_site = re.findall(r'<dd data-date_of_birth="date_of_birth">([\w\s]*)</dd>', raw, re.IGNORECASE)
-					bday_site[0] = (bday_site[0].split())
-					bday_site = search_patterns.val_parser(code=2, found_items=bday_site)
-					bday_wp = search_patterns.date_val(page_text=wp_page.text, word='birth_date')
-				
-					if bday_site == bday_wp:
-						final_list.append(text)
+			for soccerway_id, raw in soccerway.getClient().fetchProfiles(candidates):
+				if birthDate(raw) == bday_wp:
+					final_list.append(candidates[soccerway_id])
+					if len(final_list) > 1:
+						break
 
 			if len(final_list) == 1:
 				return final_list[0]
@@ -80,13 +75,10 @@ def getId(wp_page='', player_name=''):
 	""" Gets the player ID from the official site """
 
 	if player_name:
-		text = ''
-		text = searchPlayer(wp_page=wp_page, player_name=player_name)
+		record = searchPlayer(wp_page=wp_page, player_name=player_name)
 
-		if text:
-			soccerway_id = re.findall(r'<td class="player"><a href="/players/([\/\-\w]*)" class="[\_\s\/\-\w]*">.*</a></td>', text, re.IGNORECASE)
-			soccerway_id = soccerway_id[0].strip('/')
-			return soccerway_id
+		if record:
+			return record.soccerway_id
 
 		else:
 			print('No player was found on the official site.\n')
@@ -98,6 +90,7 @@ def getId(wp_page='', player_name=''):
 
 	return ''
 
+@tracing.traced()
 def checkAuthenticity(page='', soccerway_id=''):
 	""" 
 	Checks the correctness of the ID in Wp article 
@@ -111,48 +104,34 @@ def checkAuthenticity(page='', soccerway_id=''):
 		first_name = ''
 		last_name = ''
 
-		searchitemurl = 'https://int.soccerway.com/players/%s' % (soccerway_id)
-		raw = base.getURL(searchitemurl)
-		first_name = re.findall(r'<dd data-first_name="first_name">(.*)</dd>', raw, re.IGNORECASE)
-		last_name = re.findall(r'<dd data-last_name="last_name">(.*)</dd>', raw, re.IGNORECASE)
+		fields = soccerway_parser.parse_profile(soccerway.getClient().profile(soccerway_id))
+		first_name = fields.get('first_name', '')
+		last_name = fields.get('last_name', '')
 		
 		if first_name and last_name:
-			first_name = unidecode(first_name[0]).split()
-			last_name = unidecode(last_name[0]).split()
-
-			# print(first_name)
-			# print(last_name)
-
-			name_parts = (page.title()).split()
-
-			count = 0
-			for name_part in name_parts:
-				name_part = unidecode(name_part)
-				if name_part != 'career' and name_part != 'statistics' and '(' not in name_part and ')' not in name_part and not name_part.isnumeric():
-					if name_part in first_name or name_part in last_name:
-						count += 1
-
-			if count >= (len(name_parts)/2):
-				return True
-			else:
-				return False
+			# at least half of the words of the title, disambiguators included, must be in the name on the site
+			return name_match.match_count(page.title(), first_name + ' ' + last_name) >= len(page.title().split()) / 2
 
 	else:
 		print('Inadequate information provided.\n')
 		return False
 
 def checkDuplicate(soccerway_id=''):
-	query = 'SELECT ?item WHERE { ?item wdt:'+ str(prop_id) +' ?id . FILTER (?id = "'+ str(soccerway_id) +'") . } LIMIT 10'
-	generator = pagegenerators.WikidataSPARQLPageGenerator(query, site=repo)
-	count = 0
-	for things in generator:
-		count += 1
+	""" Checks whether the ID is already used by an item (all the IDs are prefetched with one query) """
+	try:
+		return soccerway_id in soccerway_ids
+	except IOError as e:
+		print('Error in prefetching the Soccerway IDs (%s). Querying the ID...' % (e))
 
-	if count:
+	query = 'SELECT ?item WHERE { ?item wdt:'+ str(prop_id) +' ?id . FILTER (?id = "'+ str(soccerway_id) +'") . } LIMIT 10'
+	try:
+		return bool(property_values.runQuery(query=query))
+	except IOError as e:
+		print('Error in checking the ID: %s\n' % (e))
+		# not known to be free
 		return True
 
-	return False
-
+@tracing.traced()
 def addSoccerwayId(repo='', item='', lang='', soccerway_id='', confirm='', import_from=''):
 	""" Adds the ID in Wikidata """
 
@@ -166,8 +145,15 @@ def addSoccerwayId(repo='', item='', lang='', soccerway_id='', confirm='', impor
 		item.addIdentifiers(prop_id=prop_id, prop_value=soccerway_id, lang=lang, confirm=confirm)
 	else:
 		item.addIdentifiers(prop_id=prop_id, prop_value=soccerway_id, confirm=confirm)
+	# only a saved ID is in use: not one refused, failed, deferred or planned
+	if soccerway_id and hasSavedId(item=item, soccerway_id=soccerway_id):
+		soccerway_ids.add(soccerway_id)
 	return 0
 
+def hasSavedId(item=None, soccerway_id=''):
+	""" True if the item has the ID in a saved statement (one with a statement ID) """
+	return any(getattr(claim, 'snak', None) and claim.getTarget() == soccerway_id for claim in item.page.claims.get(prop_id, []))
+
 def findId(page=''):
 	""" Finds the ID in Wp page """
 	if page:
@@ -184,8 +170,10 @@ def findId(page=''):
 def main():
 	category = 'Soccerway template with ID not in Wikidata'
 	lang = 'en'
+	repo = base.getRepo()
 
-	cat = pywikibot.Category(pywikibot.Link(category, source=enwiki, default_namespace=14))
+	from pywikibot import pagegenerators
+	cat = pywikibot.Category(pywikibot.Link(category, source=base.getEnwp(), default_namespace=14))
 	gen = pagegenerators.CategorizedPageGenerator(cat)
 	pre = pagegenerators.PreloadingGenerator(gen)
 
@@ -194,6 +182,7 @@ def main():
 	for page in pre:
 
 		print(page.title())
+		tracing.setArticle(title=page.title())
 
 		item = ''
 		try:
@@ -205,16 +194,16 @@ def main():
 		# print('\n')
 
 		soccerway_id = findId(page=page)
-		soccerway_id = unidecode(soccerway_id)
+		soccerway_id = name_match.transliterate(soccerway_id)
 		import_from = 'enwiki'
 		if item:
 			if soccerway_id:
 				if not checkAuthenticity(page=page, soccerway_id=soccerway_id):
 					print('Incorrect Soccerway ID provided in the article. Getting ID from site...\n')
-					soccerway_id = getId(wp_page=page, player_name=unidecode(page.title()))
+					soccerway_id = getId(wp_page=page, player_name=name_match.transliterate(page.title()))
 					import_from = ''
 			else:
-				soccerway_id = getId(wp_page=page, player_name=unidecode(page.title()))
+				soccerway_id = getId(wp_page=page, player_name=name_match.transliterate(page.title()))
 				import_from = ''
 
 			print(soccerway_id)
@@ -239,20 +228,21 @@ def main():
 						if soccerway_id:
 							if not checkAuthenticity(page=page, soccerway_id=soccerway_id):
 								print('Incorrect Soccerway ID provided in the article. Getting ID from site...\n')
-								soccerway_id = getId(wp_page=page, player_name=unidecode(page.title()))
+								soccerway_id = getId(wp_page=page, player_name=name_match.transliterate(page.title()))
 								import_from = ''
 						else:
-							soccerway_id = getId(wp_page=page, player_name=unidecode(page.title()))
+							soccerway_id = getId(wp_page=page, player_name=name_match.transliterate(page.title()))
 							import_from = ''
 
 						print(soccerway_id)
 						addSoccerwayId(repo=repo, item=item, lang=lang, soccerway_id=soccerway_id, confirm='y', import_from=import_from)
 
-						# Touch the page to force an update
-						try:
-							page.touch()
-						except:
-							print('Error in updating the page.\n')
+						# Touch the page to force an update (not while planning: nothing was saved)
+						if not plan.isPlanning():
+							try:
+								page.touch()
+							except:
+								print('Error in updating the page.\n')
 						break
 
 				else:
@@ -266,4 +256,6 @@ def main():
 	return 0
 
 if __name__ == "__main__":
+	# --plan FILE: write the edits to FILE instead of making them (see plan.py)
+	plan.installFromArguments()
 	main()
@@ -0,0 +1,140 @@
+# File name: label_resolver.py
+# Memoized label -> QID resolution: in-process LRU in front of a persistent sqlite store,
+# remembering ambiguous and missing labels for a shorter time
+
+import collections
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'outreachy-wmf', 'labels.sqlite')
+
+FOUND = 'found'
+AMBIGUOUS = 'ambiguous'
+NOT_FOUND = 'notfound'
+
+FOUND_TTL = 30 * 24 * 60 * 60 # seconds
+NEGATIVE_TTL = 24 * 60 * 60 # ambiguous and not found
+
+
+class LRUCache:
+	""" Thread-safe dict keeping only the `maxsize` most recently used keys """
+
+	def __init__(self, maxsize=10000):
+		self.maxsize = maxsize
+		self.data = collections.OrderedDict()
+		self.lock = threading.Lock()
+
+	def get(self, key, default=None):
+		with self.lock:
+			if key not in self.data:
+				return default
+			self.data.move_to_end(key)
+			return self.data[key]
+
+	def put(self, key, value):
+		with self.lock:
+			self.data[key] = value
+			self.data.move_to_end(key)
+			while len(self.data) > self.maxsize:
+				self.data.popitem(last=False)
+
+	def __contains__(self, key):
+		with self.lock:
+			return key in self.data
+
+	def __len__(self):
+		return len(self.data)
+
+
+class LabelResolver:
+	"""
+	Resolves labels to QIDs, calling `lookup` only for labels not seen before
+	(or whose entry has expired)
+
+	@param lookup: function(label, lang) returning the list of matching QIDs;
+				it should raise on network errors so failures are not cached
+	@param path: sqlite file of the persistent store ('' for memory only)
+	@param maxsize: number of entries kept in memory
+	@param ttl: lifetime (seconds) of found labels
+	@param negative_ttl: lifetime (seconds) of ambiguous and missing labels
+
+	"""
+
+	def __init__(self, lookup=None, path=DEFAULT_PATH, maxsize=10000, ttl=FOUND_TTL, negative_ttl=NEGATIVE_TTL):
+		self.lookup = lookup
+		self.ttl = ttl
+		self.negative_ttl = negative_ttl
+		self.memory = LRUCache(maxsize=maxsize)
+		self.stats = {'memory_hits': 0, 'store_hits': 0, 'lookups': 0, 'found': 0, 'ambiguous': 0, 'notfound': 0}
+
+		self.lock = threading.Lock()
+		self.db = None
+		if path:
+			directory = os.path.dirname(path)
+			if directory:
+				os.makedirs(directory, exist_ok=True)
+			self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+			self.db.execute('''CREATE TABLE IF NOT EXISTS labels (
+				label TEXT,
+				lang TEXT,
+				status TEXT,
+				qid TEXT,
+				expires REAL,
+				PRIMARY KEY (label, lang))''')
+			self.db.commit()
+
+	def key(self, label='', lang='en'):
+		return (' '.join(label.split()).lower(), lang)
+
+	def resolve(self, label='', lang='en'):
+		"""
+		@return value: (status, qid) - status is FOUND, AMBIGUOUS or NOT_FOUND,
+					qid is '' unless the label was found
+
+		"""
+		key = self.key(label, lang)
+		now = time.time()
+
+		entry = self.memory.get(key)
+		if entry and entry[2] > now:
+			self.count('memory_hits')
+			return entry[0], entry[1]
+
+		if self.db is not None:
+			with self.lock:
+				row = self.db.execute('SELECT status, qid, expires FROM labels WHERE label = ? AND lang = ?', key).fetchone()
+			if row and row[2] > now:
+				self.count('store_hits')
+				self.memory.put(key, row)
+				return row[0], row[1]
+
+		self.count('lookups')
+		qids = list(collections.OrderedDict.fromkeys(self.lookup(label, lang)))
+		if len(qids) == 1:
+			status, qid, expires = FOUND, qids[0], now + self.ttl
+		elif qids:
+			status, qid, expires = AMBIGUOUS, '', now + self.negative_ttl
+		else:
+			status, qid, expires = NOT_FOUND, '', now + self.negative_ttl
+		self.count(status)
+
+		self.memory.put(key, (status, qid, expires))
+		if self.db is not None:
+			with self.lock:
+				self.db.execute('INSERT OR REPLACE INTO labels VALUES (?, ?, ?, ?, ?)', (key[0], key[1], status, qid, expires))
+				self.db.commit()
+
+		return status, qid
+
+	def count(self, name=''):
+		""" Adds 1 to a counter of stats; scripts resolve labels from several threads """
+		with self.lock:
+			self.stats[name] += 1
+
+	def printStats(self):
+		total = self.stats['memory_hits'] + self.stats['store_hits'] + self.stats['lookups']
+		print('Label resolver: %d resolutions, %d from memory, %d from disk, %d searched (%d found, %d ambiguous, %d not found)' % (
+			total, self.stats['memory_hits'], self.stats['store_hits'], self.stats['lookups'],
+			self.stats['found'], self.stats['ambiguous'], self.stats['notfound']))
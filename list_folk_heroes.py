@@ -3,9 +3,11 @@
 
 import re
 import pywikibot
-import datetime
-import dateparser
 import base_ops as base
+import date_normalizer
+import pipeline
+import plan
+import tracing
 
 # properties to be imported
 prop_ids = {
@@ -59,6 +61,7 @@ single_values = ['P19', 'P20', 'P22', 'P25', 'P119', 'P509', 'P569',
 
 lang = 'en'
 
+@tracing.traced()
 def addToWd(wd_page='', prop_id='', prop_value='', prop_list=''):
 
 	""" check for previous existence of property-value pair in page """
@@ -75,20 +78,11 @@ def addToWd(wd_page='', prop_id='', prop_value='', prop_list=''):
 				item_value = value.getTarget()
 				if prop_id in time:
 					flag = 0
-					date = prop_value.split()
 					try:
-						if len(date) == 3:
-							import_date = dateparser.parse(str(date[0])+' '+str(date[1])+' '+str(date[2]))
-							if import_date.year == item_value.year and import_date.month == item_value.month and import_date.day == item_value.day:
-								flag = 1
-						elif len(date) == 2:
-							import_date = dateparser.parse(str(date[0])+' '+str(date[1]))
-							if import_date.year == item_value.year and import_date.month == item_value.month:
-								flag = 1
-						elif len(date) == 1:
-							import_date = dateparser.parse(str(date[0]))
-							if import_date.year == item_value.year:
-								flag = 1
+						# memoized - parsed once for all the existing claims
+						import_date = date_normalizer.parse_date(prop_value)
+						if date_normalizer.same_date(date=import_date, wbtime=item_value):
+							flag = 1
 					except:
 						print('Error in extracting date.\n')
 						return
@@ -111,8 +105,7 @@ def addToWd(wd_page='', prop_id='', prop_value='', prop_list=''):
 
 				elif prop_id in wikibase_item:
 					wd_propval = item_value.title()
-					wdpage_val = base.WdPage(wd_value=wd_propval)
-					wdpage_value = wdpage_val.page.labels['en'].lower()
+					wdpage_value = base.getLabel(wd_propval).lower()
 					if prop_value.lower() == wdpage_value:
 						print('Same property-value exist in the page already. Skipping...')
 						return 1
@@ -145,78 +138,59 @@ def addToWd(wd_page='', prop_id='', prop_value='', prop_list=''):
 
 	return 0
 
-def main():
-	page_name = 'List of folk heroes'
+def importInfo(wp_page='', wd_page='', info=''):
+	""" Adds the info extracted from an article's infobox to its Wd item """
+	# claims, references and qualifiers of the item are saved in one edit
+	with wd_page.batch():
+		# iterate through each info extracted from infobox
+		for prop in info.keys():
+			print(str(prop) + ': ' + str(info[prop]))
+			try:
+				# multiple values for a prop - add each value separately
+				if type(info[prop]) is list:
+					for val in info[prop]:
+						try:
+							addToWd(wd_page=wd_page, prop_id=prop_ids[str(prop)], prop_value=val, prop_list=info)
+						except:
+							print('Error adding property.')
+							continue
+				else:
+					addToWd(wd_page=wd_page, prop_id= prop_ids[str(prop)], prop_value=info[prop], prop_list=info)
 
-	wp_list = base.WpPage(page_name)
-	# wp_list.printWpContents()
+				print('\n')
+			except:
+				pass
 
+def getArticleNames(contents=''):
 	""" Retrieving names of the Wp articles """
-	contents = wp_list.getWpContents()
 	list_items = re.split(r'==[\w\s]*==', contents)[1]
 	rows = list_items.split('*')
 
 	article_names = list()
 	for row in rows:
-		row = row.split('–')[0]
-		article_names.append(row)
-
-	i = 0
-	for name in article_names:
+		name = row.split('–')[0]
 		# print(name)
-		article_name = ''
 		article_name = re.findall(r'\[\[([\w\s\'\-\(\)\.]*)\]\]|$', name)[0]
 		if not article_name:
 			article_name = re.findall(r'\[\[([\w\s\'\-\(\)\.]*)\|[\w\s]*\]\]|$', name)[0]
 
 		if article_name:
-			wp_page = base.WpPage(article_name)
-
-			# check for existence of page
-			if wp_page.getWpContents():
-				print(wp_page.title)
+			article_names.append(article_name)
 
-				""" Extracting info from infobox and adding to Wikidata """
-				# find info from the infobox
-				info = wp_page.findInfobox(check_all='y')
+	return article_names
 
-				# get the Wd page
-				wd_page = ''
-				try:
-					wd_page = base.WdPage(page_name=wp_page.title)
-				except:
-					pass
+def main():
+	page_name = 'List of folk heroes'
 
-				# wd_page = base.WdPage(wd_value='Q4115189')
+	wp_list = base.WpPage(page_name)
+	# wp_list.printWpContents()
 
-				if info and wd_page:
-					# iterate through each info extracted from infobox
-					for prop in info.keys():
-						print(str(prop) + ': ' + str(info[prop]))
-						try:
-							# multiple values for a prop - add each value separately
-							if type(info[prop]) is list:
-								for val in info[prop]:
-									try:
-										addToWd(wd_page=wd_page, prop_id=prop_ids[str(prop)], prop_value=val, prop_list=info)
-									except:
-										print('Error adding property.')
-										continue
-							else:
-								addToWd(wd_page=wd_page, prop_id= prop_ids[str(prop)], prop_value=info[prop], prop_list=info)
-
-							print('\n')
-						except:
-							pass
-					print('\n')
+	article_names = getArticleNames(wp_list.getWpContents())
 
-			else:
-				print('No such page exists. Skipping...\n')
-				continue
-		# if i < 25:
-		# 	i += 1
-		# else:
-		# 	break
+	""" Extracting info from infoboxes and adding to Wikidata """
+	pipeline.importList(article_names=article_names, prop_ids=prop_ids, import_info=importInfo, run=page_name)
 
 if __name__ == "__main__":
+	# --plan FILE: write the edits to FILE instead of making them (see plan.py)
+	plan.installFromArguments()
 	main()
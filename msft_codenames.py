@@ -3,13 +3,11 @@
 
 import re
 import pywikibot
-import dateparser
-import time
 import urllib
-import urllib.request
 import urllib.parse
 import base_ops as base
-import search_patterns
+import plan
+import tracing
 
 # properties to be imported
 prop_ids = {
@@ -22,40 +20,21 @@ string = ['P1638']
 single_values = ['P1638']
 
 lang = 'en'
-enwd = pywikibot.Site("wikidata", "wikidata")
-repo = enwd.data_repository()
-
 
 """ 
 =====================================
 Searching and creating Wikidata Items
 =====================================
 """
-def getURL(url='', retry=True, timeout=30):
-	raw = ''
-	req = urllib.request.Request(url, headers={ 'User-Agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:55.0) Gecko/20100101 Firefox/55.0' })
-	try:
-		raw = urllib.request.urlopen(req, timeout=timeout).read().strip().decode('utf-8')
-	except:
-		sleep = 10 # seconds
-		maxsleep = 100
-		while retry and sleep <= maxsleep:
-			print('Error while retrieving: %s' % (url))
-			print('Retry in %s seconds...' % (sleep))
-			time.sleep(sleep)
-			try:
-				raw = urllib.request.urlopen(req, timeout=timeout).read().strip().decode('utf-8')
-			except:
-				pass
-			sleep = sleep * 2
-	return raw
+def searchURL(article_name=''):
+	""" wbsearchentities url of an article's name """
+	article_name_ = article_name.split('(')[0].strip()
+	return 'https://www.wikidata.org/w/api.php?action=wbsearchentities&search=%s&language=en&format=xml' % (urllib.parse.quote(article_name_))
 
 def searchWdPage(article_name=''):
 	""" Searches for a Wp article in Wd """ 
 
-	article_name_ = article_name.split('(')[0].strip()
-	searchitemurl = 'https://www.wikidata.org/w/api.php?action=wbsearchentities&search=%s&language=en&format=xml' % (urllib.parse.quote(article_name_))
-	raw = getURL(searchitemurl)
+	raw = base.getURL(searchURL(article_name))
 
 	if not '<search />' in raw:
 		return 1
@@ -64,10 +43,15 @@ def searchWdPage(article_name=''):
 
 # reference: https://bitbucket.org/mikepeel/wikicode/src/master/enwp_wikidata_newitem.py
 def createWdPage(article_name=''):
-	""" Creates a new Wikidata Page """
+	""" Creates a new Wikidata Page (planned in plan mode, see plan.createItem) """
+
+	if plan.isPlanning():
+		return plan.createItem(labels={"en":article_name}, summary="Creating item")
 
-	new_item = pywikibot.ItemPage(repo)
+	new_item = pywikibot.ItemPage(base.getRepo())
 	new_item.editLabels(labels={"en":article_name}, summary="Creating item")
+	# the search found nothing: a rerun must not see that
+	base.invalidateURL(searchURL(article_name))
 	return new_item.getID()
 
 	# return 0
@@ -99,6 +83,7 @@ def checkExistence(claim='', prop_id='', prop_value='',):
 
 	return False
 
+@tracing.traced()
 def addToWd(wp_page='', wd_page='', prop_id='', prop_value='', prop_list='', import_url=''):
 	""" Adds info to Wikidata """
 
@@ -144,6 +129,8 @@ def main():
 	contents = wp_list.getWpContents()
 	# wp_list.printWpContents()
 	list_items = re.split(r'==[\w\s]*==', contents)
+	# (article, codename) of every row, then the articles' texts fetched 50 per request
+	rows = list()
 	for list_item in list_items:
 		product = re.split(r'\|-', list_item)
 		for version in product:
@@ -158,41 +145,47 @@ def main():
 
 			if not article_name:
 				continue
-			wp_page = base.WpPage(article_name)
-			# print(article_name)
+			rows.append((article_name, indiv_items[1].strip('[[').strip(']]\n')))
+	wp_pages = base.WpPage.preload([article_name for article_name, codename in rows], resolve_items=True)
 
-			if wp_page.getWpContents():
-				print(wp_page.title)
+	for (article_name, codename), wp_page in zip(rows, wp_pages):
+		tracing.setArticle(title=article_name)
+		# print(article_name)
 
-				# get the Wd page
-				wd_page = ''
+		if wp_page.getWpContents():
+			print(wp_page.title)
+
+			# get the Wd page
+			wd_page = ''
+			try:
+				wd_page = base.WdPage(page_name=wp_page.title)
+			except:
+				print('no wd page exists.\n')
+				pass
+			
+			# creates new Wikidata Item 
+			if not wd_page:
+				wdpage_exists = searchWdPage(article_name=article_name)
+				if not wdpage_exists:
+					new_wdvalue = createWdPage(article_name=article_name)
+					wd_page = base.WdPage(new_wdvalue)
+
+			# wd_page = base.WdPage(wd_value='Q4115189')
+
+			if wd_page:
 				try:
-					wd_page = base.WdPage(page_name=wp_page.title)
+					# addition of source url
+					import_url = 'https://en.wikipedia.org/w/index.php?title=%s&oldid=%s' % (wp_list.title.replace(' ', '_'), wp_list.latest_revision_id)
+					addToWd(wp_page=wp_page, wd_page=wd_page, prop_id=prop_ids['codename'], prop_value=codename, import_url=import_url)
 				except:
-					print('no wd page exists.\n')
-					pass
-				
-				# creates new Wikidata Item 
-				if not wd_page:
-					wdpage_exists = searchWdPage(article_name=article_name)
-					if not wdpage_exists:
-						new_wdvalue = createWdPage(article_name=article_name)
-						wd_page = base.WdPage(new_wdvalue)
-
-				# wd_page = base.WdPage(wd_value='Q4115189')
-
-				if wd_page:
-					try:
-						# addition of source url
-						import_url = 'https://en.wikipedia.org/w/index.php?title=%s&oldid=%s' % (wp_list.title.replace(' ', '_'), wp_list.latest_revision_id)
-						addToWd(wp_page=wp_page, wd_page=wd_page, prop_id=prop_ids['codename'], prop_value=indiv_items[1].strip('[[').strip(']]\n'), import_url=import_url)
-					except:
-						print('Error adding property.')
-						continue
-
-				else:
-					print('No such page exists. Skipping...\n')
+					print('Error adding property.')
 					continue
 
+			else:
+				print('No such page exists. Skipping...\n')
+				continue
+
 if __name__ == "__main__":
+	# --plan FILE: write the edits to FILE instead of making them (see plan.py)
+	plan.installFromArguments()
 	main()
@@ -0,0 +1,53 @@
+# File name: name_match.py
+# Normalized, memoized name tokens (transliterated, case-folded, disambiguators dropped) and
+# set-based scoring of candidate names against an article title
+
+import functools
+import re
+
+cache_size = 16384
+
+# words of article titles that are not part of the name ("... career statistics")
+ignored_words = frozenset(['career', 'statistics'])
+
+# (footballer, born 1990)
+disambiguator_pattern = re.compile(r'\([^)]*\)')
+separator_pattern = re.compile(r'[\s\-]+')
+
+
+@functools.lru_cache(maxsize=cache_size)
+def transliterate(text=''):
+	""" ASCII transliteration of a text (unidecode is loaded on first use) """
+	if text.isascii():
+		return text
+	from unidecode import unidecode
+	return unidecode(text)
+
+@functools.lru_cache(maxsize=cache_size)
+def name_tokens(name=''):
+	"""
+	Normalized words of a name: transliterated, case-folded, split on spaces
+	and hyphens, without parenthesized disambiguators, numbers and the
+	ignored words
+
+	@return value: frozenset of the words
+	"""
+	name = disambiguator_pattern.sub(' ', transliterate(name)).casefold()
+	return frozenset(token for token in separator_pattern.split(name)
+						if token and token not in ignored_words and '(' not in token and ')' not in token and not token.isnumeric())
+
+def match_count(query='', candidate=''):
+	""" Number of the words of `query` found in `candidate` """
+	return len(name_tokens(query) & name_tokens(candidate))
+
+def match_score(query='', candidate=''):
+	""" Share (0 - 1) of the words of `query` found in `candidate` """
+	query_tokens = name_tokens(query)
+	if not query_tokens:
+		return 0.0
+	return match_count(query, candidate) / len(query_tokens)
+
+def matches_all(query='', candidate=''):
+	""" True if every word of `query` is in `candidate` """
+	query_tokens = name_tokens(query)
+	return bool(query_tokens) and query_tokens <= name_tokens(candidate)
@@ -0,0 +1,250 @@
+# File name: pipeline.py
+# asyncio runner for the list import scripts: fetch -> parse -> resolve -> write stages
+# connected by bounded queues, with a configurable number of workers per stage and
+# writes kept strictly one at a time
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pywikibot
+
+import base_ops as base
+import plan
+import run_journal
+import tracing
+import write_scheduler
+
+# marks the end of a queue
+DONE = object()
+
+default_concurrency = {
+	'fetch': 4,
+	'parse': 1,
+	'resolve': 4,
+	'write': 1,
+}
+
+
+class Pipeline:
+	"""
+	Runs items through a list of stages
+
+	Every stage is a blocking function(item) returning the item for the next
+	stage, or None to drop it. The functions run in worker threads, so network
+	waits of one article overlap with the work on the others.
+
+	@param stages: list of (name, function) pairs
+	@param concurrency: number of workers per stage name (default 1);
+				the 'write' stage always has exactly one
+	@param queue_size: capacity of the queue in front of each stage
+
+	"""
+
+	def __init__(self, stages='', concurrency=None, queue_size=8):
+		self.stages = list(stages)
+		self.concurrency = dict()
+		for name, function in self.stages:
+			self.concurrency[name] = max(1, (concurrency or dict()).get(name, 1))
+		if 'write' in self.concurrency:
+			self.concurrency['write'] = 1
+		self.queue_size = queue_size
+		self.stats = dict((name, {'done': 0, 'dropped': 0, 'failed': 0, 'seconds': 0.0}) for name, function in self.stages)
+		self.executor = None
+
+	async def worker(self, name='', function='', inbox='', outbox=None):
+		loop = asyncio.get_running_loop()
+		while True:
+			item = await inbox.get()
+			if item is DONE:
+				return
+
+			start = time.perf_counter()
+			try:
+				result = await loop.run_in_executor(self.executor, function, item)
+			except Exception as error:
+				self.stats[name]['failed'] += 1
+				print('Error in %s stage: %s' % (name, error))
+				continue
+			finally:
+				self.stats[name]['seconds'] += time.perf_counter() - start
+
+			if outbox is None:
+				self.stats[name]['done'] += 1
+			elif result is None:
+				self.stats[name]['dropped'] += 1
+			else:
+				self.stats[name]['done'] += 1
+				await outbox.put(result)
+
+	async def closeStage(self, workers='', outbox=None, next_workers=0):
+		""" Waits for the workers of a stage, then ends the next stage's queue """
+		await asyncio.gather(*workers)
+		if outbox is not None:
+			for i in range(next_workers):
+				await outbox.put(DONE)
+
+	async def runAsync(self, items=''):
+		queues = [asyncio.Queue(maxsize=self.queue_size) for stage in self.stages]
+		closers = list()
+		for index, (name, function) in enumerate(self.stages):
+			outbox = None
+			next_workers = 0
+			if index + 1 < len(self.stages):
+				outbox = queues[index + 1]
+				next_workers = self.concurrency[self.stages[index + 1][0]]
+			workers = [asyncio.ensure_future(self.worker(name=name, function=function, inbox=queues[index], outbox=outbox))
+						for i in range(self.concurrency[name])]
+			closers.append(asyncio.ensure_future(self.closeStage(workers=workers, outbox=outbox, next_workers=next_workers)))
+
+		# items may come from a generator doing blocking work (WpPage.preload): pulled in a worker thread
+		loop = asyncio.get_running_loop()
+		iterator = iter(items)
+		while True:
+			item = await loop.run_in_executor(self.executor, next, iterator, DONE)
+			if item is DONE:
+				break
+			await queues[0].put(item)
+		for i in range(self.concurrency[self.stages[0][0]]):
+			await queues[0].put(DONE)
+
+		await asyncio.gather(*closers)
+
+	def run(self, items=''):
+		""" Processes all items and returns the per-stage stats """
+		# one more thread for pulling the items
+		with ThreadPoolExecutor(max_workers=sum(self.concurrency.values()) + 1) as executor:
+			self.executor = executor
+			asyncio.run(self.runAsync(items))
+		self.executor = None
+		return self.stats
+
+	def printStats(self):
+		for name, function in self.stages:
+			stats = self.stats[name]
+			print('%-8s %5d done, %5d dropped, %5d failed, %8.1f s busy' % (name, stats['done'], stats['dropped'], stats['failed'], stats['seconds']))
+
+
+"""
+============================
+Standard list import stages
+============================
+"""
+def revisionOf(wp_page=None):
+	""" Id of the revision of a fetched WpPage (None for anything else) """
+	try:
+		return wp_page.page.latest_revision_id
+	except:
+		return None
+
+def importList(article_names='', prop_ids='', import_info='', concurrency=None, run=''):
+	"""
+	Imports the infoboxes of the articles of a Wikipedia list into Wikidata
+
+	@param article_names: titles of the articles (the script's article extractor)
+	@param prop_ids: the script's infobox parameter -> property mapping;
+				articles without any mapped parameter are skipped before
+				their Wd item is loaded
+	@param import_info: function(wp_page, wd_page, info) adding the info
+				to the item - called from the single write worker
+	@param concurrency: workers per stage (see default_concurrency)
+	@param run: name of the run (the list page) for the run journal - the
+				articles done or skipped by an earlier run are left out
+				(see run_journal.fromEnvironment)
+
+	"""
+	journal = None
+	if run:
+		if plan.isPlanning():
+			# planned articles are not done for a run that saves the edits
+			run = 'plan:%s' % run
+		journal, mode = run_journal.fromEnvironment(run=run)
+	if journal:
+		article_names = journal.pending(titles=article_names, mode=mode)
+		print('%d article(s) to process (journal mode: %s)' % (len(article_names), mode))
+	scheduler = write_scheduler.getScheduler()
+	# articles with edits deferred to the end of the run
+	deferred_titles = list()
+
+	# each stage names its article for the tracing spans (the workers are threads)
+	def fetch(wp_page):
+		tracing.setArticle(title=wp_page.page_name)
+		if journal:
+			journal.start(wp_page.page_name)
+		# check for existence of page (texts are preloaded 50 at a time)
+		if not wp_page.getWpContents():
+			print('No such page exists. Skipping...\n')
+			return None
+		return wp_page
+
+	def parse(wp_page):
+		tracing.setArticle(title=wp_page.title)
+		info = wp_page.findInfobox(check_all='y')
+		if not info or not any(prop in prop_ids for prop in info):
+			return None
+		return (wp_page, info)
+
+	def resolve(job):
+		wp_page, info = job
+		tracing.setArticle(title=wp_page.title)
+		try:
+			wd_page = base.WdPage(page_name=wp_page.title)
+		except (pywikibot.exceptions.NoWikibaseEntityError, pywikibot.exceptions.NoPageError):
+			# no item: skipped; anything else fails the article
+			print('No Wikidata item for %s. Skipping...\n' % wp_page.title)
+			return None
+		tracing.setArticle(title=wp_page.title, qid=wd_page.wd_value)
+		# item and the labels of its current values, for the existence checks
+		wd_page.preloadLabels()
+		return (wp_page, wd_page, info)
+
+	def write(job):
+		wp_page, wd_page, info = job
+		tracing.setArticle(title=wp_page.title, qid=wd_page.wd_value)
+		print(wp_page.title)
+		deferred = scheduler.stats['deferred']
+		import_info(wp_page=wp_page, wd_page=wd_page, info=info)
+		if journal:
+			status = run_journal.DONE
+			if scheduler.stats['deferred'] > deferred:
+				status = run_journal.DEFERRED
+				deferred_titles.append(wp_page.page_name)
+			journal.mark(wp_page.page_name, status, stage='write', revision=revisionOf(wp_page), qid=wd_page.wd_value)
+
+	def journaled(stage='', function=''):
+		""" Records the articles a stage drops (skipped) or fails on """
+		if not journal:
+			return function
+
+		def runStage(item):
+			wp_page = item[0] if isinstance(item, tuple) else item
+			title = getattr(wp_page, 'page_name', wp_page)
+			try:
+				result = function(item)
+			except Exception as error:
+				journal.mark(title, run_journal.FAILED, stage=stage, revision=revisionOf(wp_page), error=repr(error))
+				raise
+			if result is None and stage != 'write':
+				journal.mark(title, run_journal.SKIPPED, stage=stage, revision=revisionOf(wp_page))
+			return result
+		return runStage
+
+	settings = dict(default_concurrency)
+	settings.update(concurrency or dict())
+	stages = [('fetch', fetch), ('parse', parse), ('resolve', resolve), ('write', write)]
+	runner = Pipeline(stages=[(name, journaled(name, function)) for name, function in stages], concurrency=settings)
+	runner.run(base.WpPage.preload(article_names, resolve_items=True))
+	lost = write_scheduler.flush()
+	if journal:
+		# a lost edit cannot be traced to its article - all of them are retried
+		for title in deferred_titles:
+			if lost:
+				journal.mark(title, run_journal.FAILED, stage='write', error='%d deferred edit(s) lost' % lost)
+			else:
+				journal.mark(title, run_journal.DONE, stage='write')
+	runner.printStats()
+	scheduler.printStats()
+	if journal:
+		journal.printStats()
+		journal.close()
+	return runner.stats
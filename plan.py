@@ -0,0 +1,561 @@
+# File name: plan.py
+# Plan/apply mode: started with --plan FILE, the scripts write every Wikidata edit they would make
+# (new items, claims with their references and qualifiers, base revision) to a JSON lines plan instead of
+# saving it; `python plan.py apply FILE` makes the edits later, batched per item, paced by the write
+# scheduler and checked for conflicts with what changed on the item since it was planned
+#
+# usage: python guerrilla_movements.py --plan plan.jsonl
+#        python plan.py apply plan.jsonl [--batch N] [--edits-per-minute N] [--until HH:MM] [--dry-run]
+
+import argparse
+import atexit
+import collections
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+
+import pywikibot
+
+import base_ops as base
+import run_journal
+import tracing
+import write_scheduler
+
+DEFAULT_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'outreachy-wmf', 'plans')
+
+# planned edits
+CLAIMS = 'claims' # new statements, saved in one wbeditentity call
+SOURCES = 'sources' # a reference added to a statement
+QUALIFIER = 'qualifier' # a qualifier added to a statement
+REMOVE = 'remove' # statements removed (overwritten)
+CREATE = 'create' # a new item with its labels; the edits planned for it name it by NEW_PREFIX + label
+
+# qid of an item planned by createItem, until `plan.py apply` creates it
+NEW_PREFIX = 'new:'
+
+
+class PlanWriter:
+	"""
+	Appends planned edits to a JSON lines file
+
+	Every line has the action, the item (qid), the revision of the item the
+	edit was checked against (base_revision), the edit summary, the article
+	it was planned for and the action's own fields.
+
+	"""
+
+	def __init__(self, path=''):
+		self.path = path
+		directory = os.path.dirname(path)
+		if directory:
+			os.makedirs(directory, exist_ok=True)
+		self.file = open(path, 'a', encoding='utf-8')
+		self.lock = threading.Lock()
+		self.count = 0
+
+	def record(self, action='', qid='', base_revision=None, summary='', **fields):
+		entry = dict(fields, action=action, qid=qid, base_revision=base_revision, summary=summary, planned=round(time.time(), 3))
+		article = tracing.current_article.get() or dict()
+		if article.get('title'):
+			entry['title'] = article['title']
+		line = json.dumps(entry, ensure_ascii=False, sort_keys=True)
+		with self.lock:
+			self.file.write(line + '\n')
+			self.file.flush()
+			self.count += 1
+
+	def close(self):
+		with self.lock:
+			if not self.file.closed:
+				self.file.close()
+				print('%d edit(s) planned in %s' % (self.count, self.path))
+
+
+"""
+====
+Plan
+====
+"""
+active = None
+
+def isPlanning():
+	return active is not None
+
+def install(path=''):
+	""" Writes the edits to `path` instead of making them, until the end of the run """
+	global active
+	if active is not None:
+		active.close()
+	active = PlanWriter(path=path)
+	atexit.register(active.close)
+	print('Plan mode: edits are written to %s, not saved' % (path))
+	return active
+
+def defaultPath():
+	script = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0] or 'python'
+	return os.path.join(DEFAULT_DIR, '%s-%s.jsonl' % (script, time.strftime('%Y%m%d-%H%M%S')))
+
+def installFromArguments(argv=None):
+	"""
+	Switches to plan mode if the script was started with `--plan FILE`
+	(`--plan` alone: a new file in DEFAULT_DIR) or $WMF_PLAN names a file;
+	the option is removed from argv
+
+	"""
+	argv = sys.argv if argv is None else argv
+	path = os.environ.get('WMF_PLAN', '')
+	for i, arg in enumerate(argv):
+		if i == 0:
+			continue
+		if arg == '--plan':
+			if i + 1 < len(argv) and not argv[i + 1].startswith('-'):
+				path = argv[i + 1]
+				del argv[i:i + 2]
+			else:
+				path = defaultPath()
+				del argv[i]
+			break
+		if arg.startswith('--plan='):
+			path = arg[len('--plan='):] or defaultPath()
+			del argv[i]
+			break
+	if path:
+		return install(path=path)
+	return None
+
+def record(action='', qid='', base_revision=None, summary='', **fields):
+	active.record(action=action, qid=qid, base_revision=base_revision, summary=summary, **fields)
+
+def isNew(qid=''):
+	""" True if qid names an item planned by createItem """
+	return str(qid).startswith(NEW_PREFIX)
+
+def createItem(labels=None, summary='Creating item'):
+	"""
+	Plans the creation of an item instead of creating it
+
+	@param labels: {lang: label} of the new item
+	@return value: the qid the edits planned for the item use (base_ops.WdPage
+				accepts it) - `plan.py apply` creates the item first
+
+	"""
+	label = list((labels or dict()).values())[0] if labels else ''
+	qid = '%s%s@%.3f' % (NEW_PREFIX, label, time.time())
+	record(action=CREATE, qid=qid, summary=summary, labels=labels or dict())
+	return qid
+
+def datavalue(claim=None):
+	""" Value of a claim as the API writes it ({'type': ..., 'value': ...}) """
+	return claim.toJSON()['mainsnak'].get('datavalue')
+
+def snak(claim=None):
+	""" Snak of a reference or qualifier claim """
+	data = claim.toJSON()
+	return data.get('mainsnak', data)
+
+def claimFields(claim=None):
+	""" Fields naming a statement of an item: its ID (None if not saved yet), property and value """
+	return {'claim_id': getattr(claim, 'snak', None), 'property': claim.getID(), 'value': datavalue(claim)}
+
+
+"""
+=====
+Apply
+=====
+"""
+def readPlan(path=''):
+	""" Yields (key, entry) for every edit of a plan file; key is 'line N' """
+	with open(path, encoding='utf-8') as f:
+		for number, line in enumerate(f, 1):
+			line = line.strip()
+			if not line:
+				continue
+			try:
+				yield 'line %d' % number, json.loads(line)
+			except ValueError:
+				print('Invalid plan line %d. Skipping...' % number)
+
+def deadlineOf(until=''):
+	""" time.time() of the next HH:MM (None if until is empty) """
+	if not until:
+		return None
+	hours, minutes = until.split(':')
+	now = datetime.datetime.now()
+	deadline = now.replace(hour=int(hours), minute=int(minutes), second=0, microsecond=0)
+	if deadline <= now:
+		deadline += datetime.timedelta(days=1)
+	return deadline.timestamp()
+
+
+class PlanApplier:
+	"""
+	Makes the edits of a plan
+
+	Edits are grouped by item. Consecutive new claims of an item are saved
+	together (up to `batch` claims per edit), every edit goes through the
+	shared write scheduler, and an edit is not made if the item changed in
+	a way that affects it since the revision it was planned on.
+
+	@param batch: maximum number of claims saved in one edit
+	@param dry_run: only report what would be done
+	@param journal: run_journal.RunJournal recording the plan lines done,
+				skipped and failed (a later apply leaves the done ones out)
+	@param deadline: time.time() after which no edit is started
+
+	"""
+
+	def __init__(self, batch=10, dry_run=False, journal=None, deadline=None):
+		self.batch = batch
+		self.dry_run = dry_run
+		self.journal = journal
+		self.deadline = deadline
+		self.stats = {'applied': 0, 'skipped': 0, 'conflicts': 0, 'failed': 0, 'deferred': 0, 'edits': 0}
+		self.deferred_keys = list()
+		# plan lines given a status by this apply
+		self.marked = set()
+		# qid of every planned new item (isNew) -> QID of the item created for it
+		self.created = dict()
+		# plan line of a deferred creation -> the item it creates
+		self.creating = dict()
+
+	def mark(self, key='', entry=None, status=run_journal.DONE, error='', qid=''):
+		self.marked.add(key)
+		if status == run_journal.DONE:
+			self.stats['applied'] += 1
+		elif status == run_journal.SKIPPED:
+			self.stats['skipped'] += 1
+		elif status == run_journal.DEFERRED:
+			self.stats['deferred'] += 1
+			self.deferred_keys.append((key, entry))
+		elif error.startswith('conflict'):
+			self.stats['conflicts'] += 1
+		else:
+			self.stats['failed'] += 1
+		if error:
+			print('%s (%s): %s' % (key, entry.get('qid'), error))
+		if self.journal and not self.dry_run:
+			self.journal.mark(key, status, stage=entry.get('action', ''), revision=entry.get('base_revision'), qid=qid or entry.get('qid', ''), error=error)
+
+	def pastDeadline(self):
+		return self.deadline is not None and time.time() >= self.deadline
+
+	def run(self, entries=None):
+		""" Applies (key, entry) pairs; returns False if the deadline stopped it """
+		items = collections.OrderedDict()
+		for key, entry in entries:
+			items.setdefault(entry.get('qid', ''), list()).append((key, entry))
+
+		finished = True
+		for qid, item_entries in items.items():
+			if self.pastDeadline():
+				print('Deadline reached. The rest of the plan is left for the next apply.')
+				finished = False
+				break
+			tracing.setArticle(title=item_entries[0][1].get('title', ''), qid=qid)
+			try:
+				self.applyItem(qid=qid, entries=item_entries)
+			except Exception as e:
+				for key, entry in item_entries:
+					if key not in self.marked:
+						self.mark(key, entry, run_journal.FAILED, error='%s: %s' % (type(e).__name__, e))
+
+		lost = write_scheduler.flush()
+		for key, entry in self.deferred_keys:
+			if lost:
+				self.mark(key, entry, run_journal.FAILED, error='%d deferred edit(s) lost' % lost)
+			elif key in self.creating:
+				# the edits of the item are made by the next apply, which reads its QID from the journal
+				self.mark(key, entry, run_journal.DONE, qid=self.creating[key].getID())
+			else:
+				self.mark(key, entry, run_journal.DONE)
+		return finished
+
+	@tracing.traced()
+	def applyItem(self, qid='', entries=None):
+		if isNew(qid):
+			item = self.newItem(qid=qid, entries=entries)
+			if item is None:
+				return
+		else:
+			item = pywikibot.ItemPage(base.getRepo(), qid)
+			item.get()
+
+		# new claims waiting to be saved together: (key, entry, claims)
+		pending = list()
+		for key, entry in entries:
+			if self.pastDeadline():
+				break
+			conflict = self.conflictOf(item, entry)
+			if conflict:
+				self.mark(key, entry, run_journal.FAILED, error='conflict: %s' % conflict)
+				continue
+
+			action = entry.get('action')
+			if action == CREATE:
+				# made by newItem
+				continue
+			if action == CLAIMS:
+				# claims on the item or queued by an earlier line are not sent again
+				queued = [queued_claim for queued_key, queued_entry, queued_claims in pending for queued_claim in queued_claims]
+				claims = [claim for claim in entry.get('claims', []) if not hasClaim(item, claim) and not sameClaimIn(claim, queued)]
+				if not claims:
+					self.mark(key, entry, run_journal.SKIPPED)
+					continue
+				if pending and sum(len(claims) for key, entry, claims in pending) + len(claims) > self.batch:
+					self.saveClaims(item, pending)
+					pending = list()
+				pending.append((key, entry, claims))
+				continue
+
+			# edits of single statements keep their place in the plan
+			if pending:
+				self.saveClaims(item, pending)
+				pending = list()
+			if action == SOURCES:
+				self.addSources(item, key, entry)
+			elif action == QUALIFIER:
+				self.addQualifier(item, key, entry)
+			elif action == REMOVE:
+				self.removeClaims(item, key, entry)
+			else:
+				self.mark(key, entry, run_journal.FAILED, error='unknown action %r' % action)
+
+		if pending:
+			self.saveClaims(item, pending)
+
+	def newItem(self, qid='', entries=None):
+		"""
+		The item created for a planned new item: by an earlier apply (its QID
+		is in the journal, see applyPlan), or now from the item's CREATE line
+
+		@return value: the loaded item, or None if it cannot be edited yet
+					(creation failed or deferred - the other lines stay pending)
+
+		"""
+		if qid in self.created:
+			item = pywikibot.ItemPage(base.getRepo(), self.created[qid])
+			item.get()
+			return item
+
+		creates = [(key, entry) for key, entry in entries if entry.get('action') == CREATE]
+		if not creates:
+			for key, entry in entries:
+				self.mark(key, entry, run_journal.FAILED, error='no create line for the new item %s' % qid)
+			return None
+		key, entry = creates[0]
+		item = pywikibot.ItemPage(base.getRepo())
+		summary = entry.get('summary') or 'Creating item'
+		try:
+			deferred = self.submit(item, lambda: item.editLabels(labels=entry.get('labels', dict()), summary=summary),
+									'%s: %s' % (qid, summary))
+		except Exception as e:
+			for key, entry in entries:
+				self.mark(key, entry, run_journal.FAILED, error='%s: %s' % (type(e).__name__, e))
+			return None
+		if deferred:
+			self.creating[key] = item
+			self.mark(key, entry, run_journal.DEFERRED)
+			return None
+
+		if self.dry_run:
+			# nothing on the new item yet
+			item._content = dict()
+		else:
+			self.created[qid] = item.getID()
+		item.get()
+		self.mark(key, entry, run_journal.DONE, qid=item.getID())
+		return item
+
+	def conflictOf(self, item=None, entry=None):
+		"""
+		Why an edit cannot be made on the item as it is now ('' if it can)
+
+		New claims conflict when the values of their properties changed since
+		the base revision (values the plan itself adds are not counted);
+		references and qualifiers when their statement is gone.
+
+		"""
+		action = entry.get('action')
+		if action in [SOURCES, QUALIFIER]:
+			if findClaim(item, entry) is None:
+				return 'the %s statement is not on the item any more' % entry.get('property')
+			return ''
+
+		if action != CLAIMS or not entry.get('base_revision') or item.latest_revision_id == entry.get('base_revision'):
+			return ''
+		planned = [claim['mainsnak'].get('datavalue') for claim in entry.get('claims', [])]
+		for prop_id, base_values in (entry.get('base_values') or dict()).items():
+			values = [datavalue(claim) for claim in item.claims.get(prop_id, [])]
+			values = [value for value in values if value not in planned]
+			if sorted(map(canonical, values)) != sorted(map(canonical, base_values)):
+				return '%s changed since revision %s' % (prop_id, entry.get('base_revision'))
+		return ''
+
+	def submit(self, item=None, edit=None, description='', verify=None):
+		""" Runs an edit through the write scheduler; True if it was deferred """
+		self.stats['edits'] += 1
+		if self.dry_run:
+			print('Would save %s' % (description))
+			return False
+		return write_scheduler.submit(edit=edit, description=description, verify=verify) == write_scheduler.DEFERRED
+
+	def saveClaims(self, item=None, pending=None):
+		""" Saves the new claims of several plan lines in one edit """
+		claims = [claim for key, entry, entry_claims in pending for claim in entry_claims]
+		summaries = list()
+		for key, entry, entry_claims in pending:
+			if entry.get('summary') and entry['summary'] not in summaries:
+				summaries.append(entry['summary'])
+		summary = '; '.join(summaries) or u'Adding %d claims' % len(claims)
+
+		claims = [pywikibot.Claim.fromJSON(base.getRepo(), claim) for claim in claims]
+
+		def save():
+			# later lines of the item (hasClaim, findClaim) see the claims, with their IDs
+			base.editClaims(item=item, claims=claims, summary=summary)
+
+		def saved():
+			# after a timeout or server error: the claims are on the item if the edit went through
+			item.get(force=True)
+			return all(base.hasSameClaim(item, claim) for claim in claims)
+
+		try:
+			deferred = self.submit(item, save, '%s: %s' % (item.getID(), summary), verify=saved)
+			if self.dry_run:
+				for claim in claims:
+					item.claims.setdefault(claim.getID(), []).append(claim)
+		except Exception as e:
+			for key, entry, entry_claims in pending:
+				self.mark(key, entry, run_journal.FAILED, error='%s: %s' % (type(e).__name__, e))
+			return
+		for key, entry, entry_claims in pending:
+			self.mark(key, entry, run_journal.DEFERRED if deferred else run_journal.DONE)
+
+	def addSources(self, item=None, key='', entry=None):
+		claim = findClaim(item, entry)
+		snaks = collections.OrderedDict()
+		for snak in entry.get('sources', []):
+			snaks.setdefault(snak['property'], []).append(snak)
+		wanted = sorted((prop_id, canonical(snak.get('datavalue'))) for prop_id, prop_snaks in snaks.items() for snak in prop_snaks)
+		for reference in claim.sources:
+			if sorted((prop_id, canonical(datavalue(source))) for prop_id, sources in reference.items() for source in sources) == wanted:
+				self.mark(key, entry, run_journal.SKIPPED)
+				return
+
+		sources = [source for prop_sources in pywikibot.Claim.referenceFromJSON(base.getRepo(), {'snaks': snaks, 'snaks-order': list(snaks)}).values()
+					for source in prop_sources]
+		self.applyEdit(key, entry, lambda: claim.addSources(sources, summary=entry.get('summary') or 'Adding 1 reference'))
+
+	def addQualifier(self, item=None, key='', entry=None):
+		claim = findClaim(item, entry)
+		snak = entry.get('qualifier') or dict()
+		for qualifier in claim.qualifiers.get(snak.get('property'), []):
+			if canonical(datavalue(qualifier)) == canonical(snak.get('datavalue')):
+				self.mark(key, entry, run_journal.SKIPPED)
+				return
+
+		qualifier = pywikibot.Claim.qualifierFromJSON(base.getRepo(), snak)
+		self.applyEdit(key, entry, lambda: claim.addQualifier(qualifier, summary=entry.get('summary') or 'Adding 1 qualifier'))
+
+	def removeClaims(self, item=None, key='', entry=None):
+		claim_ids = entry.get('claim_ids', [])
+		claims = [claim for claims in item.claims.values() for claim in claims if claim.snak in claim_ids]
+		if not claims:
+			# removed already
+			self.mark(key, entry, run_journal.SKIPPED)
+			return
+		self.applyEdit(key, entry, lambda: item.removeClaims(claims, summary=entry.get('summary') or 'Removing %d claim(s)' % len(claims)))
+
+	def applyEdit(self, key='', entry=None, edit=None):
+		try:
+			deferred = self.submit(edit=edit, description='%s: %s' % (entry.get('qid'), entry.get('summary') or entry.get('action')))
+		except Exception as e:
+			self.mark(key, entry, run_journal.FAILED, error='%s: %s' % (type(e).__name__, e))
+			return
+		self.mark(key, entry, run_journal.DEFERRED if deferred else run_journal.DONE)
+
+	def printStats(self):
+		print('Plan: %d edit(s) %s, %d line(s) applied, %d skipped (already on the item), %d conflict(s), %d failed, %d deferred' % (
+			self.stats['edits'], 'to make' if self.dry_run else 'made', self.stats['applied'], self.stats['skipped'],
+			self.stats['conflicts'], self.stats['failed'], self.stats['deferred']))
+
+
+def canonical(value=None):
+	""" Comparable form of a datavalue """
+	return json.dumps(value, sort_keys=True)
+
+def hasClaim(item=None, claim=None):
+	""" True if the item has a statement with the property and value of a claim (JSON) """
+	value = canonical(claim['mainsnak'].get('datavalue'))
+	return any(canonical(datavalue(existing)) == value for existing in item.claims.get(claim['mainsnak']['property'], []))
+
+def sameClaimIn(claim=None, claims=''):
+	""" True if a claim (JSON) has the property and value of one of the claims (JSON) """
+	value = canonical(claim['mainsnak'].get('datavalue'))
+	return any(other['mainsnak']['property'] == claim['mainsnak']['property'] and canonical(other['mainsnak'].get('datavalue')) == value
+				for other in claims)
+
+def findClaim(item=None, entry=None):
+	""" The statement a plan line refers to: by ID, or by property and value for one planned in the same run """
+	claims = item.claims.get(entry.get('property'), [])
+	if entry.get('claim_id'):
+		for claim in claims:
+			if claim.snak == entry['claim_id']:
+				return claim
+		return None
+	value = canonical(entry.get('value'))
+	for claim in claims:
+		if canonical(datavalue(claim)) == value:
+			return claim
+	return None
+
+def applyPlan(path='', batch=10, dry_run=False, until=''):
+	"""
+	Applies a plan file; the lines done or skipped by an earlier apply of the
+	same file are left out (see run_journal.fromEnvironment)
+
+	"""
+	journal, mode = run_journal.fromEnvironment(run='apply:%s' % os.path.abspath(path))
+	entries = list(readPlan(path))
+	applier = PlanApplier(batch=batch, dry_run=dry_run, journal=journal, deadline=deadlineOf(until))
+	if journal:
+		# items created by an earlier apply are not created again
+		for key, entry in entries:
+			row = journal.get(key) if entry.get('action') == CREATE else None
+			if row and row[0] == run_journal.DONE and row[3] and not isNew(row[3]):
+				applier.created[entry['qid']] = row[3]
+		keys = set(journal.pending(titles=[key for key, entry in entries], mode=mode))
+		entries = [(key, entry) for key, entry in entries if key in keys]
+	print('%d planned edit(s) to apply' % len(entries))
+
+	applier.run(entries)
+	applier.printStats()
+	if journal:
+		journal.printStats()
+		journal.close()
+	return applier.stats
+
+def main():
+	parser = argparse.ArgumentParser(description='Applies the Wikidata edits planned with --plan')
+	commands = parser.add_subparsers(dest='command')
+	apply_parser = commands.add_parser('apply', help='make the edits of a plan file')
+	apply_parser.add_argument('path', help='plan file (JSON lines)')
+	apply_parser.add_argument('--batch', type=int, default=10, help='maximum number of claims saved in one edit')
+	apply_parser.add_argument('--edits-per-minute', type=float, default=0, help='edit rate ceiling (default: $WMF_EDITS_PER_MINUTE or 30)')
+	apply_parser.add_argument('--until', default='', help='start no edit after this time (HH:MM); the rest is left for the next apply')
+	apply_parser.add_argument('--dry-run', action='store_true', help='only report what would be done')
+	args = parser.parse_args()
+
+	if args.command != 'apply':
+		parser.print_help()
+		return 1
+	if args.edits_per_minute:
+		write_scheduler.configure(edits_per_minute=args.edits_per_minute)
+	stats = applyPlan(path=args.path, batch=args.batch, dry_run=args.dry_run, until=args.until)
+	return 1 if stats['failed'] or stats['conflicts'] else 0
+
+if __name__ == "__main__":
+	sys.exit(main())
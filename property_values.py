@@ -0,0 +1,90 @@
+# File name: property_values.py
+# Every value of a Wikidata property, fetched from the query service in one query and kept
+# up to date as the bot adds values - for duplicate checks without a SPARQL query per value
+
+import json
+import os
+import threading
+import urllib.parse
+
+import http_client
+import tracing
+
+DEFAULT_ENDPOINT = 'https://query.wikidata.org/sparql'
+
+VALUES_QUERY = 'SELECT ?value WHERE { ?item wdt:%s ?value . }'
+
+
+def getEndpoint():
+	""" SPARQL endpoint: $WMF_SPARQL_ENDPOINT (e.g. a local stand-in) or the Wikidata Query Service """
+	return os.environ.get('WMF_SPARQL_ENDPOINT', '') or DEFAULT_ENDPOINT
+
+def runQuery(query='', endpoint=''):
+	"""
+	Runs a SPARQL query
+
+	@return value: list of result rows, {variable: value}
+	Raises IOError if the endpoint gives no (valid) answer.
+
+	"""
+	url = '%s?%s' % (endpoint or getEndpoint(), urllib.parse.urlencode({'query': query, 'format': 'json'}))
+	# not through the response cache: the answer must be current
+	response = http_client.getSession().fetch(url=url, headers={'Accept': 'application/sparql-results+json'})
+	if response is None or response.status != 200:
+		raise IOError('No answer from %s (status %s)' % (endpoint or getEndpoint(), response.status if response else None))
+	try:
+		bindings = json.loads(response.text)['results']['bindings']
+	except (ValueError, KeyError) as e:
+		raise IOError('Invalid answer from %s: %s' % (endpoint or getEndpoint(), e))
+	return [dict((name, binding['value']) for name, binding in row.items()) for row in bindings]
+
+
+class ValueIndex:
+	"""
+	Values of a property (e.g. every Soccerway ID on Wikidata), loaded on
+	first use with a single query
+
+	@param prop_id: property whose values are indexed
+	@param endpoint: SPARQL endpoint (default: getEndpoint())
+
+	"""
+
+	def __init__(self, prop_id='', endpoint=''):
+		self.prop_id = prop_id
+		self.endpoint = endpoint
+		self.values = set()
+		self.loaded = False
+		# why the load failed; it is not tried again
+		self.error = ''
+		self.lock = threading.Lock()
+
+	def load(self):
+		""" (Re)loads the values; raises IOError if the query fails """
+		try:
+			with tracing.span('ValueIndex.load', prop_id=self.prop_id):
+				rows = runQuery(query=VALUES_QUERY % self.prop_id, endpoint=self.endpoint)
+		except IOError as e:
+			self.error = str(e)
+			raise
+		values = set(row['value'] for row in rows if 'value' in row)
+		with self.lock:
+			# values added while the query ran are kept
+			self.values |= values
+			self.loaded = True
+		print('Loaded %d values of %s' % (len(values), self.prop_id))
+
+	def add(self, value=''):
+		""" Records a value the bot has just added """
+		with self.lock:
+			self.values.add(value)
+
+	def __contains__(self, value):
+		if not self.loaded:
+			if self.error:
+				raise IOError(self.error)
+			self.load()
+		with self.lock:
+			return value in self.values
+
+	def __len__(self):
+		return len(self.values)
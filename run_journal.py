@@ -0,0 +1,149 @@
+# File name: run_journal.py
+# Durable (sqlite) journal of the articles of a list import - done, skipped, failed and the
+# revision processed - so an interrupted or killed run resumes where it left off
+
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'outreachy-wmf', 'journal.sqlite')
+
+# article statuses
+STARTED = 'started'
+DONE = 'done'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+# edits of the article wait in the write scheduler until the end of the run
+DEFERRED = 'deferred'
+
+# what a run does with the articles already in the journal
+RESUME = 'resume' # everything but the done and skipped ones
+RETRY_FAILED = 'failed' # only the failed ones (and those a killed run left started or deferred)
+RESTART = 'restart' # everything, forgetting the journal of the run
+
+# left unfinished by the previous run
+UNFINISHED = [STARTED, FAILED, DEFERRED]
+
+
+class RunJournal:
+	"""
+	Status of every article of a run, committed as soon as it changes
+
+	@param path: sqlite file
+	@param run: name of the run (e.g. the list page), several runs can
+				share a file
+
+	"""
+
+	def __init__(self, path=DEFAULT_PATH, run=''):
+		self.path = path
+		self.run = run
+		self.lock = threading.Lock()
+		self.stats = dict((status, 0) for status in [DONE, SKIPPED, FAILED, DEFERRED])
+
+		directory = os.path.dirname(path)
+		if directory:
+			os.makedirs(directory, exist_ok=True)
+		self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+		self.db.execute('''CREATE TABLE IF NOT EXISTS articles (
+			run TEXT,
+			title TEXT,
+			status TEXT,
+			stage TEXT,
+			revision INTEGER,
+			qid TEXT,
+			error TEXT,
+			attempts INTEGER,
+			updated REAL,
+			PRIMARY KEY (run, title))''')
+		self.db.commit()
+
+	def get(self, title=''):
+		""" (status, stage, revision, qid, error, attempts) of an article, None if not journaled """
+		with self.lock:
+			return self.db.execute('SELECT status, stage, revision, qid, error, attempts FROM articles WHERE run = ? AND title = ?',
+									(self.run, title)).fetchone()
+
+	def statuses(self):
+		with self.lock:
+			return dict(self.db.execute('SELECT title, status FROM articles WHERE run = ?', (self.run,)).fetchall())
+
+	def pending(self, titles='', mode=RESUME):
+		"""
+		Titles still to be processed, in their order
+
+		@param mode: RESUME - all but the done and skipped ones
+					RETRY_FAILED - only the unfinished ones
+					RESTART - all (the run's journal is cleared)
+
+		"""
+		if mode == RESTART:
+			self.clear()
+			return list(titles)
+
+		statuses = self.statuses()
+		if mode == RETRY_FAILED:
+			return [title for title in titles if statuses.get(title) in UNFINISHED]
+		return [title for title in titles if statuses.get(title) not in [DONE, SKIPPED]]
+
+	def start(self, title=''):
+		""" Marks an article as being processed (a run killed now leaves it STARTED) """
+		with self.lock:
+			self.db.execute('''INSERT INTO articles (run, title, status, attempts, updated) VALUES (?, ?, ?, 1, ?)
+				ON CONFLICT (run, title) DO UPDATE SET status = excluded.status, attempts = attempts + 1, updated = excluded.updated''',
+				(self.run, title, STARTED, time.time()))
+			self.db.commit()
+
+	def mark(self, title='', status=DONE, stage='', revision=None, qid='', error=''):
+		"""
+		Records how far an article got
+
+		@param stage: stage that finished (or failed or skipped) it
+		@param revision: id of the revision of the article that was processed
+
+		"""
+		with self.lock:
+			self.db.execute('''INSERT INTO articles (run, title, status, stage, revision, qid, error, attempts, updated) VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)
+				ON CONFLICT (run, title) DO UPDATE SET status = excluded.status, stage = excluded.stage,
+					revision = COALESCE(excluded.revision, revision), qid = COALESCE(NULLIF(excluded.qid, ''), qid),
+					error = excluded.error, updated = excluded.updated''',
+				(self.run, title, status, stage, revision, qid, error, time.time()))
+			self.db.commit()
+			if status in self.stats:
+				self.stats[status] += 1
+
+	def clear(self):
+		with self.lock:
+			self.db.execute('DELETE FROM articles WHERE run = ?', (self.run,))
+			self.db.commit()
+
+	def printStats(self):
+		totals = dict()
+		for title, status in self.statuses().items():
+			totals[status] = totals.get(status, 0) + 1
+		print('Journal %s: this run %d done, %d skipped, %d failed, %d deferred; in total %s' % (
+			self.path, self.stats[DONE], self.stats[SKIPPED], self.stats[FAILED], self.stats[DEFERRED],
+			', '.join('%d %s' % (count, status) for status, count in sorted(totals.items())) or 'nothing'))
+
+	def close(self):
+		with self.lock:
+			self.db.close()
+
+
+def fromEnvironment(run=''):
+	"""
+	Journal of a run kept in $WMF_JOURNAL (default: DEFAULT_PATH), or None
+	if $WMF_JOURNAL is 'off'
+
+	@return value: (journal, mode) - mode is $WMF_JOURNAL_MODE: 'resume'
+				(default), 'failed' or 'restart'
+
+	"""
+	path = os.environ.get('WMF_JOURNAL', '') or DEFAULT_PATH
+	mode = os.environ.get('WMF_JOURNAL_MODE', RESUME).lower()
+	if mode not in [RESUME, RETRY_FAILED, RESTART]:
+		raise ValueError('WMF_JOURNAL_MODE must be one of %s, not %r' % (', '.join([RESUME, RETRY_FAILED, RESTART]), mode))
+	if path.lower() == 'off':
+		return None, mode
+	return RunJournal(path=path, run=run), mode
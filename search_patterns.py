@@ -1,6 +1,11 @@
+import functools
 import re
-import datetime
-import dateparser
+
+import date_normalizer
+
+# html tags (and unclosed ones) removed from the values
+tag_pattern = re.compile(r'[\<].*?[\>]')
+open_tag_pattern = re.compile(r'\<.*')
 
 def val_parser(code='', found_items=''):
 	""" 
@@ -19,8 +24,8 @@ def val_parser(code='', found_items=''):
 			found_item = found_item.split('<br>')
 			for item in found_item:
 				# item = re.sub(r'\(.*\)?', '', item)
-				item = re.sub(r'[\<].*?[\>]', '', item)
-				item = re.sub(r'\<.*', '', item)
+				item = tag_pattern.sub('', item)
+				item = open_tag_pattern.sub('', item)
 				# print(item)
 				items.append(item)
 			# print('\n')
@@ -30,15 +35,9 @@ def val_parser(code='', found_items=''):
 	elif code == 2:
 		if found_items:
 			try:
-				if len(found_items[0]) == 3:
-					value = dateparser.parse(str(found_items[0][0])+' '+str(found_items[0][1])+' '+str(found_items[0][2]))
-					return str(value.year) + '-' + str(value.month) + '-' + str(value.day)
-				elif len(found_items[0]) == 2:
-					value = dateparser.parse(str(found_items[0][0])+' '+str(found_items[0][1]))
-					return str(value.year) + '-' + str(value.month)
-				elif len(found_items[0]) == 1:
-					value = dateparser.parse(str(found_items[0][0]))
-					return str(value.year)
+				if 1 <= len(found_items[0]) <= 3:
+					value = date_normalizer.parse_date(' '.join(str(item) for item in found_items[0]))
+					return date_normalizer.to_string(value)
 			except:
 				found_items = False
 			return ''
@@ -49,6 +48,136 @@ def val_parser(code='', found_items=''):
 
 	return ''
 
+# infobox patterns, compiled once
+# "|key =" - the value patterns are matched from the "=" (group 2), so their
+# leading \s* can give whitespace back to the value like the former per-key patterns did
+key_pattern = re.compile(r'\|\s*([A-Z_]{3,})\s*(\=)\s*', re.IGNORECASE)
+coord_pattern = re.compile(r'\s*({{coord\|(.*)}})', re.IGNORECASE)
+value_pattern = re.compile(r'\s*([^\n\{\}\|\/]{1,}[\w\)]{1,})', re.IGNORECASE)
+date_pattern = re.compile(r'\s*{{[\w\s]*\|\s*(\d+)\|(\d+)\|(\d+)', re.IGNORECASE)
+coord_prefix = '{{coord|'
+# words the tokenizer can emit as keys
+word_pattern = re.compile(r'[A-Z_]{3,}', re.IGNORECASE)
+
+@functools.lru_cache(maxsize=256)
+def word_key_pattern(word=''):
+	""" key_pattern matching only `word` (one of word_pattern), for single-key lookups """
+	return re.compile(r'\|\s*(%s)\s*(\=)\s*' % re.escape(word), re.IGNORECASE)
+
+def clean_date_text(page_text=''):
+	return page_text.replace('|df=yes','').replace('|df=y','').replace(',','').replace('[','').replace(']','')
+
+def tokenize_infobox(page_text='', word=''):
+	"""
+	Walks the text once, yielding every infobox parameter
+
+	@params page_text: text of the Wp page
+	@params word: only yield the parameters of this key (one of word_pattern);
+				the same ones, as keys cannot overlap
+	@return value: (key, raw_value, span) - raw_value is the whole {{coord|...}}
+				template, the plain value or '' if neither is found; span is
+				its position in the text
+
+	"""
+	pattern = word_key_pattern(word) if word else key_pattern
+	for key_match in pattern.finditer(page_text):
+		key = key_match.group(1)
+		start = key_match.end(2)
+
+		m = coord_pattern.match(page_text, start)
+		if not m:
+			m = value_pattern.match(page_text, start)
+
+		if m:
+			yield key, m.group(1), m.span(1)
+		else:
+			yield key, '', (key_match.end(), key_match.end())
+
+def tokenize_template(template=None):
+	"""
+	Like tokenize_infobox, for the parameters of a parsed template
+	(template_parser.Template) - keys of nested templates are not emitted
+	and every value ends with its parameter
+
+	"""
+	source = template.source
+	for key, start, end in template.fields:
+		if not word_pattern.fullmatch(key):
+			continue
+
+		m = coord_pattern.match(source, start, end)
+		if not m:
+			m = value_pattern.match(source, start, end)
+
+		if m:
+			yield key, m.group(1), m.span(1)
+		else:
+			yield key, '', (start, start)
+
+def scan_infobox(page_text='', tokens=None):
+	"""
+	Groups the parameters of the text by (lower-cased) key
+
+	@params page_text: text of the Wp page
+	@params tokens: (key, raw_value, span) to group instead of the text's
+				(e.g. from tokenize_template)
+	@return value: (properties, found) - the keys in order of appearance and,
+				for every key, the raw values search_infobox_value/infobox_value refine
+				(the coordinates if any occurrence has them, else the plain values)
+
+	"""
+	properties = list()
+	coords = dict()
+	coord_ends = dict()
+	values = dict()
+	if tokens is None:
+		tokens = tokenize_infobox(page_text)
+	for key, raw_value, span in tokens:
+		properties.append(key)
+		word = key.lower()
+		if raw_value[:len(coord_prefix)].lower() == coord_prefix:
+			# a template running past the next "|key =" hides it, as in a findall
+			if span[0] >= coord_ends.get(word, 0):
+				coords.setdefault(word, list()).append(raw_value[len(coord_prefix):-2])
+				coord_ends[word] = span[1]
+		elif raw_value:
+			values.setdefault(word, list()).append(raw_value)
+
+	found = dict(values)
+	found.update(coords)
+	return properties, found
+
+def scan_infobox_dates(page_text='', template=None, word=''):
+	"""
+	Finds the first {{date template|y|m|d}} of every key
+
+	@params page_text: text of the Wp page
+	@params template: parsed template (template_parser.Template) to search
+				instead of the text
+	@params word: only search the text for this key (see tokenize_infobox)
+	@return value: dict of lower-cased key -> (year, month, day) strings
+
+	"""
+	dates = dict()
+	if template is not None:
+		for key, start, end in template.fields:
+			word = key.lower()
+			if word not in dates and word_pattern.fullmatch(key):
+				m = date_pattern.match(clean_date_text(template.source[start:end]))
+				if m:
+					dates[word] = m.groups()
+		return dates
+
+	text = clean_date_text(page_text)
+	pattern = word_key_pattern(word) if word else key_pattern
+	for key_match in pattern.finditer(text):
+		word = key_match.group(1).lower()
+		if word not in dates:
+			m = date_pattern.match(text, key_match.end(2))
+			if m:
+				dates[word] = m.groups()
+	return dates
+
 def date_val(page_text='', word=''):
 	if not page_text:
 		print('No text is available.')
@@ -59,13 +188,13 @@ def date_val(page_text='', word=''):
 		return 1
 
 	try:
-		m = re.findall(r'\|\s*%s\s*\=\s*{{[\w\s]*\|\s*(\d+)\|(\d+)\|(\d+)' % word, page_text.replace('|df=yes','').replace('|df=y','').replace(',','').replace('[','').replace(']',''), re.IGNORECASE)
-		return val_parser(code=2, found_items=m)
+		if not word_pattern.fullmatch(word):
+			m = re.findall(r'\|\s*%s\s*\=\s*{{[\w\s]*\|\s*(\d+)\|(\d+)\|(\d+)' % word, clean_date_text(page_text), re.IGNORECASE)
+			return val_parser(code=2, found_items=m)
 
-		m = re.findall(r'\|\s*%s\s*\=\s*([A-Z0-9a-z\s]+)' % word, page_text.replace('|df=yes','').replace('|df=y','').replace(',','').replace('[','').replace(']',''), re.IGNORECASE)
-		if m:
-			m[0] = m[0].split()
-			return val_parser(code=2, found_items=m[0])
+		# one key: only its parameters are scanned
+		m = scan_infobox_dates(page_text, word=word).get(word.lower())
+		return val_parser(code=2, found_items=[m] if m else [])
 
 	except:
 		print('Error in retrieving information for %s date.' % word)
@@ -89,7 +218,7 @@ def search_infobox_prop(page_text=''):
 		return 1
 
 	try:
-		found_items = re.findall(r'\|\s*([A-Z_]{3,})\s*\=\s*', page_text, re.IGNORECASE)
+		found_items = [key for key, raw_value, span in tokenize_infobox(page_text)]
 		return found_items
 	except:
 		print('Error in retrieving information for author')
@@ -109,11 +238,15 @@ def search_infobox_value(page_text='', word=''):
 		return 1
 
 	try:
-		found_items = ''
-		found_items = re.findall(r'\|\s*%s\s*\=\s*{{coord\|(.*)}}' % word, page_text, re.IGNORECASE)
-
-		if not found_items:
-			found_items = re.findall(r'\|\s*%s\s*\=\s*([^\n\{\}\|\/]{1,}[\w\)]{1,})' % word, page_text, re.IGNORECASE)
+		if word_pattern.fullmatch(word):
+			# one key: only its parameters are tokenized
+			properties, found = scan_infobox(tokens=tokenize_infobox(page_text, word=word))
+			found_items = found.get(word.lower(), '')
+		else:
+			# not a key the tokenizer emits (e.g. 'lat2') - search for it directly
+			found_items = re.findall(r'\|\s*%s\s*\=\s*{{coord\|(.*)}}' % word, page_text, re.IGNORECASE)
+			if not found_items:
+				found_items = re.findall(r'\|\s*%s\s*\=\s*([^\n\{\}\|\/]{1,}[\w\)]{1,})' % word, page_text, re.IGNORECASE)
 		# print(found_items)
 
 		if found_items:
@@ -124,7 +257,26 @@ def search_infobox_value(page_text='', word=''):
 
 	return 0
 
-def infobox(page_text='', word='', check_all=''):
+def infobox_value(prop='', found='', dates=''):
+	""" Value of a property from the results of scan_infobox/scan_infobox_dates """
+	if 'date' in prop:
+		m = dates.get(prop.lower())
+		return val_parser(code=2, found_items=[m] if m else [])
+
+	found_items = found.get(prop.lower(), '')
+	if found_items:
+		return val_parser(code=1, found_items=found_items)
+	return 0
+
+def infobox(page_text='', word='', check_all='', template=None):
+	"""
+	Extracts the properties of an infobox
+
+	@param page_text: text of the infobox
+	@param template: the infobox parsed by template_parser - only its own
+				parameters are read then, not those of nested templates
+
+	"""
 	# print(page_text)
 	if not page_text:
 		print('No text is present.\n')
@@ -133,7 +285,14 @@ def infobox(page_text='', word='', check_all=''):
 	if word:
 		print(search_infobox_value(page_text=page_text, word=word))
 	else:
-		properties = search_infobox_prop(page_text=page_text)
+		# one pass over the text for all the properties (and one for the dates)
+		if template is not None:
+			properties, found = scan_infobox(tokens=tokenize_template(template))
+		else:
+			properties, found = scan_infobox(page_text=page_text)
+		dates = dict()
+		if any('date' in prop for prop in properties):
+			dates = scan_infobox_dates(page_text=page_text, template=template)
 		print('Found ' + str(len(properties)) + ' properties.\n')
 		indices = list()
 
@@ -160,10 +319,7 @@ def infobox(page_text='', word='', check_all=''):
 			for index in indices:
 				prop = properties[index - 1]
 
-				if 'date' in prop:
-					value = date_val(page_text=page_text, word=prop)
-				else:
-					value = search_infobox_value(page_text=page_text, word=prop)
+				value = infobox_value(prop=prop, found=found, dates=dates)
 				# print(value)
 				try:
 					propval_pair[str(prop)] = value[0]
@@ -173,10 +329,7 @@ def infobox(page_text='', word='', check_all=''):
 
 		else:
 			for prop in properties:
-				if 'date' in prop:
-					value = date_val(page_text=page_text, word=prop)
-				else:
-					value = search_infobox_value(page_text=page_text, word=prop)
+				value = infobox_value(prop=prop, found=found, dates=dates)
 				try:
 					if len(value) == 1:
 						propval_pair[str(prop)] = value[0]
@@ -3,12 +3,13 @@
 
 import re
 import pywikibot
-import dateparser
 import datetime
 import base_ops as base
-
-enwd = pywikibot.Site('wikidata', 'wikidata')
-repo = enwd.data_repository()
+import date_normalizer
+import plan
+import search_patterns
+import template_parser
+import tracing
 
 """ 
 =========================
@@ -121,25 +122,67 @@ def searchPropValue(text='', word=''):
 
 	return 0
 
-def searchInfobox(text=''):
+def searchTemplateProp(template=None):
+	"""
+	Searches for all the properties of a parsed infobox (template_parser.Template)
+
+	@return value: list of property names, 'Ship ...' ones if there are any
+
+	"""
+	properties = [name for name in template.params if re.fullmatch(r'Ship [\sA-Z_]{3,}', name, re.IGNORECASE)]
+	if not properties:
+		properties = [name for name in template.params if re.fullmatch(r'[\sA-Z_]{3,}', name, re.IGNORECASE)]
+	return properties
+
+def searchTemplateValue(template=None, word=''):
+	"""
+	Searches for values of a property of a parsed infobox; nested templates
+	other than {{coord}} end the value, as in searchPropValue
+
+	"""
+	coords = list()
+	values = list()
+	for name, start, end in template.fields:
+		if name == word:
+			m = search_patterns.coord_pattern.match(template.source, start, end)
+			if m:
+				coords.append(m.group(2))
+				continue
+			m = search_patterns.value_pattern.match(template.source, start, end)
+			if m:
+				values.append(m.group(1))
+
+	found_items = coords or values
+	if found_items:
+		return valParser(found_items=found_items)
+	return 0
+
+def searchInfobox(text='', template=None):
 	"""
 	Searches for information from the infobox
 
 	@params text: text of the Wp page
+	@params template: the infobox parsed by template_parser (used instead of text)
 	@return value (dict): list of values 
 
 	"""
 	# print(text)
-	if not text:
+	if not text and template is None:
 		print('No text is present.\n')
 		return None
 
-	properties = searchProp(text=text)
+	if template is not None:
+		properties = searchTemplateProp(template=template)
+	else:
+		properties = searchProp(text=text)
 	print('Found ' + str(len(properties)) + ' properties.\n')
 
 	propval_pair = dict()
 	for prop in properties:
-		value = searchPropValue(text=text, word=prop)
+		if template is not None:
+			value = searchTemplateValue(template=template, word=prop)
+		else:
+			value = searchPropValue(text=text, word=prop)
 		
 		try:
 			if len(value) == 1:
@@ -184,8 +227,7 @@ def checkExistence(claim='', prop_id='', prop_value=''):
 
 		elif prop_id in wikibase_item:
 			wd_propval = item_value.title()
-			wdpage_val = base.WdPage(wd_value=wd_propval)
-			wdpage_value = wdpage_val.page.labels['en'].lower()
+			wdpage_value = base.getLabel(wd_propval).lower()
 			prop_value_refined = prop_value.replace('[', '').replace(']', '')
 			if prop_value_refined.lower() == wdpage_value:
 				return True
@@ -200,6 +242,7 @@ def checkExistence(claim='', prop_id='', prop_value=''):
 
 	return False
 
+@tracing.traced()
 def addToWd(wp_page='', wd_page='', prop_id='', prop_value='', prop_list=''):
 	""" Adds info to Wikidata """
 
@@ -285,17 +328,8 @@ def addDateQualifier(wd_page='', prop_id='', prop_val='', qual_id='', date=''):
 
 	# convert to appropriate format
 	if date and not re.search(r'\d-\d-\d', date, re.IGNORECASE):
-		date = date.split()
 		try:
-			if len(date) == 3:
-				value = dateparser.parse(str(date[0])+' '+str(date[1])+' '+str(date[2]))
-				date = str(value.year) + '-' + str(value.month) + '-' + str(value.day)
-			elif len(date) == 2:
-				value = dateparser.parse(str(date[0])+' '+str(date[1]))
-				date = str(value.year) + '-' + str(value.month)
-			elif len(date) == 1:
-				value = dateparser.parse(str(date[0]))
-				date = str(value.year)
+			date = date_normalizer.to_string(date_normalizer.parse_date(date))
 		except:
 			print('Error in extracting date.\n')
 			return
@@ -337,17 +371,20 @@ def addDateQualifier(wd_page='', prop_id='', prop_val='', qual_id='', date=''):
 					try:
 						for item in items:
 							if item.getTarget().title() == prop_val:
-								qualifier = pywikibot.Claim(repo, qual_id)
-
 								if len(date.split('-')) == 3:
-									qualifier.setTarget(pywikibot.WbTime(year=int(date.split('-')[0]), month=int(date.split('-')[1]), day=int(date.split('-')[2])))
+									qualval = pywikibot.WbTime(year=int(date.split('-')[0]), month=int(date.split('-')[1]), day=int(date.split('-')[2]))
 								elif len(date.split('-')) == 2:
-									qualifier.setTarget(pywikibot.WbTime(year=int(date.split('-')[0]), month=int(date.split('-')[1])))
+									qualval = pywikibot.WbTime(year=int(date.split('-')[0]), month=int(date.split('-')[1]))
 								elif len(date.split('-')) == 1:
-									qualifier.setTarget(pywikibot.WbTime(year=int(date.split('-')[0])))
-
-								item.addQualifier(qualifier, summary='Adding 1 qualifier')
-								wd_page.page = pywikibot.ItemPage(enwd, wd_page.wd_value)
+									qualval = pywikibot.WbTime(year=int(date.split('-')[0]))
+
+								if wd_page.isPending(item):
+									# saved along with the claim at the end of the batch
+									wd_page.attachQualifier(claim=item, qualifier_id=qual_id, qualval=qualval)
+								else:
+									qualifier = pywikibot.Claim(base.getRepo(), qual_id)
+									qualifier.setTarget(qualval)
+									wd_page.submitQualifier(claim=item, qualifier=qualifier)
 								print('Qualifier added successfully.\n')
 
 					except:
@@ -356,6 +393,7 @@ def addDateQualifier(wd_page='', prop_id='', prop_val='', qual_id='', date=''):
 
 def main():
 	article_name = 'INS Kochi'
+	tracing.setArticle(title=article_name)
 	wp_page = base.WpPage(article_name)
 
 	# check for existence of page
@@ -366,16 +404,11 @@ def main():
 		""" Extracting info from infobox and adding to Wikidata """
 		# find info from the infobox
 		info_box = list()
-		text_screened = re.findall(r'\{\{Infobox .*[\n]*', wp_page.page.text, re.DOTALL)
-		if text_screened:
-			text = text_screened[0].split('==')
-			text = text[0].rsplit('\n}}')
-
-			for txt in text:
-				if re.search(r'{{Infobox', txt, re.IGNORECASE):
-					res = searchInfobox(text=txt)
-					if res:
-						info_box.append(res)
+		# {{Infobox ship begin}}, {{Infobox ship career}}, ... each parsed separately
+		for infobox in template_parser.find_infoboxes(wp_page.page.text):
+			res = searchInfobox(template=infobox)
+			if res:
+				info_box.append(res)
 
 		# get the Wd page
 		wd_page = ''
@@ -390,41 +423,51 @@ def main():
 			# iterate through each info extracted from infobox
 			# print(info_box)
 
-			for info in info_box:
-				for prop in info.keys():
-					wdprop = prop
-					if re.search(r'Ship\s*[\w]+', prop, re.IGNORECASE):
-						wdprop = re.sub(r'Ship\s*', '', prop, flags=re.IGNORECASE)
-					wdprop = wdprop.strip()
-					print(str(wdprop) + ': ' + str(info[prop]))
-					if wdprop in prop_ids:
-						try:
-							# multiple values for a prop - add each value separately
-							if type(info[prop]) is list:
-								for val in info[prop]:
-									try:
-										addToWd(wp_page=wp_page, wd_page=wd_page, prop_id=prop_ids[str(wdprop)], prop_value=val, prop_list=info)
-									except:
-										print('Error adding property.')
-										continue
-							else:
-								addToWd(wp_page=wp_page, wd_page=wd_page, prop_id= prop_ids[str(wdprop)], prop_value=info[prop], prop_list=info)
-
-							print('\n')
-						except:
-							pass
-					elif wdprop in propval_ids:
-						try:
-							significant_event = addToWd(wp_page=wp_page, wd_page=wd_page, prop_id='P793', prop_value=propval_ids[wdprop])
-							# wd_page = base.WdPage(wd_value='Q4115189')
-							if not significant_event:
-								addDateQualifier(wd_page=wd_page, prop_id='P793', prop_val=propval_ids[wdprop], qual_id='P585', date=info[prop])
-						except:
-							print('Error adding significant event.')
+			# labels of the item's current values, for the existence checks
+			wd_page.preloadLabels()
+			# claims, references and qualifiers of the item are saved in one edit
+			try:
+				with wd_page.batch():
+					for info in info_box:
+						for prop in info.keys():
+							wdprop = prop
+							if re.search(r'Ship\s*[\w]+', prop, re.IGNORECASE):
+								wdprop = re.sub(r'Ship\s*', '', prop, flags=re.IGNORECASE)
+							wdprop = wdprop.strip()
+							print(str(wdprop) + ': ' + str(info[prop]))
+							if wdprop in prop_ids:
+								try:
+									# multiple values for a prop - add each value separately
+									if type(info[prop]) is list:
+										for val in info[prop]:
+											try:
+												addToWd(wp_page=wp_page, wd_page=wd_page, prop_id=prop_ids[str(wdprop)], prop_value=val, prop_list=info)
+											except:
+												print('Error adding property.')
+												continue
+									else:
+										addToWd(wp_page=wp_page, wd_page=wd_page, prop_id= prop_ids[str(wdprop)], prop_value=info[prop], prop_list=info)
+
+									print('\n')
+								except:
+									pass
+							elif wdprop in propval_ids:
+								try:
+									significant_event = addToWd(wp_page=wp_page, wd_page=wd_page, prop_id='P793', prop_value=propval_ids[wdprop])
+									# wd_page = base.WdPage(wd_value='Q4115189')
+									if not significant_event:
+										addDateQualifier(wd_page=wd_page, prop_id='P793', prop_val=propval_ids[wdprop], qual_id='P585', date=info[prop])
+								except:
+									print('Error adding significant event.')
+			except Exception as e:
+				# the claims of the article are discarded (see batch)
+				print('Error importing %s: %s. Skipping...\n' % (wp_page.title, e))
 
 
 	else:
 		print('No such page exists. Skipping...\n')
 
 if __name__ == "__main__":
+	# --plan FILE: write the edits to FILE instead of making them (see plan.py)
+	plan.installFromArguments()
 	main()
@@ -0,0 +1,143 @@
+# File name: soccerway.py
+# Polite client for int.soccerway.com: a per-host concurrency limit and delay between requests,
+# profile pages memoized for the run (and kept for a week by the shared HTTP cache) and
+# concurrent fetching of the candidates of a search
+
+import contextvars
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import http_client
+import label_resolver
+import tracing
+
+BASE_URL = 'https://int.soccerway.com'
+
+DEFAULT_MAX_CONCURRENT = 2
+# seconds between the starts of two requests to the site
+DEFAULT_DELAY = 1.0
+
+
+def profileURL(soccerway_id=''):
+	return '%s/players/%s/' % (BASE_URL, soccerway_id.strip('/'))
+
+def searchURL(player_name=''):
+	return '%s/search/players/?q=%s' % (BASE_URL, urllib.parse.quote_plus(player_name))
+
+
+class SoccerwayClient:
+	"""
+	Fetches Soccerway pages through the shared http_client session
+
+	@param max_concurrent: maximum number of requests to the site at once
+	@param delay: minimum time (seconds) between the starts of two requests;
+				pages served from the HTTP cache are not delayed
+	@param maxsize: number of profile pages kept in memory
+
+	"""
+
+	def __init__(self, max_concurrent=DEFAULT_MAX_CONCURRENT, delay=DEFAULT_DELAY, maxsize=1000):
+		self.max_concurrent = max_concurrent
+		self.delay = delay
+		self.slots = threading.BoundedSemaphore(max_concurrent)
+		self.lock = threading.Lock()
+		self.next_request = 0.0
+		self.profiles = label_resolver.LRUCache(maxsize)
+		self.stats = {'requests': 0, 'cached': 0, 'memoized': 0}
+
+	def isCached(self, url=''):
+		cache = http_client.getSession().cache
+		if cache is None:
+			return False
+		entry = cache.lookup(url)
+		return entry is not None and entry.isFresh()
+
+	def wait(self):
+		""" Reserves the next request slot and sleeps until it comes """
+		with self.lock:
+			now = time.monotonic()
+			start = max(now, self.next_request)
+			self.next_request = start + self.delay
+		if start > now:
+			time.sleep(start - now)
+
+	def get(self, url=''):
+		""" Returns the body of a page as text ('' on failure) """
+		with tracing.span('soccerway.get', url=url) as s:
+			if self.isCached(url):
+				s.attrs['cached'] = True
+				self.stats['cached'] += 1
+				return http_client.getURL(url=url)
+
+			with self.slots:
+				self.wait()
+				self.stats['requests'] += 1
+				return http_client.getURL(url=url)
+
+	def search(self, player_name=''):
+		""" Search result page of a player name """
+		return self.get(searchURL(player_name))
+
+	def profile(self, soccerway_id=''):
+		""" Profile page of a player ('' if it could not be fetched) """
+		key = soccerway_id.strip('/')
+		raw = self.profiles.get(key)
+		if raw is not None:
+			self.stats['memoized'] += 1
+			return raw
+
+		raw = self.get(profileURL(key))
+		if raw:
+			self.profiles.put(key, raw)
+		return raw
+
+	def fetchProfiles(self, soccerway_ids=None):
+		"""
+		Fetches the profiles of several players concurrently
+
+		Yields (soccerway_id, raw) as the pages arrive, memoized ones first;
+		profiles not yet fetched are dropped when the caller stops iterating.
+
+		"""
+		soccerway_ids = list(soccerway_ids or [])
+		pending = list()
+		for soccerway_id in soccerway_ids:
+			raw = self.profiles.get(soccerway_id.strip('/'))
+			if raw is not None:
+				self.stats['memoized'] += 1
+				yield soccerway_id, raw
+			else:
+				pending.append(soccerway_id)
+		if not pending:
+			return
+
+		executor = ThreadPoolExecutor(max_workers=min(self.max_concurrent, len(pending)))
+		try:
+			# each fetch keeps the article the caller traces
+			futures = dict((executor.submit(contextvars.copy_context().run, self.profile, soccerway_id), soccerway_id)
+							for soccerway_id in pending)
+			for future in as_completed(futures):
+				yield futures[future], future.result()
+		finally:
+			executor.shutdown(wait=False, cancel_futures=True)
+
+
+client = None
+client_lock = threading.Lock()
+
+def getClient():
+	""" Returns the client shared by the Soccerway scripts """
+	global client
+	with client_lock:
+		if client is None:
+			client = SoccerwayClient()
+		return client
+
+def configure(**kwargs):
+	""" Replaces the shared client with one built from the given settings (see SoccerwayClient) """
+	global client
+	with client_lock:
+		client = SoccerwayClient(**kwargs)
+		return client
@@ -0,0 +1,56 @@
+# File name: soccerway_parser.py
+# Single-pass extraction from Soccerway pages: the players of a search result page and the
+# fields of a player's profile, each with one precompiled pattern scanned once over the page
+
+import collections
+import html
+import re
+
+# a player of a search result page
+PlayerRecord = collections.namedtuple('PlayerRecord', ['soccerway_id', 'display_name', 'profile_path'])
+
+# <td class="player"><a href="/players/john-smith/123456/" class="...">John Smith</a>
+player_pattern = re.compile(r'<td class="player"[^>]*>\s*<a\b[^>]*?\bhref="(/players/[^"]*)"[^>]*>(.*?)</a>',
+							re.IGNORECASE | re.DOTALL)
+# <dd data-date_of_birth="date_of_birth">12 March 1990</dd>
+field_pattern = re.compile(r'<dd\b[^>]*?\bdata-([\w\-]+)="[^"]*"[^>]*>(.*?)</dd>', re.IGNORECASE | re.DOTALL)
+tag_pattern = re.compile(r'<[^>]*>')
+
+
+def soccerway_id_of(profile_path=''):
+	""" 'john-smith/123456' for '/players/john-smith/123456/' """
+	return profile_path[len('/players/'):].strip('/')
+
+def text_of(fragment=''):
+	""" Text of an html fragment: tags dropped, entities decoded, whitespace collapsed """
+	if '<' in fragment:
+		fragment = tag_pattern.sub('', fragment)
+	if '&' in fragment:
+		fragment = html.unescape(fragment)
+	return ' '.join(fragment.split())
+
+def iter_search_results(raw=''):
+	""" Yields the PlayerRecords of a search result page in order, as the scan reaches them """
+	for m in player_pattern.finditer(raw):
+		profile_path = m.group(1)
+		if '&' in profile_path:
+			profile_path = html.unescape(profile_path)
+		yield PlayerRecord(soccerway_id_of(profile_path), text_of(m.group(2)), profile_path)
+
+def parse_search_results(raw=''):
+	""" Every PlayerRecord of a search result page, in order """
+	return list(iter_search_results(raw))
+
+def parse_profile(raw=''):
+	"""
+	{field: text} of the <dd data-field="field"> fields of a profile page
+	('first_name', 'last_name', 'date_of_birth', 'nationality', ...); the
+	first occurrence of a field wins
+
+	"""
+	fields = dict()
+	for m in field_pattern.finditer(raw):
+		field = m.group(1).lower()
+		if field not in fields:
+			fields[field] = text_of(m.group(2))
+	return fields
@@ -0,0 +1,188 @@
+# File name: template_parser.py
+# Linear-time wikitext template parser: tracks {{template}} and [[link]] depth so that
+# nested templates ({{coord}}, {{plainlist}}, {{start date}}, ...) stay inside their parameter
+
+import collections
+import re
+
+# everything that can change the depth, end a parameter or start a comment
+token_pattern = re.compile(r'\{\{|\}\}|\[\[|\]\]|\||=|<!--')
+
+
+class Template:
+	"""
+	A template call of a page
+
+	@attr name: template name ('Infobox ship career')
+	@attr params: ordered dict of parameter name -> value (named parameters
+				stripped, positional ones named '1', '2', ... and kept as is)
+	@attr fields: every parameter as (name, value_start, value_end) in the
+				page text, duplicates included
+	@attr templates: templates nested directly in this one
+	@attr start, end: position of the call in the page text
+
+	"""
+
+	def __init__(self, source='', start=0):
+		self.source = source
+		self.start = start
+		self.end = start
+		self.name = ''
+		self.params = collections.OrderedDict()
+		self.fields = list()
+		self.templates = list()
+
+	@property
+	def text(self):
+		return self.source[self.start:self.end]
+
+	def get(self, name='', default=''):
+		return self.params.get(name, default)
+
+	def rawValue(self, name=''):
+		""" Unstripped text of the last occurrence of a parameter ('' if missing) """
+		for field_name, start, end in reversed(self.fields):
+			if field_name == name:
+				return self.source[start:end]
+		return ''
+
+	def templatesIn(self, name=''):
+		""" Templates nested in the value of a parameter """
+		spans = [(start, end) for field_name, start, end in self.fields if field_name == name]
+		return [template for template in self.templates if any(start <= template.start < end for start, end in spans)]
+
+	def isInfobox(self):
+		return self.name.lower().startswith('infobox')
+
+	def walk(self):
+		""" This template and every template nested in it, in order of appearance """
+		yield self
+		for template in self.templates:
+			for nested in template.walk():
+				yield nested
+
+	def __repr__(self):
+		return 'Template(%r, %d params, %d nested)' % (self.name, len(self.params), len(self.templates))
+
+
+class Frame:
+	""" Parsing state of a template whose closing braces are not reached yet """
+
+	def __init__(self, template=None, segment_start=0):
+		self.template = template
+		self.segment_start = segment_start
+		self.equals = None
+		self.positional = 0
+		self.named = False
+
+	def closeSegment(self, end=0):
+		""" Ends the template name or the current parameter at `end` """
+		template = self.template
+		text = template.source
+		if not self.named:
+			template.name = text[self.segment_start:end].strip()
+			self.named = True
+		elif self.equals is not None:
+			name = text[self.segment_start:self.equals].strip()
+			template.fields.append((name, self.equals + 1, end))
+			template.params[name] = text[self.equals + 1:end].strip()
+		else:
+			self.positional += 1
+			name = str(self.positional)
+			template.fields.append((name, self.segment_start, end))
+			template.params[name] = text[self.segment_start:end]
+		self.equals = None
+
+
+# marks an open [[link]] on the stack
+LINK = 'link'
+
+def parse_templates(text=''):
+	"""
+	Parses every template of a page in one pass
+
+	Pipes and equal signs only count at the template's own level, so they
+	may appear freely inside nested templates and [[links|labels]].
+	Templates left unclosed at the end of the text are dropped.
+
+	@param text: wikitext of the page
+	@return value: list of the top-level Templates (nested ones are in their
+				parent's `templates`)
+
+	"""
+	roots = list()
+	stack = list()
+	pos = 0
+	while True:
+		m = token_pattern.search(text, pos)
+		if not m:
+			break
+		token = m.group()
+		pos = m.end()
+
+		if token == '<!--':
+			end = text.find('-->', pos)
+			pos = len(text) if end == -1 else end + 3
+			continue
+
+		if token == '{{':
+			if text.startswith('{', pos):
+				# {{{parameter}}} of a template definition - not a call
+				end = text.find('}}}', pos)
+				pos = len(text) if end == -1 else end + 3
+				continue
+			stack.append(Frame(template=Template(source=text, start=m.start()), segment_start=pos))
+			continue
+
+		if not stack:
+			continue
+
+		if token == '[[':
+			stack.append(LINK)
+		elif token == ']]':
+			if stack[-1] is LINK:
+				stack.pop()
+		elif token == '}}':
+			# links left open inside the template end with it
+			while stack and stack[-1] is LINK:
+				stack.pop()
+			if not stack:
+				continue
+			frame = stack.pop()
+			frame.closeSegment(m.start())
+			frame.template.end = pos
+
+			parent = None
+			for outer in reversed(stack):
+				if outer is not LINK:
+					parent = outer
+					break
+			if parent:
+				parent.template.templates.append(frame.template)
+			else:
+				roots.append(frame.template)
+		elif stack[-1] is LINK:
+			continue
+		elif token == '|':
+			stack[-1].closeSegment(m.start())
+			stack[-1].segment_start = pos
+		elif token == '=':
+			frame = stack[-1]
+			if frame.named and frame.equals is None:
+				frame.equals = m.start()
+
+	return roots
+
+def find_templates(text='', name=''):
+	""" Every template (nested ones included) whose name starts with `name`, in order of appearance """
+	name = name.lower()
+	templates = list()
+	for root in parse_templates(text):
+		for template in root.walk():
+			if template.name.lower().startswith(name):
+				templates.append(template)
+	return templates
+
+def find_infoboxes(text=''):
+	""" Every infobox of a page ({{Infobox ...}}, nested ones included), in order of appearance """
+	return find_templates(text=text, name='infobox')
@@ -0,0 +1,257 @@
+# File name: tracing.py
+# Lightweight timing spans for the import scripts: every span (fetch, infobox parsing, item load,
+# label resolution, existence check, write, ...) is written as a json line with the article title
+# and QID, and a p50/p95/p99 summary per stage is printed at the end of the run
+
+import atexit
+import collections
+import contextlib
+import contextvars
+import functools
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+DEFAULT_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'outreachy-wmf', 'traces')
+
+# article being worked on ({'title': ..., 'qid': ...}), set by setArticle()
+current_article = contextvars.ContextVar('current_article', default=None)
+# innermost open span
+current_span = contextvars.ContextVar('current_span', default=None)
+
+span_ids = itertools.count(1)
+
+
+class Span:
+	"""
+	A timed piece of work
+
+	@attr name: stage name ('WpPage.findInfobox', 'getURL', ...)
+	@attr attrs: title, qid and anything else worth recording; may be
+				added to while the span is open
+
+	"""
+
+	def __init__(self, name='', attrs=None):
+		self.name = name
+		self.attrs = attrs or dict()
+		self.id = next(span_ids)
+		self.parent = None
+		self.start = 0.0
+		self.duration = 0.0
+		self.error = ''
+
+
+class Tracer:
+	"""
+	Collects the spans of a run
+
+	@param path: json lines file the spans are appended to ('' - keep only
+				the durations for the summary)
+
+	"""
+
+	def __init__(self, path=''):
+		self.path = path
+		self.file = None
+		self.lock = threading.Lock()
+		self.durations = collections.defaultdict(list)
+		self.errors = collections.defaultdict(int)
+		if path:
+			directory = os.path.dirname(path)
+			if directory:
+				os.makedirs(directory, exist_ok=True)
+			self.file = open(path, 'a', encoding='utf-8')
+
+	def record(self, span=None):
+		line = None
+		if self.file is not None:
+			line = dict(span.attrs, name=span.name, id=span.id, parent=span.parent,
+						start=round(span.start, 6), ms=round(span.duration * 1000, 3),
+						thread=threading.current_thread().name)
+			if span.error:
+				line['error'] = span.error
+			line = json.dumps(line, default=str)
+		with self.lock:
+			self.durations[span.name].append(span.duration)
+			if span.error:
+				self.errors[span.name] += 1
+			if line is not None:
+				self.file.write(line + '\n')
+
+	def summary(self):
+		""" (stage, count, errors, total seconds, p50, p95, p99 in ms) of every stage, slowest first """
+		rows = list()
+		with self.lock:
+			for name, durations in self.durations.items():
+				durations = sorted(durations)
+				rows.append((name, len(durations), self.errors[name], sum(durations),
+							percentile(durations, 50) * 1000, percentile(durations, 95) * 1000, percentile(durations, 99) * 1000))
+		return sorted(rows, key=lambda row: row[3], reverse=True)
+
+	def printSummary(self):
+		rows = self.summary()
+		if not rows:
+			return
+		print('\n%-32s %7s %6s %10s %10s %10s %10s' % ('stage', 'count', 'errors', 'total (s)', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)'))
+		for row in rows:
+			print('%-32s %7d %6d %10.1f %10.1f %10.1f %10.1f' % row)
+		if self.path:
+			print('Spans written to %s' % self.path)
+
+	def close(self):
+		with self.lock:
+			if self.file is not None:
+				self.file.close()
+				self.file = None
+
+
+def percentile(values=None, p=50):
+	""" Nearest-rank percentile of sorted values """
+	if not values:
+		return 0.0
+	rank = max(1, -(-len(values) * p // 100))
+	return values[min(rank, len(values)) - 1]
+
+
+"""
+=======
+Tracing
+=======
+"""
+tracer = None
+tracer_lock = threading.Lock()
+# tracing switched off ($WMF_TRACE=off or disable())
+disabled = False
+
+def defaultPath():
+	script = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0] or 'python'
+	return os.path.join(DEFAULT_DIR, '%s-%s-%d.jsonl' % (script, time.strftime('%Y%m%d-%H%M%S'), os.getpid()))
+
+def getTracer():
+	"""
+	Returns the tracer of the run, created on the first span; the spans go
+	to $WMF_TRACE (default: a new file in DEFAULT_DIR) and the summary is
+	printed at exit
+
+	"""
+	global tracer
+	with tracer_lock:
+		if tracer is None:
+			path = os.environ.get('WMF_TRACE', '') or defaultPath()
+			tracer = Tracer(path=path)
+		return tracer
+
+def configure(path=''):
+	""" Sends the spans to `path` from now on ('' - summary only) """
+	global tracer, disabled
+	with tracer_lock:
+		if tracer is not None:
+			tracer.close()
+		tracer = Tracer(path=path)
+		disabled = False
+	return tracer
+
+def disable():
+	global disabled
+	disabled = True
+
+def setArticle(title='', qid=''):
+	"""
+	Names the article being worked on: spans opened from now on (in this
+	thread or task) get its title and QID, until the next call
+
+	"""
+	attrs = dict()
+	if title:
+		attrs['title'] = title
+	if qid:
+		attrs['qid'] = qid
+	current_article.set(attrs)
+
+@contextlib.contextmanager
+def span(name='', **attrs):
+	"""
+	Times the enclosed block
+
+	Usage:
+		with tracing.span('getURL', url=url) as s:
+			...
+			s.attrs['status'] = status
+
+	"""
+	if disabled:
+		yield Span(name=name, attrs=attrs)
+		return
+
+	article_attrs = current_article.get()
+	if article_attrs:
+		attrs = dict(article_attrs, **attrs)
+	current = Span(name=name, attrs=attrs)
+	parent = current_span.get()
+	if parent is not None:
+		current.parent = parent.id
+	token = current_span.set(current)
+	current.start = time.time()
+	started = time.perf_counter()
+	try:
+		yield current
+	except BaseException as e:
+		current.error = type(e).__name__
+		raise
+	finally:
+		current.duration = time.perf_counter() - started
+		current_span.reset(token)
+		getTracer().record(current)
+
+def pageAttrs(page=None):
+	""" Title/QID of a WpPage or WdPage (empty for anything else) """
+	attrs = dict()
+	title = getattr(page, 'title', None)
+	if isinstance(title, str):
+		attrs['title'] = title
+	qid = getattr(page, 'wd_value', None)
+	if isinstance(qid, str):
+		attrs['qid'] = qid
+	return attrs
+
+def traced(name=''):
+	"""
+	Decorator timing every call of a function as a span named `name`
+	(default: its qualified name); the title/QID of the WpPage/WdPage it
+	works on (self, wp_page= or wd_page=) are added once the call returns
+
+	"""
+	def decorator(function):
+		stage = name or function.__qualname__
+
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			if disabled:
+				return function(*args, **kwargs)
+			with span(stage) as s:
+				try:
+					return function(*args, **kwargs)
+				finally:
+					for page in list(args[:1]) + [kwargs.get('wp_page'), kwargs.get('wd_page')]:
+						for key, value in pageAttrs(page).items():
+							s.attrs.setdefault(key, value)
+		return wrapper
+	return decorator
+
+def printSummary():
+	if tracer is not None:
+		tracer.printSummary()
+
+def shutdown():
+	if tracer is not None:
+		tracer.printSummary()
+		tracer.close()
+
+atexit.register(shutdown)
+
+if os.environ.get('WMF_TRACE', '').lower() == 'off':
+	disable()
@@ -0,0 +1,346 @@
+# File name: wikidata_dump.py
+# Local sqlite index of a Wikidata JSON dump (latest-all.json.gz/.bz2), streamed line by line in
+# constant memory: the enwiki sitelink, the labels and the claims of only the properties the
+# scripts use, so that WdPage, getLabels and resolveTitles can read without the API as long as the
+# dump is recent enough
+#
+# usage: python wikidata_dump.py build latest-all.json.bz2 [--index PATH] [--langs en] [--props P..]
+#        python wikidata_dump.py info [--index PATH]
+# then:  WMF_WIKIDATA_DUMP=PATH python guerrilla_movements.py
+
+import argparse
+import ast
+import atexit
+import bz2
+import datetime
+import gzip
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+import tracing
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'outreachy-wmf', 'wikidata_dump.sqlite')
+# days after the dump was taken during which its data is used (see getIndex)
+DEFAULT_MAX_AGE = 14
+DEFAULT_LANGS = ['en']
+
+# scripts whose properties are indexed, with P31 (instance of)
+SCRIPTS = [
+	'guerrilla_movements.py',
+	'historicplaces_browncounty_wisconsin.py',
+	'historicplaces_passaiccounty_newjersey.py',
+	'historicplaces_riverhead_ny.py',
+	'import_soccerway_id.py',
+	'list_folk_heroes.py',
+	'msft_codenames.py',
+	'ships.py',
+]
+BASE_PROPS = ['P31']
+
+# rows written per transaction while building
+BATCH = 10000
+
+
+def scriptProperties(directory=''):
+	"""
+	Every property ID written as a string in the scripts (prop_ids, prop_id,
+	qualifiers, references), read without importing them
+
+	"""
+	directory = directory or os.path.dirname(os.path.abspath(__file__))
+	props = set(BASE_PROPS)
+	for script in SCRIPTS:
+		path = os.path.join(directory, script)
+		if not os.path.exists(path):
+			continue
+		with open(path, encoding='utf-8') as f:
+			tree = ast.parse(f.read(), filename=path)
+		for node in ast.walk(tree):
+			if isinstance(node, ast.Constant) and isinstance(node.value, str) and re.match(r'^P\d+$', node.value):
+				props.add(node.value)
+	return sorted(props, key=lambda prop: int(prop[1:]))
+
+def openDump(path=''):
+	""" Text stream of a dump, decompressed on the fly (.gz, .bz2 or plain) """
+	if path.endswith('.gz'):
+		return gzip.open(path, 'rt', encoding='utf-8')
+	if path.endswith('.bz2'):
+		return bz2.open(path, 'rt', encoding='utf-8')
+	return open(path, encoding='utf-8')
+
+def iterEntities(path=''):
+	""" Yields the entities of a dump one at a time (one entity per line, inside a json array) """
+	with openDump(path) as f:
+		for line in f:
+			line = line.strip()
+			if line.endswith(','):
+				line = line[:-1]
+			if not line or line in ['[', ']']:
+				continue
+			try:
+				yield json.loads(line)
+			except ValueError:
+				print('Invalid dump line skipped: %s...' % line[:80])
+
+def slimEntity(entity=None, props=None, langs=None):
+	"""
+	The part of an entity the index keeps, in the layout of wbgetentities:
+	labels in `langs`, the enwiki sitelink and the claims of `props` (with
+	their qualifiers and references, which addImportedFrom and the plan
+	checks compare against)
+
+	"""
+	claims = dict()
+	for prop_id in props:
+		statements = entity.get('claims', dict()).get(prop_id)
+		if statements:
+			claims[prop_id] = statements
+	sitelinks = dict()
+	if 'enwiki' in entity.get('sitelinks', dict()):
+		sitelinks['enwiki'] = {'site': 'enwiki', 'title': entity['sitelinks']['enwiki']['title']}
+	return {
+		'id': entity['id'],
+		'type': entity.get('type', 'item'),
+		'lastrevid': entity.get('lastrevid'),
+		'modified': entity.get('modified', ''),
+		'labels': dict((lang, label) for lang, label in entity.get('labels', dict()).items() if lang in langs),
+		'sitelinks': sitelinks,
+		'claims': claims,
+	}
+
+def parseTimestamp(text=''):
+	""" time.time() of a dump timestamp ('2024-01-31T12:00:00Z') """
+	return datetime.datetime.strptime(text, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+class DumpIndex:
+	"""
+	Read access to an index built by build()
+
+	@param path: sqlite file of the index
+	@param max_age: days after the dump snapshot during which isFresh()
+				is True
+
+	"""
+
+	def __init__(self, path=DEFAULT_PATH, max_age=DEFAULT_MAX_AGE):
+		self.path = path
+		self.max_age = max_age
+		self.db = sqlite3.connect('file:%s?mode=ro' % path, uri=True, check_same_thread=False)
+		self.lock = threading.Lock()
+		self.meta = dict(self.db.execute('SELECT key, value FROM meta').fetchall())
+		self.stats = {'entities': 0, 'labels': 0, 'titles': 0, 'misses': 0}
+
+	def snapshot(self):
+		""" time.time() of the newest edit in the dump """
+		return parseTimestamp(self.meta.get('snapshot', '1970-01-01T00:00:00Z'))
+
+	def age(self):
+		""" Days since the dump snapshot """
+		return (time.time() - self.snapshot()) / 86400.0
+
+	def isFresh(self):
+		return self.age() <= self.max_age
+
+	def properties(self):
+		return self.meta.get('props', '').split(',')
+
+	def entity(self, qid=''):
+		""" Entity data (wbgetentities layout, indexed claims only), None if not in the index """
+		with self.lock:
+			row = self.db.execute('SELECT data FROM entities WHERE qid = ?', (qid,)).fetchone()
+		if row is None:
+			self.stats['misses'] += 1
+			return None
+		self.stats['entities'] += 1
+		return json.loads(row[0])
+
+	def qidOf(self, title=''):
+		""" QID of the item of an enwiki article, None if not in the index """
+		with self.lock:
+			row = self.db.execute('SELECT qid FROM entities WHERE enwiki = ?', (title,)).fetchone()
+		if row is None:
+			return None
+		self.stats['titles'] += 1
+		return row[0]
+
+	def labels(self, qids='', lang='en'):
+		""" {qid: label} of the given entities found in the index; '' if they have no label in `lang` """
+		found = dict()
+		qids = list(qids)
+		with self.lock:
+			for i in range(0, len(qids), 500):
+				batch = qids[i:i + 500]
+				rows = self.db.execute('SELECT qid, lang, label FROM labels WHERE qid IN (%s) AND lang IN (?, \'\')' % ','.join('?' * len(batch)),
+										batch + [lang]).fetchall()
+				for qid, row_lang, label in rows:
+					if row_lang == lang or qid not in found:
+						found[qid] = label
+		self.stats['labels'] += len(found)
+		return found
+
+	def printStats(self):
+		print('Wikidata dump index %s (snapshot %s, %.1f days old): %d items, %d labels and %d titles read, %d items not in the index' % (
+			self.path, self.meta.get('snapshot', '?'), self.age(), self.stats['entities'], self.stats['labels'],
+			self.stats['titles'], self.stats['misses']))
+
+	def close(self):
+		with self.lock:
+			self.db.close()
+
+
+def build(dump_path='', path=DEFAULT_PATH, props=None, langs=None, progress=1000000):
+	"""
+	Builds the index of a dump: every item with an enwiki sitelink (its
+	labels, sitelink and the claims of `props`) and the labels of every
+	entity; written to a temporary file that replaces `path` when done
+
+	@param props: property IDs kept (default: scriptProperties())
+	@param langs: label languages kept (default: DEFAULT_LANGS)
+
+	"""
+	props = props or scriptProperties()
+	langs = langs or DEFAULT_LANGS
+	directory = os.path.dirname(path)
+	if directory:
+		os.makedirs(directory, exist_ok=True)
+	tmp_path = path + '.tmp'
+	if os.path.exists(tmp_path):
+		os.remove(tmp_path)
+
+	db = sqlite3.connect(tmp_path)
+	db.execute('PRAGMA journal_mode = OFF')
+	db.execute('PRAGMA synchronous = OFF')
+	db.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+	db.execute('CREATE TABLE entities (qid TEXT PRIMARY KEY, enwiki TEXT, data TEXT)')
+	# an entity without a label in the languages kept has a row with lang ''
+	db.execute('CREATE TABLE labels (qid TEXT, lang TEXT, label TEXT, PRIMARY KEY (qid, lang)) WITHOUT ROWID')
+
+	started = time.time()
+	snapshot = ''
+	count = 0
+	items = 0
+	entity_rows = list()
+	label_rows = list()
+
+	def flush():
+		db.executemany('INSERT OR REPLACE INTO entities VALUES (?, ?, ?)', entity_rows)
+		db.executemany('INSERT OR REPLACE INTO labels VALUES (?, ?, ?)', label_rows)
+		db.commit()
+		del entity_rows[:]
+		del label_rows[:]
+
+	with tracing.span('wikidata_dump.build', dump=dump_path):
+		for entity in iterEntities(dump_path):
+			count += 1
+			slim = slimEntity(entity=entity, props=props, langs=langs)
+			if slim['modified'] > snapshot:
+				snapshot = slim['modified']
+			labels = [(slim['id'], lang, label['value']) for lang, label in slim['labels'].items()]
+			label_rows.extend(labels or [(slim['id'], '', '')])
+			if slim['sitelinks']:
+				entity_rows.append((slim['id'], slim['sitelinks']['enwiki']['title'], json.dumps(slim, ensure_ascii=False, separators=(',', ':'))))
+				items += 1
+			if len(label_rows) >= BATCH:
+				flush()
+			if progress and count % progress == 0:
+				print('%d entities read, %d items indexed (%.0f entities/s)' % (count, items, count / (time.time() - started)))
+		flush()
+
+	db.execute('CREATE INDEX entities_enwiki ON entities (enwiki)')
+	db.executemany('INSERT INTO meta VALUES (?, ?)', [
+		('dump', os.path.abspath(dump_path)),
+		('snapshot', snapshot or '1970-01-01T00:00:00Z'),
+		('built', datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')),
+		('props', ','.join(props)),
+		('langs', ','.join(langs)),
+		('entities', str(count)),
+		('items', str(items)),
+	])
+	db.commit()
+	db.close()
+	os.replace(tmp_path, path)
+	print('Indexed %d of %d entities in %s (%.0f s), snapshot %s' % (items, count, path, time.time() - started, snapshot))
+	return items
+
+
+"""
+==========================
+Index shared by the run
+==========================
+"""
+index = None
+index_checked = False
+index_lock = threading.Lock()
+
+def getIndex():
+	"""
+	Returns the index named by $WMF_WIKIDATA_DUMP, or None if it is not set,
+	missing or older than $WMF_WIKIDATA_DUMP_MAX_AGE days (default:
+	DEFAULT_MAX_AGE) - reads then go to the API
+
+	"""
+	global index, index_checked
+	with index_lock:
+		if index_checked:
+			return index
+		index_checked = True
+		path = os.environ.get('WMF_WIKIDATA_DUMP', '')
+		if not path or path.lower() == 'off':
+			return None
+		if not os.path.exists(path):
+			print('Wikidata dump index %s not found. Reading from the API.' % (path))
+			return None
+		max_age = float(os.environ.get('WMF_WIKIDATA_DUMP_MAX_AGE', DEFAULT_MAX_AGE))
+		candidate = DumpIndex(path=path, max_age=max_age)
+		if not candidate.isFresh():
+			print('Wikidata dump index %s is %.1f days old (more than %g). Reading from the API.' % (path, candidate.age(), max_age))
+			candidate.close()
+			return None
+		index = candidate
+		atexit.register(index.printStats)
+		return index
+
+def entity(qid=''):
+	current = getIndex()
+	return current.entity(qid) if current else None
+
+def qidOf(title=''):
+	current = getIndex()
+	return current.qidOf(title) if current else None
+
+def labels(qids='', lang='en'):
+	current = getIndex()
+	return current.labels(qids, lang=lang) if current else dict()
+
+def main():
+	parser = argparse.ArgumentParser(description='Local index of a Wikidata JSON dump')
+	commands = parser.add_subparsers(dest='command')
+	build_parser = commands.add_parser('build', help='index a dump (latest-all.json.gz or .bz2)')
+	build_parser.add_argument('dump')
+	build_parser.add_argument('--index', default=DEFAULT_PATH, help='sqlite file of the index')
+	build_parser.add_argument('--langs', nargs='+', default=DEFAULT_LANGS, help='label languages kept')
+	build_parser.add_argument('--props', nargs='+', default=None, help='properties kept (default: those of the scripts and P31)')
+	info_parser = commands.add_parser('info', help='describe an index')
+	info_parser.add_argument('--index', default=DEFAULT_PATH)
+	args = parser.parse_args()
+
+	if args.command == 'build':
+		build(dump_path=args.dump, path=args.index, props=args.props, langs=args.langs)
+	elif args.command == 'info':
+		current = DumpIndex(path=args.index)
+		for key, value in sorted(current.meta.items()):
+			print('%-10s %s' % (key, value))
+		print('%-10s %.1f days' % ('age', current.age()))
+	else:
+		parser.print_help()
+		return 1
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
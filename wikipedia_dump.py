@@ -0,0 +1,367 @@
+# File name: wikipedia_dump.py
+# Article texts read from a local enwiki-YYYYMMDD-pages-articles-multistream.xml.bz2: the dump is a
+# series of independent bz2 streams of 100 pages each, and its -index.txt.bz2 gives the offset of
+# the stream holding every title, so a page is read by decompressing only its stream. Titles are
+# looked up in a sqlite index built once from the offsets file; recently decompressed streams are
+# kept, and batches of titles are read grouped by stream (see base_ops.preloadTexts)
+#
+# usage: python wikipedia_dump.py build enwiki-...-multistream.xml.bz2 [--offsets ...-index.txt.bz2] [--index PATH]
+#        python wikipedia_dump.py info [--index PATH]
+#        python wikipedia_dump.py show TITLE [--index PATH]
+# then:  WMF_WIKIPEDIA_DUMP=PATH python guerrilla_movements.py
+
+import argparse
+import atexit
+import bz2
+import collections
+import datetime
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+import label_resolver
+import tracing
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'outreachy-wmf', 'wikipedia_dump.sqlite')
+# days after the dump was taken during which its texts are used (see getDump); enwiki dumps are
+# taken twice a month
+DEFAULT_MAX_AGE = 35
+# decompressed streams kept in memory (100 pages each)
+DEFAULT_STREAMS = 32
+
+# rows written per transaction while building
+BATCH = 100000
+
+PageRecord = collections.namedtuple('PageRecord', ['title', 'ns', 'page_id', 'rev_id', 'parent_id', 'timestamp', 'redirect', 'text'])
+
+# fields of the part of a <page> before its <text> (the text is cut out with str.find: lazy regexes
+# over whole pages are several times slower)
+title_pattern = re.compile(r'<title>(.*?)</title>', re.S)
+ns_pattern = re.compile(r'<ns>(-?\d+)</ns>')
+id_pattern = re.compile(r'<id>(\d+)</id>')
+redirect_pattern = re.compile(r'<redirect title="([^"]*)"')
+revision_pattern = re.compile(r'<revision>\s*<id>(\d+)</id>(?:\s*<parentid>(\d+)</parentid>)?\s*<timestamp>([^<]*)</timestamp>')
+
+
+def unescape(text=''):
+	""" Text of an element of the dump: only &, <, >, " and ' are escaped (html.unescape is 20x slower) """
+	if '&' not in text:
+		return text
+	return text.replace('&lt;', '<').replace('&gt;', '>').replace('&quot;', '"').replace('&#039;', "'").replace('&amp;', '&')
+
+def parse_pages(xml=''):
+	""" PageRecords of the <page> elements of a piece of dump XML """
+	records = list()
+	position = xml.find('<page>')
+	while position >= 0:
+		end = xml.find('</page>', position)
+		if end < 0:
+			break
+		text_start = xml.find('<text', position, end)
+		head = xml[position:text_start if text_start >= 0 else end]
+		text = ''
+		if text_start >= 0:
+			tag_end = xml.find('>', text_start, end)
+			if tag_end >= 0 and xml[tag_end - 1] != '/':
+				text_end = xml.rfind('</text>', tag_end, end)
+				text = xml[tag_end + 1:text_end if text_end >= 0 else end]
+		position = xml.find('<page>', end)
+
+		title = title_pattern.search(head)
+		if not title:
+			continue
+		ns = ns_pattern.search(head)
+		page_id = id_pattern.search(head)
+		redirect = redirect_pattern.search(head)
+		revision = revision_pattern.search(head)
+		records.append(PageRecord(
+			title=unescape(title.group(1)),
+			ns=int(ns.group(1)) if ns else 0,
+			page_id=int(page_id.group(1)) if page_id else 0,
+			rev_id=int(revision.group(1)) if revision else 0,
+			parent_id=int(revision.group(2)) if revision and revision.group(2) else 0,
+			timestamp=revision.group(3) if revision else '',
+			redirect=unescape(redirect.group(1)) if redirect else '',
+			text=unescape(text)))
+	return records
+
+def snapshotOf(dump_path=''):
+	""" Date the dump was taken (from enwiki-YYYYMMDD-..., else the file's mtime) as '2024-01-31T00:00:00Z' """
+	m = re.search(r'-(\d{8})-', os.path.basename(dump_path))
+	if m:
+		return datetime.datetime.strptime(m.group(1), '%Y%m%d').strftime('%Y-%m-%dT%H:%M:%SZ')
+	return datetime.datetime.fromtimestamp(os.path.getmtime(dump_path), datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def offsetsPathOf(dump_path=''):
+	""" Default offsets file of a dump: enwiki-...-multistream-index.txt.bz2 next to it """
+	if dump_path.endswith('.xml.bz2'):
+		return dump_path[:-len('.xml.bz2')] + '-index.txt.bz2'
+	return dump_path + '-index.txt.bz2'
+
+
+class MultistreamDump:
+	"""
+	Random access to the pages of a multistream dump, through an index built
+	by build()
+
+	@param path: sqlite file of the index
+	@param max_age: days after the dump snapshot during which isFresh()
+				is True
+	@param max_streams: decompressed streams kept (LRU)
+
+	"""
+
+	def __init__(self, path=DEFAULT_PATH, max_age=DEFAULT_MAX_AGE, max_streams=DEFAULT_STREAMS):
+		self.path = path
+		self.max_age = max_age
+		self.db = sqlite3.connect('file:%s?mode=ro' % path, uri=True, check_same_thread=False)
+		self.lock = threading.Lock()
+		self.meta = dict(self.db.execute('SELECT key, value FROM meta').fetchall())
+		self.dump_path = self.meta.get('dump', '')
+		self.dump = open(self.dump_path, 'rb')
+		self.dump_lock = threading.Lock()
+		# {offset: {title: PageRecord}}
+		self.streams = label_resolver.LRUCache(maxsize=max_streams)
+		self.stats = {'pages': 0, 'missing': 0, 'streams': 0, 'cached': 0, 'bytes': 0}
+
+	def snapshot(self):
+		""" time.time() of the day the dump was taken """
+		return datetime.datetime.strptime(self.meta.get('snapshot', '1970-01-01T00:00:00Z'), '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=datetime.timezone.utc).timestamp()
+
+	def age(self):
+		""" Days since the dump snapshot """
+		return (time.time() - self.snapshot()) / 86400.0
+
+	def isFresh(self):
+		return self.age() <= self.max_age
+
+	def offsets(self, titles=''):
+		""" {title: offset of its stream} of the given titles found in the index """
+		found = dict()
+		titles = list(titles)
+		with self.lock:
+			for i in range(0, len(titles), 500):
+				batch = titles[i:i + 500]
+				rows = self.db.execute('SELECT title, offset FROM titles WHERE title IN (%s)' % ','.join('?' * len(batch)), batch).fetchall()
+				found.update(rows)
+		return found
+
+	def stream(self, offset=0):
+		""" {title: PageRecord} of the pages of the stream starting at `offset` """
+		pages = self.streams.get(offset)
+		if pages is not None:
+			self.stats['cached'] += 1
+			return pages
+		with self.lock:
+			row = self.db.execute('SELECT length FROM streams WHERE offset = ?', (offset,)).fetchone()
+		length = row[0] if row else -1
+		with self.dump_lock:
+			self.dump.seek(offset)
+			data = self.dump.read(length)
+		with tracing.span('wikipedia_dump.stream', offset=offset, size=len(data)):
+			xml = bz2.BZ2Decompressor().decompress(data).decode('utf-8')
+			pages = dict((record.title, record) for record in parse_pages(xml))
+		self.stats['streams'] += 1
+		self.stats['bytes'] += len(data)
+		self.streams.put(offset, pages)
+		return pages
+
+	def records(self, titles=''):
+		"""
+		PageRecords of the given titles, decompressing each stream once: the
+		titles are read grouped by stream, in the order of the file
+
+		@return value: generator of (title, PageRecord) pairs; titles not in
+					the dump are left out
+
+		"""
+		by_stream = collections.defaultdict(list)
+		titles = list(collections.OrderedDict.fromkeys(titles))
+		offsets = self.offsets(titles)
+		self.stats['missing'] += len(titles) - len(offsets)
+		for title, offset in offsets.items():
+			by_stream[offset].append(title)
+		for offset in sorted(by_stream):
+			pages = self.stream(offset)
+			for title in by_stream[offset]:
+				if title in pages:
+					self.stats['pages'] += 1
+					yield title, pages[title]
+
+	def record(self, title=''):
+		""" PageRecord of a title, None if it is not in the dump """
+		for title, record in self.records([title]):
+			return record
+		return None
+
+	def printStats(self):
+		print('Wikipedia dump %s (snapshot %s, %.1f days old): %d pages read from %d streams (%.1f MB), %d stream cache hits, %d titles not in the dump' % (
+			self.dump_path, self.meta.get('snapshot', '?'), self.age(), self.stats['pages'], self.stats['streams'],
+			self.stats['bytes'] / 1048576.0, self.stats['cached'], self.stats['missing']))
+
+	def close(self):
+		with self.lock:
+			self.db.close()
+		with self.dump_lock:
+			self.dump.close()
+
+
+def build(dump_path='', path=DEFAULT_PATH, offsets_path='', progress=1000000):
+	"""
+	Builds the title index of a multistream dump from its offsets file
+	(lines of offset:page_id:title): the stream of every title and the
+	length of every stream; written to a temporary file that replaces
+	`path` when done
+
+	@param offsets_path: default: offsetsPathOf(dump_path)
+
+	"""
+	offsets_path = offsets_path or offsetsPathOf(dump_path)
+	directory = os.path.dirname(path)
+	if directory:
+		os.makedirs(directory, exist_ok=True)
+	tmp_path = path + '.tmp'
+	if os.path.exists(tmp_path):
+		os.remove(tmp_path)
+
+	db = sqlite3.connect(tmp_path)
+	db.execute('PRAGMA journal_mode = OFF')
+	db.execute('PRAGMA synchronous = OFF')
+	db.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+	db.execute('CREATE TABLE titles (title TEXT PRIMARY KEY, offset INTEGER) WITHOUT ROWID')
+	db.execute('CREATE TABLE streams (offset INTEGER PRIMARY KEY, length INTEGER)')
+
+	started = time.time()
+	count = 0
+	offsets = list()
+	rows = list()
+
+	def flush():
+		db.executemany('INSERT OR REPLACE INTO titles VALUES (?, ?)', rows)
+		db.commit()
+		del rows[:]
+
+	opener = bz2.open if offsets_path.endswith('.bz2') else open
+	with tracing.span('wikipedia_dump.build', dump=dump_path):
+		with opener(offsets_path, 'rt', encoding='utf-8') as f:
+			for line in f:
+				line = line.rstrip('\n')
+				if not line:
+					continue
+				# titles may contain ':'
+				offset, page_id, title = line.split(':', 2)
+				offset = int(offset)
+				if not offsets or offsets[-1] != offset:
+					offsets.append(offset)
+				rows.append((title, offset))
+				count += 1
+				if len(rows) >= BATCH:
+					flush()
+				if progress and count % progress == 0:
+					print('%d titles read (%.0f titles/s)' % (count, count / (time.time() - started)))
+			flush()
+
+	# a stream ends where the next one starts, the last one at the end of the file
+	ends = offsets[1:] + [os.path.getsize(dump_path)]
+	db.executemany('INSERT INTO streams VALUES (?, ?)', [(offset, end - offset) for offset, end in zip(offsets, ends)])
+	db.executemany('INSERT INTO meta VALUES (?, ?)', [
+		('dump', os.path.abspath(dump_path)),
+		('offsets', os.path.abspath(offsets_path)),
+		('snapshot', snapshotOf(dump_path)),
+		('built', datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')),
+		('titles', str(count)),
+		('streams', str(len(offsets))),
+	])
+	db.commit()
+	db.close()
+	os.replace(tmp_path, path)
+	print('Indexed %d titles in %d streams in %s (%.0f s)' % (count, len(offsets), path, time.time() - started))
+	return count
+
+
+"""
+==========================
+Dump shared by the run
+==========================
+"""
+dump = None
+dump_checked = False
+dump_lock = threading.Lock()
+
+def getDump():
+	"""
+	Returns the dump whose index is named by $WMF_WIKIPEDIA_DUMP, or None if
+	it is not set, missing or older than $WMF_WIKIPEDIA_DUMP_MAX_AGE days
+	(default: DEFAULT_MAX_AGE) - texts then come from the API.
+	$WMF_WIKIPEDIA_DUMP_STREAMS sets the streams kept in memory
+
+	"""
+	global dump, dump_checked
+	with dump_lock:
+		if dump_checked:
+			return dump
+		dump_checked = True
+		path = os.environ.get('WMF_WIKIPEDIA_DUMP', '')
+		if not path or path.lower() == 'off':
+			return None
+		if not os.path.exists(path):
+			print('Wikipedia dump index %s not found. Reading from the API.' % (path))
+			return None
+		max_age = float(os.environ.get('WMF_WIKIPEDIA_DUMP_MAX_AGE', DEFAULT_MAX_AGE))
+		max_streams = int(os.environ.get('WMF_WIKIPEDIA_DUMP_STREAMS', DEFAULT_STREAMS))
+		try:
+			candidate = MultistreamDump(path=path, max_age=max_age, max_streams=max_streams)
+		except Exception as e:
+			print('Error opening the Wikipedia dump of %s: %s. Reading from the API.' % (path, e))
+			return None
+		if not candidate.isFresh():
+			print('Wikipedia dump %s is %.1f days old (more than %g). Reading from the API.' % (candidate.dump_path, candidate.age(), max_age))
+			candidate.close()
+			return None
+		dump = candidate
+		atexit.register(dump.printStats)
+		return dump
+
+def records(titles=''):
+	current = getDump()
+	return current.records(titles) if current else iter(())
+
+def main():
+	parser = argparse.ArgumentParser(description='Random access to a multistream Wikipedia dump')
+	commands = parser.add_subparsers(dest='command')
+	build_parser = commands.add_parser('build', help='index the titles of a dump (pages-articles-multistream.xml.bz2)')
+	build_parser.add_argument('dump')
+	build_parser.add_argument('--offsets', default='', help='offsets file (default: the -index.txt.bz2 next to the dump)')
+	build_parser.add_argument('--index', default=DEFAULT_PATH, help='sqlite file of the index')
+	info_parser = commands.add_parser('info', help='describe an index')
+	info_parser.add_argument('--index', default=DEFAULT_PATH)
+	show_parser = commands.add_parser('show', help='print the text of an article')
+	show_parser.add_argument('title')
+	show_parser.add_argument('--index', default=DEFAULT_PATH)
+	args = parser.parse_args()
+
+	if args.command == 'build':
+		build(dump_path=args.dump, path=args.index, offsets_path=args.offsets)
+	elif args.command == 'info':
+		current = MultistreamDump(path=args.index)
+		for key, value in sorted(current.meta.items()):
+			print('%-10s %s' % (key, value))
+		print('%-10s %.1f days' % ('age', current.age()))
+	elif args.command == 'show':
+		record = MultistreamDump(path=args.index).record(args.title)
+		if record is None:
+			print('%s is not in the dump.' % (args.title))
+			return 1
+		if record.redirect:
+			print('(redirect to %s)' % (record.redirect))
+		print(record.text)
+	else:
+		parser.print_help()
+		return 1
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
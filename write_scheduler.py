@@ -0,0 +1,344 @@
+# File name: write_scheduler.py
+# Shared pacing of Wikidata edits: token bucket with a configurable edits/minute ceiling,
+# slowdown on maxlag/Retry-After and a queue of edits deferred until the end of the run
+
+import atexit
+import contextlib
+import os
+import random
+import sys
+import threading
+import time
+
+DEFAULT_EDITS_PER_MINUTE = 30
+MIN_EDITS_PER_MINUTE = 1
+
+# API error codes asking the client to back off
+THROTTLE_CODES = ['maxlag', 'ratelimited', 'readonly', 'editconflict-throttle']
+# pywikibot exception raised once its own maxlag retries are used up
+THROTTLE_ERRORS = ['MaxlagTimeoutError']
+# errors after which the edit may have been saved anyway (timeouts, 5xx, and their subclasses):
+# only retried or deferred once the caller's check found the edit missing
+UNCERTAIN_ERRORS = ['TimeoutError', 'ApiTimeoutError', 'ServerError']
+
+# returned by submit() for an edit queued for later
+DEFERRED = 'deferred'
+
+# retries pywikibot makes itself (maxlag, timeouts, 5xx) while an edit runs: the scheduler backs off instead
+WRITE_MAX_RETRIES = 1
+
+
+def throttleDelay(error=None):
+	"""
+	Returns the delay (seconds) asked for by a throttling error, 0 if it
+	names none, or None if the error is not a throttling error
+
+	"""
+	code = getattr(error, 'code', '')
+	if code not in THROTTLE_CODES and type(error).__name__ not in THROTTLE_ERRORS:
+		return None
+
+	other = getattr(error, 'other', None) or dict()
+	for key in ['retry-after', 'retry_after', 'lag']:
+		try:
+			return float(other[key])
+		except:
+			pass
+	try:
+		return float(getattr(error, 'retry_after'))
+	except:
+		return 0
+
+def isUncertain(error=None):
+	""" True if the edit that raised `error` may have been saved """
+	if throttleDelay(error) is not None:
+		return False
+	return any(cls.__name__ in UNCERTAIN_ERRORS for cls in type(error).__mro__)
+
+
+def pacePywikibot(edits_per_minute=DEFAULT_EDITS_PER_MINUTE):
+	"""
+	Sets pywikibot's own write delay (config.put_throttle, 10 s by default:
+	about 6 edits/min) to the scheduler's ceiling, for the sites created
+	already and the ones created later, so that the token bucket paces the
+	edits and not pywikibot
+
+	"""
+	pywikibot = sys.modules.get('pywikibot')
+	if pywikibot is None:
+		# not loaded: nothing edits through it
+		return
+	delay = 60.0 / edits_per_minute
+	pywikibot.config.put_throttle = delay
+	for site in list(pywikibot._sites.values()):
+		site.throttle.writedelay = delay
+
+retries_lock = threading.Lock()
+# edits running with fewer pywikibot retries, and the setting they replaced
+retries_users = 0
+saved_max_retries = None
+
+@contextlib.contextmanager
+def fewerRetries(max_retries=WRITE_MAX_RETRIES):
+	"""
+	Lowers pywikibot's config.max_retries inside the block, so a maxlag or
+	server error reaches the scheduler after `max_retries` tries instead of
+	after pywikibot has slept through its own 15; requests of other threads
+	made meanwhile are affected too
+
+	"""
+	global retries_users, saved_max_retries
+	config = getattr(sys.modules.get('pywikibot'), 'config', None)
+	if config is None:
+		yield
+		return
+	with retries_lock:
+		if retries_users == 0:
+			saved_max_retries = config.max_retries
+			config.max_retries = min(max_retries, saved_max_retries)
+		retries_users += 1
+	try:
+		yield
+	finally:
+		with retries_lock:
+			retries_users -= 1
+			if retries_users == 0:
+				config.max_retries = saved_max_retries
+
+
+class TokenBucket:
+	"""
+	Hands out `rate` tokens per minute, at most `capacity` at once
+
+	Callers reserve their token in order, so concurrent writers are spaced
+	evenly instead of waking up together.
+
+	"""
+
+	def __init__(self, rate=DEFAULT_EDITS_PER_MINUTE, capacity=1):
+		self.rate = float(rate)
+		self.capacity = float(capacity)
+		self.tokens = float(capacity)
+		self.updated = time.monotonic()
+		self.lock = threading.Lock()
+
+	def reserve(self):
+		""" Takes a token and returns how long (seconds) to wait before using it """
+		with self.lock:
+			now = time.monotonic()
+			self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate / 60.0)
+			self.updated = now
+			self.tokens -= 1
+			if self.tokens >= 0:
+				return 0
+			return -self.tokens * 60.0 / self.rate
+
+	def setRate(self, rate):
+		with self.lock:
+			now = time.monotonic()
+			self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate / 60.0)
+			self.updated = now
+			self.rate = float(rate)
+
+
+class WriteScheduler:
+	"""
+	Paces edits below a ceiling and backs off when the server asks for it
+
+	The rate is halved on every maxlag/rate-limit error (and writes pause for
+	the delay the server asked for), then creeps back up to the ceiling on
+	successful edits. An edit still throttled after `attempts` tries is
+	queued and replayed by flush().
+
+	A timeout or server error does not say whether the edit was saved: the
+	edit is only tried again if its `verify` function (reloading the item)
+	finds it missing, and the error is raised if it has none.
+
+	@param edits_per_minute: ceiling of the edit rate
+	@param burst: edits allowed back to back after an idle period
+	@param attempts: tries of an edit before it is deferred
+	@param backoff: pause (seconds) after a throttling error naming no delay,
+				doubled on every further try
+	@param max_backoff: upper limit of a single pause (seconds)
+
+	"""
+
+	def __init__(self, edits_per_minute=DEFAULT_EDITS_PER_MINUTE, burst=1, attempts=3, backoff=5, max_backoff=300):
+		self.ceiling = float(edits_per_minute)
+		self.bucket = TokenBucket(rate=edits_per_minute, capacity=burst)
+		self.attempts = attempts
+		self.backoff = backoff
+		self.max_backoff = max_backoff
+		self.lock = threading.Lock()
+		self.paused_until = 0
+		self.deferred = list()
+		self.stats = {'edits': 0, 'throttled': 0, 'deferred': 0, 'replayed': 0, 'lost': 0, 'waited': 0.0}
+
+	def wait(self):
+		delay = self.bucket.reserve()
+		with self.lock:
+			delay = max(delay, self.paused_until - time.monotonic())
+		if delay > 0:
+			self.stats['waited'] += delay
+			time.sleep(delay)
+
+	def slowDown(self, delay=0, attempt=0):
+		""" Halves the rate and pauses every writer """
+		if not delay:
+			delay = min(self.backoff * (2 ** attempt), self.max_backoff)
+			delay = random.uniform(delay / 2.0, delay)
+		delay = min(delay, self.max_backoff)
+		with self.lock:
+			self.paused_until = max(self.paused_until, time.monotonic() + delay)
+			rate = max(MIN_EDITS_PER_MINUTE, self.bucket.rate / 2.0)
+		self.bucket.setRate(rate)
+		print('Server asked to slow down. Pausing edits for %.1f seconds (%.1f edits/min)...' % (delay, rate))
+
+	def speedUp(self):
+		""" Additive increase back towards the ceiling after a successful edit """
+		if self.bucket.rate < self.ceiling:
+			self.bucket.setRate(min(self.ceiling, self.bucket.rate + self.ceiling / 10.0))
+
+	def wasSaved(self, error=None, verify=None, description=''):
+		"""
+		Asks `verify` whether an edit that raised a timeout or server error
+		was saved; None if it cannot tell (no verify, or verify failed)
+
+		"""
+		if verify is None:
+			return None
+		try:
+			saved = bool(verify())
+		except Exception as verify_error:
+			print('Could not check whether the edit was saved: %s (%s)' % (description, verify_error))
+			return None
+		if saved:
+			print('Edit saved despite the error (%s): %s' % (error, description))
+		return saved
+
+	def submit(self, edit='', description='', verify=None):
+		"""
+		Runs an edit when the rate allows it
+
+		@param edit: function making the edit
+		@param description: printed if the edit is deferred
+		@param verify: function reloading the item, True if the edit is on
+					it - called after a timeout or server error
+		@return value: the edit's return value, None if it was saved despite
+					an error, or DEFERRED
+		Errors other than throttling errors are raised to the caller.
+
+		"""
+		for attempt in range(self.attempts):
+			self.wait()
+			try:
+				with fewerRetries():
+					result = edit()
+			except Exception as error:
+				if isUncertain(error):
+					saved = self.wasSaved(error=error, verify=verify, description=description)
+					if saved is None:
+						raise
+					if saved:
+						self.stats['edits'] += 1
+						return None
+					delay = 0
+				else:
+					delay = throttleDelay(error)
+					if delay is None:
+						raise
+				self.stats['throttled'] += 1
+				self.slowDown(delay=delay, attempt=attempt)
+				continue
+			self.stats['edits'] += 1
+			self.speedUp()
+			return result
+
+		with self.lock:
+			self.deferred.append((edit, description, verify))
+		self.stats['deferred'] += 1
+		print('Edit deferred until the end of the run: %s' % (description))
+		return DEFERRED
+
+	def flush(self):
+		""" Replays the deferred edits; edits still failing are reported as lost """
+		with self.lock:
+			edits = self.deferred
+			self.deferred = list()
+		if not edits:
+			return 0
+
+		print('Replaying %d deferred edit(s)...' % len(edits))
+		lost = 0
+		for edit, description, verify in edits:
+			for attempt in range(self.attempts):
+				self.wait()
+				try:
+					with fewerRetries():
+						edit()
+				except Exception as error:
+					delay = throttleDelay(error)
+					if isUncertain(error):
+						saved = self.wasSaved(error=error, verify=verify, description=description)
+						if saved:
+							self.stats['replayed'] += 1
+							break
+						delay = None if saved is None else 0
+					if delay is not None and attempt + 1 < self.attempts:
+						self.stats['throttled'] += 1
+						self.slowDown(delay=delay, attempt=attempt)
+						continue
+					print('Edit lost: %s (%s)' % (description, error))
+					lost += 1
+					break
+				self.stats['replayed'] += 1
+				break
+		self.stats['lost'] += lost
+		return lost
+
+	def printStats(self):
+		print('Write scheduler: %d edits, %d throttled, %d deferred (%d replayed, %d lost), %.1f s waited, %.1f edits/min' % (
+			self.stats['edits'], self.stats['throttled'], self.stats['deferred'], self.stats['replayed'],
+			self.stats['lost'], self.stats['waited'], self.bucket.rate))
+
+
+default_scheduler = None
+scheduler_lock = threading.Lock()
+
+def getScheduler():
+	"""
+	Returns the scheduler shared by every WdPage; the ceiling is taken from
+	$WMF_EDITS_PER_MINUTE (default: DEFAULT_EDITS_PER_MINUTE)
+
+	"""
+	global default_scheduler
+	with scheduler_lock:
+		if default_scheduler is None:
+			rate = float(os.environ.get('WMF_EDITS_PER_MINUTE', DEFAULT_EDITS_PER_MINUTE))
+			default_scheduler = WriteScheduler(edits_per_minute=rate)
+			pacePywikibot(edits_per_minute=rate)
+			# deferred edits are not lost if a script never calls flush()
+			atexit.register(flush)
+		return default_scheduler
+
+def configure(**kwargs):
+	"""
+	Replaces the shared scheduler with one built from the given settings
+	(see WriteScheduler), replaying the old one's deferred edits first
+
+	"""
+	global default_scheduler
+	old = getScheduler()
+	old.flush()
+	with scheduler_lock:
+		default_scheduler = WriteScheduler(**kwargs)
+		pacePywikibot(edits_per_minute=default_scheduler.ceiling)
+		return default_scheduler
+
+def submit(edit='', description='', verify=None):
+	return getScheduler().submit(edit=edit, description=description, verify=verify)
+
+def flush():
+	if default_scheduler is not None:
+		return default_scheduler.flush()
+	return 0